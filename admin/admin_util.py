@@ -1,68 +1,182 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, delete, func, select, union
+
 from models import Recipe, ShoppingList, Rating, PantryItem, WastedFood, Ingredient, ShoppingItem, Barcode, \
-    QuantifiedFoodItem, User
-from app import db
+    QuantifiedFoodItem, User, CompatibleDiet, InUseRecipe, rating_aggregate_update
+from app import db, cache
+
+# Maximum number of ids bound into a single IN (...) list, below SQLite's bound parameter limit
+ID_CHUNK_SIZE = 500
+
+_jobs = {}          # job id -> progress dict, see start_delete_user_job()
+_jobs_lock = threading.Lock()
 
 
-def delete_user_related_data(user_id):
+def delete_user_related_data(user_id, progress=None):
     """
        Delete all data related to a specific user from the database.
 
        This function will delete the user's recipes, ratings, shopping lists, pantry items, wasted food entries,
        ingredients, shopping items, barcodes, quantified food items, and finally the user itself.
+       Each kind of row is removed with one DELETE ... WHERE ... IN (subquery) statement, all in one transaction.
+       If given, progress(step, total_steps, description) is called before each step.
     """
 
-    # Query all recipes, ratings, shopping lists, pantry items, and wasted food entries for the user
-    recipes = Recipe.query.filter_by(user_id=user_id).all()
-    ratings = Rating.query.filter_by(user_id=user_id).all()
-    shopping_lists = ShoppingList.query.filter_by(user_id=user_id).all()
-    pantry_items = PantryItem.query.filter_by(user_id=user_id).all()
-    wasted_foods = WastedFood.query.filter_by(user_id=user_id).all()
-
-    # Set to track quantified food items to be deleted
-    qfood_items_to_delete = set()
-
-    # Delete all ingredients associated with the user's recipes and the recipes themselves
-    for recipe in recipes:
-        ingredients = Ingredient.query.filter_by(recipe_id=recipe.id).all()
-        for ingredient in ingredients:
-            qfood_items_to_delete.add(ingredient.qfood_id)
-            db.session.delete(ingredient)
-        db.session.delete(recipe)
-
-    # Delete all ratings associated with the user
-    for rating in ratings:
-        db.session.delete(rating)
-
-    # Delete all items in the user's shopping lists and the shopping lists themselves
-    for shopping_list in shopping_lists:
-        shopping_items = ShoppingItem.query.filter_by(list_id=shopping_list.id).all()
-        for shopping_item in shopping_items:
-            qfood_items_to_delete.add(shopping_item.qfood_id)
-            db.session.delete(shopping_item)
-        db.session.delete(shopping_list)
-
-    # Delete all pantry items associated with the user
-    for pantry_item in pantry_items:
-        qfood_items_to_delete.add(pantry_item.qfood_id)
-        db.session.delete(pantry_item)
-
-    # Delete all wasted food entries associated with the user
-    for wasted_food in wasted_foods:
-        qfood_items_to_delete.add(wasted_food.qfood_id)
-        db.session.delete(wasted_food)
-
-    # Delete all quantified food items and their associated barcodes
-    for qfood_id in qfood_items_to_delete:
-        barcodes = Barcode.query.filter_by(qfood_id=qfood_id).all()
-        for barcode in barcodes:
-            db.session.delete(barcode)
-        qfood_item = QuantifiedFoodItem.query.get(qfood_id)
-        if qfood_item:
-            db.session.delete(qfood_item)
-
-    # Finally, deletes the user
-    user = User.query.get(user_id)
-    if user:
-        db.session.delete(user)
-
-    db.session.commit()
\ No newline at end of file
+    recipe_ids = select(Recipe.id).where(Recipe.user_id == user_id)
+    list_ids = select(ShoppingList.id).where(ShoppingList.user_id == user_id)
+
+    # Quantified food items used by the user's ingredients, shopping items, pantry items and wasted food entries.
+    # They are read once up front, as the rows referencing them are deleted before they are.
+    qfood_ids = db.session.scalars(union(
+        select(Ingredient.qfood_id).where(Ingredient.recipe_id.in_(recipe_ids)),
+        select(ShoppingItem.qfood_id).where(ShoppingItem.list_id.in_(list_ids)),
+        select(PantryItem.qfood_id).where(PantryItem.user_id == user_id),
+        select(WastedFood.qfood_id).where(WastedFood.user_id == user_id),
+    ), execution_options={'include_deleted': True}).all()
+    qfood_ids = sorted({int(qfood_id) for qfood_id in qfood_ids if qfood_id is not None})
+    chunks = [qfood_ids[i:i + ID_CHUNK_SIZE] for i in range(0, len(qfood_ids), ID_CHUNK_SIZE)]
+
+    # Children are deleted before the rows they reference
+    steps = [
+        ('ingredients', delete(Ingredient).where(Ingredient.recipe_id.in_(recipe_ids))),
+        # Other users' recipes the user rated lose the user's ratings from their totals
+        ('recipe ratings', rating_aggregate_update(select(Rating.recipe_id).where(Rating.user_id == user_id),
+                                                   excluding_user_id=user_id)),
+        ('ratings', delete(Rating).where((Rating.user_id == user_id) | Rating.recipe_id.in_(recipe_ids))),
+        ('recipe diets', delete(CompatibleDiet).where(CompatibleDiet.recipe_id.in_(recipe_ids))),
+        ('recipes in use', delete(InUseRecipe).where((InUseRecipe.user_id == user_id) |
+                                                     InUseRecipe.recipe_id.in_(recipe_ids))),
+        ('recipes', delete(Recipe).where(Recipe.user_id == user_id)),
+        ('shopping items', delete(ShoppingItem).where(ShoppingItem.list_id.in_(list_ids))),
+        ('shopping lists', delete(ShoppingList).where(ShoppingList.user_id == user_id)),
+        ('pantry items', delete(PantryItem).where(PantryItem.user_id == user_id)),
+        ('wasted food', delete(WastedFood).where(WastedFood.user_id == user_id)),
+    ]
+    steps += [('barcodes', delete(Barcode).where(Barcode.qfood_id.in_(chunk))) for chunk in chunks]
+    steps += [('quantified food items', delete(QuantifiedFoodItem).where(QuantifiedFoodItem.id.in_(chunk)))
+              for chunk in chunks]
+    steps.append(('user', delete(User).where(User.id == user_id)))
+
+    try:
+        for step, (description, statement) in enumerate(steps):
+            if progress:
+                progress(step, len(steps), description)
+            db.session.execute(statement, execution_options={'synchronize_session': False})
+        # Bulk deletes skip mapper events, so the user cache has to be told about the deleted user
+        db.session.info.setdefault('changed_user_ids', set()).add(user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if progress:
+        progress(len(steps), len(steps), 'done')
+
+
+# Method to delete a user in a background thread so the admin's request returns straight away.
+# Returns a job id for get_delete_user_job().
+def start_delete_user_job(user_id) -> str:
+    app = current_app._get_current_object()
+    job_id = uuid.uuid4().hex
+    job = {'user_id': user_id, 'status': 'running', 'step': 0, 'total_steps': None, 'description': 'starting',
+           'error': None}
+    with _jobs_lock:
+        _jobs[job_id] = job
+
+    def report(step, total_steps, description):
+        with _jobs_lock:
+            job.update(step=step, total_steps=total_steps, description=description)
+
+    def run():
+        with app.app_context():
+            try:
+                delete_user_related_data(user_id, progress=report)
+                status, error = 'finished', None
+            except Exception as e:
+                app.logger.error('Background deletion of user %s failed: %s', user_id, e)
+                status, error = 'failed', str(e)
+            finally:
+                db.session.remove()
+        with _jobs_lock:
+            job.update(status=status, error=error)
+
+    threading.Thread(target=run, name=f'delete-user-{user_id}', daemon=True).start()
+    return job_id
+
+
+# Method to get a copy of a background deletion job's progress, or None if the job id is unknown.
+def get_delete_user_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+# Columns the admin user views can be sorted by
+USER_SORT_COLUMNS = {
+    'id': User.id,
+    'email': User.email,
+    'registered_on': User.registered_on,
+    'current_login': User.current_login,
+    'total_logins': User.total_logins,
+}
+MAX_USERS_PER_PAGE = 200
+
+
+# Method to get one page of users, sorted by one of USER_SORT_COLUMNS (ties broken by id).
+# Returns a flask_sqlalchemy Pagination object.
+def get_users_page(page=1, per_page=50, sort='id', direction='asc', role=None):
+    column = USER_SORT_COLUMNS.get(sort, User.id)
+    statement = select(User).order_by(column.desc() if direction == 'desc' else column.asc(), User.id)
+    if role:
+        statement = statement.where(User.role == role)
+    return db.paginate(statement, page=page, per_page=per_page, max_per_page=MAX_USERS_PER_PAGE, error_out=False)
+
+
+def _format_datetime(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else 'N/A'
+
+
+# Method to get the activity details shown in the admin views for a user
+def user_activity(user) -> dict:
+    return {
+        'id': user.id,
+        'email': user.email,
+        'role': user.role,
+        'current_login_ip': user.current_login_ip,
+        'last_login_ip': user.last_login_ip,
+        'total_logins': user.total_logins,
+        'registration_date': _format_datetime(user.registered_on),
+        'last_login': _format_datetime(user.last_login),
+        'current_login': _format_datetime(user.current_login),
+    }
+
+
+# Method to get aggregate user statistics, computed with COUNT / SUM / GROUP BY in the database.
+# The result is cached (cache.py) for ADMIN_STATS_TTL seconds, so a busy admin page doesn't rescan the users table.
+@cache.memoize(ttl='ADMIN_STATS_TTL')
+def get_user_stats() -> dict:
+    now = datetime.now()
+    total, active_7_days, active_30_days, registered_7_days, total_logins = db.session.execute(select(
+        func.count(User.id),
+        func.count(case((User.current_login >= now - timedelta(days=7), 1))),
+        func.count(case((User.current_login >= now - timedelta(days=30), 1))),
+        func.count(case((User.registered_on >= now - timedelta(days=7), 1))),
+        func.coalesce(func.sum(User.total_logins), 0),
+    )).one()
+    by_role = db.session.execute(select(User.role, func.count(User.id)).group_by(User.role)).all()
+
+    return {
+        'total_users': total,
+        'active_last_7_days': active_7_days,
+        'active_last_30_days': active_30_days,
+        'registered_last_7_days': registered_7_days,
+        'total_logins': total_logins,
+        'users_by_role': {role: count for role, count in by_role},
+    }
+
+
+def clear_user_stats() -> None:
+    get_user_stats.invalidate()
@@ -0,0 +1,161 @@
+# Test file for admin_util.py
+
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from flask import current_app
+from sqlalchemy import event
+
+import models
+from app import db
+from admin import admin_util as au
+from testing_util import DatabaseTestCase
+
+
+class TestDeleteUser(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        with patch('models.fetch_wikipedia_description', return_value='Food'):
+            food = models.FoodItem(food_name='Butter')
+        db.session.add(food)
+        db.session.commit()
+        self.food_id = food.id
+        self.user_id = self.add_user_data(2)
+        self.other_user_id = self.add_user_data(3)
+
+    # Gives a user a recipe with ingredients, a shopping list, pantry items with barcodes and wasted food
+    def add_user_data(self, user_id) -> int:
+        recipe = models.Recipe(user_id=user_id, recipe_name='Toast', cooking_method='Toast it', serves=1,
+                               calories=100)
+        shopping_list = models.ShoppingList(user_id=user_id, list_name='Weekly')
+        db.session.add_all([recipe, shopping_list])
+        db.session.flush()
+        for _ in range(3):
+            db.session.add(models.Ingredient(recipe_id=recipe.id, qfood_id=self.new_qfood_id()))
+            db.session.add(models.ShoppingItem(list_id=shopping_list.id, qfood_id=self.new_qfood_id()))
+            qfood_id = self.new_qfood_id()
+            db.session.add(models.PantryItem(user_id=user_id, qfood_id=qfood_id, expiry='2025-01-01', calories=10))
+            db.session.add(models.Barcode(qfood_id=qfood_id, barcode='5012345678900'))
+            db.session.add(models.WastedFood(user_id=user_id, qfood_id=self.new_qfood_id(), expired='2024-01-01'))
+        db.session.add(models.Rating(user_id=user_id, recipe_id=recipe.id, rating=4))
+        db.session.add(models.InUseRecipe(user_id=user_id, recipe_id=recipe.id))
+        db.session.commit()
+        return user_id
+
+    def new_qfood_id(self) -> int:
+        return models.create_and_get_qfid(self.food_id, 100, 'g')
+
+    def remaining(self, user_id):
+        return {
+            'recipes': models.Recipe.query.filter_by(user_id=user_id).count(),
+            'lists': models.ShoppingList.query.filter_by(user_id=user_id).count(),
+            'pantry': models.PantryItem.query.filter_by(user_id=user_id).count(),
+            'wasted': models.WastedFood.query.filter_by(user_id=user_id).count(),
+            'ratings': models.Rating.query.filter_by(user_id=user_id).count(),
+            'user': models.User.query.filter_by(id=user_id).count(),
+        }
+
+    def test_deletes_user_and_related_data(self) -> None:
+        # A rating by another user on the deleted user's recipe goes with the recipe
+        recipe_id = models.Recipe.query.filter_by(user_id=self.user_id).first().id
+        db.session.add(models.Rating(user_id=self.other_user_id, recipe_id=recipe_id, rating=5))
+        db.session.commit()
+
+        au.delete_user_related_data(self.user_id)
+
+        self.assertEqual(set(self.remaining(self.user_id).values()), {0})
+        self.assertEqual(models.Ingredient.query.count(), 3)
+        self.assertEqual(models.ShoppingItem.query.count(), 3)
+        self.assertEqual(models.Barcode.query.count(), 3)
+        self.assertEqual(models.QuantifiedFoodItem.query.count(), 12)
+        self.assertEqual(models.Rating.query.count(), 1)
+        # The other user's data is untouched
+        self.assertEqual(self.remaining(self.other_user_id),
+                         {'recipes': 1, 'lists': 1, 'pantry': 3, 'wasted': 3, 'ratings': 1, 'user': 1})
+
+    def test_statement_count_does_not_grow_with_data(self) -> None:
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            if not statement.startswith(('SAVEPOINT', 'RELEASE')):      # The test transaction's savepoints
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            au.delete_user_related_data(self.user_id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        # Includes the update of the rating totals of other users' recipes the user rated
+        self.assertLessEqual(len(statements), 14)
+
+    def test_progress_reported(self) -> None:
+        reports = []
+        au.delete_user_related_data(self.user_id, progress=lambda *args: reports.append(args))
+        self.assertEqual(reports[0][0], 0)
+        self.assertEqual(reports[-1], (reports[-1][1], reports[-1][1], 'done'))
+
+    def test_background_job(self) -> None:
+        job_id = au.start_delete_user_job(self.user_id)
+        for _ in range(100):
+            job = au.get_delete_user_job(job_id)
+            if job['status'] != 'running':
+                break
+            time.sleep(0.05)
+        self.assertEqual(job['status'], 'finished')
+        self.assertEqual(job['step'], job['total_steps'])
+        db.session.expire_all()
+        self.assertEqual(self.remaining(self.user_id)['user'], 0)
+        self.assertIsNone(au.get_delete_user_job('unknown'))
+
+
+class TestUserViews(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        now = datetime.now()
+        for user in models.User.query.filter(models.User.id.in_([2, 3, 4])):
+            user.current_login = now - timedelta(days=user.id)          # Within 7 days
+            user.total_logins = user.id
+        models.User.query.filter_by(id=5).first().current_login = now - timedelta(days=20)
+        db.session.commit()
+
+    def test_users_page_sorted(self) -> None:
+        page = au.get_users_page(page=1, per_page=3, sort='total_logins', direction='desc')
+        self.assertEqual([user.id for user in page.items], [4, 3, 2])
+        self.assertEqual(page.total, 11)
+        self.assertEqual(page.pages, 4)
+        # Unknown sort columns fall back to id
+        page = au.get_users_page(page=2, per_page=5, sort='password', role='user')
+        self.assertEqual([user.id for user in page.items], [7, 8, 9, 10, 11])
+
+    def test_user_stats(self) -> None:
+        stats = au.get_user_stats()
+        self.assertEqual(stats['total_users'], 11)
+        self.assertEqual(stats['active_last_7_days'], 3)
+        self.assertEqual(stats['active_last_30_days'], 4)
+        self.assertEqual(stats['total_logins'], 9)
+        self.assertEqual(stats['users_by_role'], {'admin': 1, 'user': 10})
+
+        # Cached until the TTL runs out
+        models.User.query.filter_by(id=6).first().soft_delete()
+        self.assertEqual(au.get_user_stats()['total_users'], 11)
+        au.clear_user_stats()
+        self.assertEqual(au.get_user_stats()['total_users'], 10)
+
+    def test_users_api_requires_admin(self) -> None:
+        client = current_app.test_client()
+        with patch('flask_login.utils._get_user', return_value=db.session.get(models.User, 2)):
+            self.assertEqual(client.get('/admin/api/users').status_code, 403)
+        with patch('flask_login.utils._get_user', return_value=db.session.get(models.User, 1)):
+            response = client.get('/admin/api/users?per_page=4&sort=email&direction=desc')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['users']), 4)
+        self.assertEqual(response.json['total'], 11)
+        self.assertEqual(response.json['stats']['total_users'], 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
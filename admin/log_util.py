@@ -0,0 +1,211 @@
+# Utility functions for reading the security log (LOG_PATH, app.log, and its rotated backups) in admin/views.py.
+# Records are JSON lines written by logging_util.py; older files in the previous plain text format are read too.
+# tail_lines() seeks backwards from the end of the file so only the requested lines are read.
+# LogIndex keeps, per log file, the byte offset of every record together with its time, level, user email and
+# IP address. It is extended incrementally as the file grows, so a search only reads the records it returns.
+
+import bisect
+import glob
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+# Matches the previous plain text format: "[asctime] {pathname:lineno} LEVEL - message"
+RECORD_PATTERN = re.compile(r'^\[(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,\d+)?\] \{[^}]*\} (?P<level>[A-Z]+) - ')
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+IP_PATTERN = re.compile(r'\bIP: ([0-9A-Fa-f.:]+)')
+
+
+# Method to read the last n lines of a file without reading the whole file. Returns lines oldest first.
+def tail_lines(path: str, n: int, block_size: int = 8192):
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        # Read blocks from the end until there are more than n line breaks (or the start of the file is reached)
+        while position > 0 and data.count(b'\n') <= n:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    return lines[-n:]
+
+
+# Method to parse the start of a log record. Returns (timestamp, level, email, ip) or None if the line does not
+# start a new record (e.g. a traceback continuation line).
+def parse_record(line: str):
+    if line.startswith('{'):
+        return _parse_json_record(line)
+    match = RECORD_PATTERN.match(line)
+    if not match:
+        return None
+    timestamp = datetime.strptime(match.group('time'), '%Y-%m-%d %H:%M:%S').timestamp()
+    email = EMAIL_PATTERN.search(line, match.end())
+    ip = IP_PATTERN.search(line, match.end())
+    return timestamp, match.group('level'), email.group(0).lower() if email else None, ip.group(1) if ip else None
+
+
+def _parse_json_record(line: str):
+    try:
+        entry = json.loads(line)
+        timestamp = datetime.strptime(entry['time'][:19], '%Y-%m-%d %H:%M:%S').timestamp()
+    except (ValueError, KeyError, TypeError):
+        return None
+    email = EMAIL_PATTERN.search(entry.get('message', ''))
+    ip = entry.get('ip')
+    if ip is None:
+        ip = IP_PATTERN.search(entry.get('message', ''))
+        ip = ip.group(1) if ip else None
+    return timestamp, entry.get('level'), email.group(0).lower() if email else None, ip
+
+
+# Returns the record numbers in both sorted lists. Each record of the (shorter) first list is looked up in the second
+# by bisecting from where the previous one was found, so the second list is never copied or walked.
+def _intersect(records, others) -> list:
+    found = []
+    start = 0
+    for record in records:
+        start = bisect.bisect_left(others, record, start)
+        if start == len(others):
+            break
+        if others[start] == record:
+            found.append(record)
+    return found
+
+
+class _FileIndex:
+    def __init__(self):
+        self.indexed_to = 0     # Byte offset up to which the file has been indexed
+        self.offsets = []       # Start offset of each record
+        self.times = []         # Timestamp of each record (non-decreasing)
+        self.postings = {}      # ('level'|'email'|'ip', value) -> sorted record numbers
+
+    # Reads the part of the file written since the last update and indexes any complete records in it.
+    def update(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            f.seek(self.indexed_to)
+            data = f.read()
+        end = data.rfind(b'\n') + 1     # Leave a partially written last line for the next update
+        position = self.indexed_to
+        for raw_line in data[:end].splitlines(keepends=True):
+            parsed = parse_record(raw_line.decode('utf-8', errors='replace'))
+            if parsed is not None or not self.offsets:
+                timestamp, level, email, ip = parsed or (self.times[-1] if self.times else 0.0, None, None, None)
+                record = len(self.offsets)
+                self.offsets.append(position)
+                self.times.append(max(timestamp, self.times[-1]) if self.times else timestamp)
+                for key in (('level', level), ('email', email), ('ip', ip)):
+                    if key[1] is not None:
+                        self.postings.setdefault(key, []).append(record)
+            position += len(raw_line)
+        self.indexed_to += end
+
+    # Returns the record numbers matching the filters, oldest first.
+    def match(self, level=None, email=None, ip=None, since=None, until=None):
+        low = bisect.bisect_left(self.times, since) if since is not None else 0
+        high = bisect.bisect_right(self.times, until) if until is not None else len(self.offsets)
+        lists = [self.postings.get(key, []) for key in (('level', level), ('email', email), ('ip', ip))
+                 if key[1] is not None]
+        if not lists:
+            return range(low, high)
+
+        lists.sort(key=len)
+        smallest = lists[0]
+        matches = smallest[bisect.bisect_left(smallest, low):bisect.bisect_left(smallest, high)]
+        for records in lists[1:]:
+            matches = _intersect(matches, records)
+        return matches
+
+    def read_record(self, f, record: int) -> str:
+        start = self.offsets[record]
+        stop = self.offsets[record + 1] if record + 1 < len(self.offsets) else self.indexed_to
+        f.seek(start)
+        return f.read(stop - start).decode('utf-8', errors='replace').rstrip('\n')
+
+
+class LogIndex:
+    """Index over a log file and its rotated backups (path, path.1, path.2, ...)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = {}        # (st_dev, st_ino) -> _FileIndex, so indexes follow files when they are rotated
+
+    # Returns the log files newest first (path, path.1, path.2, ...).
+    def _log_files(self):
+        backups = [p for p in glob.glob(glob.escape(self.path) + '.*') if p.rsplit('.', 1)[-1].isdigit()]
+        backups.sort(key=lambda p: int(p.rsplit('.', 1)[-1]))
+        return ([self.path] if os.path.exists(self.path) else []) + backups
+
+    # Method to bring the index up to date with the files on disk. Returns [(path, _FileIndex)] newest first.
+    def refresh(self):
+        with self._lock:
+            current = []
+            seen = {}
+            for path in self._log_files():
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = (stat.st_dev, stat.st_ino)
+                index = self._files.get(key)
+                if index is None or stat.st_size < index.indexed_to:    # New or truncated file
+                    index = _FileIndex()
+                if stat.st_size > index.indexed_to:
+                    index.update(path)
+                seen[key] = index
+                current.append((path, index))
+            self._files = seen
+            return current
+
+    # Method to search the log records newest first.
+    # Filters: level (e.g. 'INFO'), email, ip, since/until (datetime). Returns (records on the page, total matches).
+    def search(self, level=None, email=None, ip=None, since=None, until=None, page: int = 1, per_page: int = 50):
+        since = since.timestamp() if since else None
+        until = until.timestamp() if until else None
+        level = level.upper() if level else None
+        email = email.lower() if email else None
+        skip = (max(page, 1) - 1) * per_page
+
+        total = 0
+        wanted = []             # (path, index, record number)
+        for path, index in self.refresh():
+            matches = index.match(level, email, ip, since, until)
+            count = len(matches)
+            if skip < total + count and len(wanted) < per_page:
+                # Records are stored oldest first, the page is counted from the newest
+                first = skip - total if skip > total else 0
+                for position in range(count - 1 - first, -1, -1):
+                    if len(wanted) == per_page:
+                        break
+                    wanted.append((path, index, matches[position]))
+            total += count
+
+        records = []
+        open_files = {}
+        try:
+            for path, index, record in wanted:
+                if path not in open_files:
+                    open_files[path] = open(path, 'rb')
+                records.append(index.read_record(open_files[path], record))
+        finally:
+            for f in open_files.values():
+                f.close()
+        return records, total
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+# Method to get the shared index for a log path, so it is only built once per process.
+def get_log_index(path: str) -> LogIndex:
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = LogIndex(path)
+        return _indexes[path]
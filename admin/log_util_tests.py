@@ -0,0 +1,105 @@
+# Test file for log_util.py
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from admin import log_util
+
+
+def log_line(time, level, message):
+    return f'[2024-03-01 {time},123] {{/app/users/views.py:80}} {level} - {message}\n'
+
+
+class TestLogUtil(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'app.log')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def write(self, lines, path=None, mode='a') -> None:
+        with open(path or self.path, mode) as f:
+            f.writelines(lines)
+
+    def test_tail_lines(self) -> None:
+        self.write([f'line {i}\n' for i in range(1000)])
+        self.assertEqual(log_util.tail_lines(self.path, 3), ['line 997', 'line 998', 'line 999'])
+        # Small blocks force several backwards reads
+        self.assertEqual(log_util.tail_lines(self.path, 5, block_size=7), [f'line {i}' for i in range(995, 1000)])
+        self.assertEqual(len(log_util.tail_lines(self.path, 5000)), 1000)
+        self.assertEqual(log_util.tail_lines(os.path.join(self.directory, 'missing.log'), 10), [])
+
+    def test_search_filters(self) -> None:
+        self.write([
+            log_line('10:00:00', 'INFO', 'User Registration User: a@email.com IP: 10.0.0.1'),
+            log_line('10:05:00', 'WARNING', 'Invalid Login Attempt User: b@email.com IP: 10.0.0.2'),
+            log_line('10:10:00', 'INFO', 'Log in User: A@email.com IP: 10.0.0.2'),
+            log_line('10:15:00', 'ERROR', 'Unhandled exception'),
+            'Traceback (most recent call last):\n',
+            log_line('10:20:00', 'INFO', 'Log out User: b@email.com IP: 10.0.0.1'),
+        ])
+        index = log_util.LogIndex(self.path)
+
+        records, total = index.search(email='a@email.com')
+        self.assertEqual(total, 2)
+        self.assertIn('Log in', records[0])         # Newest first
+        self.assertIn('Registration', records[1])
+
+        records, total = index.search(level='info', ip='10.0.0.1')
+        self.assertEqual(total, 2)
+        records, total = index.search(level='ERROR')
+        self.assertTrue(records[0].endswith('Traceback (most recent call last):'))
+
+        records, total = index.search(since=datetime(2024, 3, 1, 10, 5), until=datetime(2024, 3, 1, 10, 15))
+        self.assertEqual(total, 3)
+        self.assertEqual(index.search(email='nobody@email.com'), ([], 0))
+
+    def test_intersect(self) -> None:
+        self.assertEqual(log_util._intersect([2, 5, 9, 40], list(range(0, 30, 3)) + [40]), [9, 40])
+        self.assertEqual(log_util._intersect([1, 2], [5, 6]), [])
+        self.assertEqual(log_util._intersect([7], []), [])
+
+    def test_pagination_and_incremental_update(self) -> None:
+        self.write([log_line(f'10:{i:02d}:00', 'INFO', f'Log in User: u{i}@email.com') for i in range(25)])
+        index = log_util.LogIndex(self.path)
+
+        records, total = index.search(page=2, per_page=10)
+        self.assertEqual(total, 25)
+        self.assertIn('u14@email.com', records[0])
+        self.assertIn('u5@email.com', records[-1])
+        self.assertEqual(len(index.search(page=3, per_page=10)[0]), 5)
+
+        indexed_to = index.refresh()[0][1].indexed_to
+        self.write([log_line('11:00:00', 'INFO', 'Log in User: new@email.com')])
+        records, total = index.search(per_page=1)
+        self.assertEqual(total, 26)
+        self.assertIn('new@email.com', records[0])
+        # Only the appended record was read
+        file_index = index.refresh()[0][1]
+        self.assertEqual(file_index.offsets[-1], indexed_to)
+
+    def test_search_across_rotated_files(self) -> None:
+        self.write([log_line('09:00:00', 'INFO', 'Log in User: old@email.com')])
+        index = log_util.LogIndex(self.path)
+        self.assertEqual(index.search()[1], 1)
+        old_index = index.refresh()[0][1]
+
+        # Rotate as RotatingFileHandler does: app.log -> app.log.1, then start a new app.log
+        os.rename(self.path, self.path + '.1')
+        self.write([log_line('10:00:00', 'INFO', 'Log in User: new@email.com')])
+
+        records, total = index.search(per_page=10)
+        self.assertEqual(total, 2)
+        self.assertIn('new@email.com', records[0])
+        self.assertIn('old@email.com', records[1])
+        # The rotated file kept its index
+        self.assertIs(index.refresh()[1][1], old_index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
-from flask import Blueprint, render_template, flash, abort, redirect, url_for
+from datetime import datetime
+
+from flask import Blueprint, render_template, flash, abort, redirect, url_for, request, jsonify, current_app
 from flask_login import login_required, current_user
 
-from admin.admin_util import delete_user_related_data
+from admin.admin_util import start_delete_user_job, get_delete_user_job, get_users_page, get_user_stats, \
+    user_activity, USER_SORT_COLUMNS, MAX_USERS_PER_PAGE
+from admin.log_util import tail_lines, get_log_index
 
 from app import db
 from models import User
@@ -19,42 +23,67 @@ def admin():
     return render_template('admin/admin.html', name=current_user.first_name)
 
 
-# View all registered users
+# View all registered users, one page at a time
 @admin_blueprint.route('/view_all_users')
 @login_required
 def view_all_users():
-    # Query all users with the role 'user'
-    current_users = User.query.filter_by(role='user').all()
+    if current_user.role != 'admin':
+        abort(403)  # Abort if the user is not an admin role
 
-    return render_template('admin/admin.html', name=current_user.first_name, current_users=current_users)
+    users_page = get_users_page(role='user', **_page_args())
+    # Deleted users waiting for the purger, newest first, which can be restored or removed straight away
+    deleted_users = User.query_deleted().filter_by(role='user').order_by(User.deleted_at.desc()) \
+        .limit(MAX_USERS_PER_PAGE).all()
+    return render_template('admin/admin.html', name=current_user.first_name, current_users=users_page.items,
+                           users_page=users_page, page_args=_page_args(), deleted_users=deleted_users)
 
 
-# View all user activity
+# View all user activity, one page at a time, with aggregate statistics
 @admin_blueprint.route('/view_user_activity')
 @login_required
 def view_user_activity():
     if current_user.role != 'admin':
         abort(403) # Abort if the user is not an admin role
 
-    # Fetch user activities from the database
-    users = User.query.all()
-    user_activities = [
-        {
-            'id': user.id,
-            'email': user.email,
-            'current_login_ip': user.current_login_ip,
-            'last_login_ip': user.last_login_ip,
-            'total_logins': user.total_logins,
-            'registration_date': user.registered_on.strftime(
-                "%Y-%m-%d %H:%M:%S") if user.registered_on else 'N/A',
-            'last_login': user.last_login.strftime("%Y-%m-%d %H:%M:%S") if user.last_login else 'N/A',
-            'current_login': user.current_login.strftime("%Y-%m-%d %H:%M:%S") if user.current_login else 'N/A'
-        }
-        for user in users
-    ]
+    activity_page = get_users_page(**_page_args())
+    user_activities = [user_activity(user) for user in activity_page.items]
 
     return render_template('admin/admin.html', first_name=current_user.first_name, last_name=current_user.last_name,
-                           user_activities=user_activities)
+                           user_activities=user_activities, activity_page=activity_page, page_args=_page_args(),
+                           user_stats=get_user_stats())
+
+
+# JSON API for the admin user views. Query arguments: page, per_page, sort (see USER_SORT_COLUMNS),
+# direction ('asc' or 'desc') and role.
+@admin_blueprint.route('/api/users')
+@login_required
+def users_api():
+    if current_user.role != 'admin':
+        abort(403)
+
+    args = _page_args()
+    users_page = get_users_page(role=request.args.get('role'), **args)
+    return jsonify({
+        'users': [user_activity(user) for user in users_page.items],
+        'page': users_page.page,
+        'per_page': users_page.per_page,
+        'pages': users_page.pages,
+        'total': users_page.total,
+        'sort': args['sort'],
+        'direction': args['direction'],
+        'stats': get_user_stats(),
+    })
+
+
+# Reads the paging and sorting query arguments shared by the admin user views
+def _page_args() -> dict:
+    sort = request.args.get('sort', 'id')
+    return {
+        'page': max(request.args.get('page', 1, type=int), 1),
+        'per_page': min(max(request.args.get('per_page', 50, type=int), 1), MAX_USERS_PER_PAGE),
+        'sort': sort if sort in USER_SORT_COLUMNS else 'id',
+        'direction': 'desc' if request.args.get('direction') == 'desc' else 'asc',
+    }
 
 
 # Delete a user by ID
@@ -68,8 +97,8 @@ def delete_user(user_id):
         return redirect(url_for('admin.view_all_users'))
 
     try:
-        # Delete all user's related data (function is in admin_util.py)
-        delete_user_related_data(user_id)
+        # Hide the user straight away, their data is removed later by the purger (purge_util.py)
+        user.soft_delete()
         flash('User deleted successfully', 'success')
     except Exception as e:
         db.session.rollback()  # Rollback the session in case of an error
@@ -78,6 +107,57 @@ def delete_user(user_id):
     return redirect(url_for('admin.view_all_users'))
 
 
+# Undo deleting a user, possible until the user is purged
+@admin_blueprint.route('/restore_user/<int:user_id>', methods=['POST'])
+@login_required
+def restore_user(user_id):
+    if current_user.role != 'admin':
+        abort(403)
+
+    user = User.query.execution_options(include_deleted=True).filter_by(id=user_id).first()
+    if not user:
+        flash('User not found', 'danger')
+    else:
+        user.restore()
+        flash('User restored', 'success')
+    return redirect(url_for('admin.view_all_users'))
+
+
+# Permanently delete a (soft deleted) user and all their data now, rather than waiting for the purger.
+# Runs in a background thread, progress is available from admin.delete_user_status
+@admin_blueprint.route('/purge_user/<int:user_id>', methods=['POST'])
+@login_required
+def purge_user(user_id):
+    if current_user.role != 'admin':
+        abort(403)
+
+    user = User.query.execution_options(include_deleted=True).filter_by(id=user_id).first()
+    if not user:
+        flash('User not found', 'danger')
+        return redirect(url_for('admin.view_all_users'))
+    # Only users already deleted, so every user gets the restore window first
+    if not user.is_deleted():
+        flash('Only deleted users can be removed permanently', 'danger')
+        return redirect(url_for('admin.view_all_users'))
+
+    job_id = start_delete_user_job(user_id)
+    flash(f'Deleting user in the background (job {job_id})', 'success')
+    return redirect(url_for('admin.view_all_users'))
+
+
+# Progress of a background user deletion as JSON
+@admin_blueprint.route('/delete_user/status/<job_id>')
+@login_required
+def delete_user_status(job_id):
+    if current_user.role != 'admin':
+        abort(403)
+
+    job = get_delete_user_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+
 # View security logs
 @admin_blueprint.route('/logs')
 @login_required
@@ -85,9 +165,48 @@ def logs():
     if current_user.role != 'admin':
         abort(403)
 
-    # Read the last 10 lines from the app.log file
-    with open("app.log", "r") as f:
-        content = f.read().splitlines()[-10:]
-        content.reverse()
+    # Read the last 10 lines from the log file (app.log), newest first
+    log_path = current_app.config['LOG_PATH']
+    content = tail_lines(log_path, 10) if log_path else []
+    content.reverse()
 
     return render_template('admin/admin.html', logs=content, name=current_user.first_name)
+
+
+# Search security logs (app.log and its rotated backups), newest first
+@admin_blueprint.route('/logs/search')
+@login_required
+def search_logs():
+    if current_user.role != 'admin':
+        abort(403)
+
+    filters = {
+        'level': request.args.get('level', '').strip() or None,
+        'email': request.args.get('email', '').strip() or None,
+        'ip': request.args.get('ip', '').strip() or None,
+        'since': _parse_datetime(request.args.get('since')),
+        'until': _parse_datetime(request.args.get('until')),
+    }
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+
+    log_path = current_app.config['LOG_PATH']
+    records, total = get_log_index(log_path).search(page=page, per_page=per_page, **filters) if log_path else ([], 0)
+    log_search = {
+        'args': {key: value for key, value in request.args.items() if key != 'page'},
+        'page': page,
+        'total': total,
+        'has_prev': page > 1,
+        'has_next': page * per_page < total,
+    }
+    return render_template('admin/admin.html', logs=records, log_search=log_search, name=current_user.first_name)
+
+
+# Parses a date ("YYYY-MM-DD") or datetime ("YYYY-MM-DDTHH:MM") query argument. Returns None if missing or invalid.
+def _parse_datetime(value):
+    for fmt in ('%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value or '', fmt)
+        except ValueError:
+            continue
+    return None
@@ -1,52 +1,62 @@
 import datetime
-import os
-from logging.handlers import RotatingFileHandler
-import logging
 from flask import Flask, render_template, redirect, url_for, flash
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import login_required, current_user, LoginManager
+from rate_limit import RateLimiter
+from cache import Cache
+from logging_util import install_logging
+import config as config_profiles
 
 # Initialize extensions
 db = SQLAlchemy()
 login_manager = LoginManager()
+limiter = RateLimiter()
+cache = Cache()
 
 today = datetime.date.today()
 
 
-def create_app():
+def create_app(config=None):
     load_dotenv()
 
     app = Flask(__name__)
-    app.secret_key = os.getenv('SECRET_KEY')
+    # The settings of a profile in config.py (APP_CONFIG when config is None), overridden by the environment
+    app.config.update(config_profiles.load(config))
+    app.secret_key = app.config['SECRET_KEY']
 
     login_manager.init_app(app)
     login_manager.login_view = 'users.login'
 
-    log_path = 'app.log'
+    # Session data is kept on the server, the cookie only holds its id (users/session_store.py)
+    from users.session_store import install_session_interface
+    install_session_interface(app)
 
-    handler = RotatingFileHandler(log_path, maxBytes=500000, backupCount=10)
-    handler.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-        "[%(asctime)s] {%(pathname)s:%(lineno)d} %(levelname)s - %(message)s")
-    handler.setFormatter(formatter)
-    app.logger.addHandler(handler)
-    app.logger.setLevel(logging.INFO)
-
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
-    app.config['ENCRYPTION_KEY'] = os.getenv('ENCRYPTION_KEY')
-    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-    app.config['RECAPTCHA_PUBLIC_KEY'] = os.getenv('RECAPTCHA_PUBLIC_KEY')
-    app.config['RECAPTCHA_PRIVATE_KEY'] = os.getenv('RECAPTCHA_PRIVATE_KEY')
-    app.config['SQLALCHEMY_ECHO'] = True
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # JSON lines written to app.log by a background listener thread (logging_util.py)
+    install_logging(app)
 
     # Initialize database
     # db = SQLAlchemy(app)
     db.init_app(app)
 
     with app.app_context():
+        # WAL, busy timeout and cache pragmas for SQLite databases (sqlite_util.py)
+        from sqlite_util import install_pragmas
+        install_pragmas(db.engine, app.config)
+        from models import add_missing_columns
         db.create_all()
+        add_missing_columns()
+        if app.config['NUTRITION_AUTOLOAD']:
+            from nutrition_util import ensure_nutrition_loaded
+            ensure_nutrition_loaded()
+
+    if app.config['PURGE_ENABLED']:
+        from purge_util import start_purger
+        start_purger(app)
+
+    # Ratings are written in batches by a write-behind buffer (recipes/rating_buffer.py)
+    from recipes.rating_buffer import install_rating_buffer
+    install_rating_buffer(app)
 
     from users.views import users_blueprint
     from pantry.views import pantry_blueprint
@@ -64,8 +74,8 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        from models import User
-        return User.query.get(int(user_id))
+        from users.user_cache import get_user
+        return get_user(int(user_id))
 
     @app.route('/')
     def home():
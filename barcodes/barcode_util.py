@@ -1,7 +1,7 @@
 import cv2
 from pyzbar.pyzbar import decode
 import datetime
-from app import db
+from app import db, cache
 from models import Barcode, QuantifiedFoodItem, create_or_get_food_item, create_and_get_qfid
 
 
@@ -49,6 +49,12 @@ def scan_barcode_file(filepath):
     frame = cv2.imread(filepath)
     if frame is None:
         return None
+    return decode_frame(frame)
+
+
+# Method to get the first non-empty barcode value from an already loaded image (numpy array).
+# Returns None if no barcode is detected.
+def decode_frame(frame):
     # get barcode from image
     detected_barcode = decode(frame)
     if not detected_barcode:
@@ -60,6 +66,20 @@ def scan_barcode_file(filepath):
                 return barcode.data.decode()
 
 
+# Method to look up the food saved for a barcode value. Returns a dict with its name, quantity and units, or None
+# if the barcode is unknown. Cached until a barcode is added or removed.
+@cache.memoize(tags=('barcodes',))
+def find_barcode(value):
+    barcode = Barcode.query.filter(Barcode.barcode == value).first()
+    if barcode is None:
+        return None
+    return {
+        'name': barcode.get_name(),
+        'quantity': barcode.get_quantity(),
+        'units': barcode.get_units(),
+    }
+
+
 def create_barcode(barcode, food_name, quantity, units):
     food_item = create_or_get_food_item(food_name)
     qfood_id = create_and_get_qfid(food_id=food_item.id, quantity=float(quantity), units=units)
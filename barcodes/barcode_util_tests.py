@@ -4,15 +4,14 @@ from barcodes import barcode_util
 import models
 from unittest.mock import patch, MagicMock
 import unittest
-from app import create_app
-from populate_db import create_barcodes, add_food_items
+from populate_db import create_barcodes
+from testing_util import DatabaseTestCase
 
 
-class TestBarcodeUtil(unittest.TestCase):
+class TestBarcodeUtil(DatabaseTestCase):
 
     def setUp(self) -> None:
-        models.init_db()
-        add_food_items()
+        super().setUp()
         create_barcodes()
 
     def test_scan_barcode_file_with_code_present(self) -> None:
@@ -79,6 +78,4 @@ class TestBarcodeUtil(unittest.TestCase):
 
 
 if __name__ == '__main__':
-    app = create_app()
-    with app.app_context():
-        unittest.main(exit=False)
+    unittest.main()
@@ -1,10 +1,14 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required
+from app import limiter
 from barcodes.forms import BarcodeForm
 from barcodes.barcode_util import create_barcode, scan_barcode_webcam, scan_barcode_file
 
 barcodes_blueprint = Blueprint('barcodes', __name__, template_folder='templates')
 
+# Barcode scanning is CPU heavy, limit requests per client (see rate_limit.py)
+limiter.limit_blueprint(barcodes_blueprint, 'RATELIMIT_BARCODES')
+
 
 @barcodes_blueprint.route('/add_barcode', methods=['GET', 'POST'])
 @login_required
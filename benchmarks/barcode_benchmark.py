@@ -0,0 +1,407 @@
+# Benchmark harness for barcode decoding (barcodes/barcode_util.py).
+# Generates synthetic EAN-13, UPC-A and QR images at several resolutions, rotations, blur levels and noise levels,
+# then measures decode latency and success rate for each image preprocessing strategy.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.barcode_benchmark
+#   python -m benchmarks.barcode_benchmark --full-grid --repeat 5 --json barcode_results.json
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from barcodes.barcode_util import decode_frame
+
+try:
+    import qrcode
+except ImportError:  # QR samples are skipped when the qrcode package is not installed
+    qrcode = None
+
+# EAN-13 / UPC-A module patterns for each digit. G codes are the R codes mirrored.
+_L_CODES = ('0001101', '0011001', '0010011', '0111101', '0100011',
+            '0110001', '0101111', '0111011', '0110111', '0001011')
+_R_CODES = tuple(''.join('1' if bit == '0' else '0' for bit in code) for code in _L_CODES)
+_G_CODES = tuple(code[::-1] for code in _R_CODES)
+# Parity of the six left-hand digits, selected by the first (implicit) digit
+_PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG', 'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+
+# Ink and label colours (BGR) used when printing a symbol onto a scene
+_INK_COLOURS = ((20, 20, 20), (110, 40, 15), (25, 25, 120), (30, 90, 30))
+_LABEL_COLOURS = ((250, 250, 250), (215, 240, 250), (235, 235, 225))
+
+# Longest image side used by the downscaled and ROI strategies
+DOWNSCALE_MAX_SIDE = 640
+# Maximum number of candidate regions the ROI strategy tries before giving up
+ROI_MAX_CANDIDATES = 3
+
+DEFAULT_RESOLUTIONS = ((640, 480), (1280, 720), (1920, 1080), (3840, 2160))
+DEFAULT_ROTATIONS = (0, 15, 45, 90)
+DEFAULT_BLURS = (0, 1.5, 3)
+DEFAULT_NOISE = (0, 12, 30)
+DEFAULT_SYMBOLOGIES = ('ean13', 'upca', 'qr')
+
+
+# Method to calculate the EAN-13 check digit for the first 12 digits of a code.
+def ean13_check_digit(digits: str) -> str:
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+# Method to turn a full 13 digit EAN code into its 95 module bar pattern ('1' = bar, '0' = space).
+def ean13_modules(code: str) -> str:
+    first, left, right = int(code[0]), code[1:7], code[7:]
+    modules = '101'
+    for digit, parity in zip(left, _PARITY[first]):
+        modules += (_L_CODES if parity == 'L' else _G_CODES)[int(digit)]
+    modules += '01010'
+    for digit in right:
+        modules += _R_CODES[int(digit)]
+    return modules + '101'
+
+
+# Method to draw a 13 digit EAN code as a grayscale image with quiet zones. UPC-A codes are drawn by
+# prefixing them with a 0, which produces identical bars.
+def render_ean13(code: str, module_px: int) -> np.ndarray:
+    modules = ean13_modules(code)
+    quiet_zone = 11
+    width = (len(modules) + 2 * quiet_zone) * module_px
+    height = max(int(width * 0.45), 10)
+    image = np.full((height, width), 255, np.uint8)
+    for i, module in enumerate(modules):
+        if module == '1':
+            x = (quiet_zone + i) * module_px
+            image[:, x:x + module_px] = 0
+    margin = 6 * module_px
+    return cv2.copyMakeBorder(image, margin, margin, 0, 0, cv2.BORDER_CONSTANT, value=255)
+
+
+# Method to draw a QR code as a grayscale image. Requires the qrcode package.
+def render_qr(data: str, module_px: int) -> np.ndarray:
+    qr = qrcode.QRCode(border=4, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = np.array(qr.get_matrix(), dtype=np.uint8)
+    image = np.where(matrix == 1, 0, 255).astype(np.uint8)
+    return np.kron(image, np.ones((module_px, module_px), np.uint8))
+
+
+# Method to build a random payload for the given symbology.
+# Returns (payload drawn into the image, set of decoded values counted as a success).
+def random_payload(symbology: str, rng: random.Random):
+    if symbology == 'qr':
+        payload = f'PANTRY-{rng.randrange(10 ** 9):09d}'
+        return payload, {payload}
+    if symbology == 'upca':
+        digits = '0' + ''.join(str(rng.randrange(10)) for _ in range(11))
+        code = digits + ean13_check_digit(digits)
+        # zbar reports UPC-A either as 12 digits or as the equivalent EAN-13 with a leading zero
+        return code, {code, code[1:]}
+    digits = str(rng.randrange(1, 10)) + ''.join(str(rng.randrange(10)) for _ in range(11))
+    code = digits + ean13_check_digit(digits)
+    return code, {code}
+
+
+# Method to create a cluttered colour background so that the ROI strategy has distractors to reject.
+def _background(width: int, height: int, rng: random.Random) -> np.ndarray:
+    top = np.array([rng.randrange(120, 230) for _ in range(3)], np.float32)
+    bottom = np.array([rng.randrange(60, 200) for _ in range(3)], np.float32)
+    ramp = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    scene = (top * (1 - ramp) + bottom * ramp).repeat(width, axis=1).astype(np.uint8)
+    for _ in range(8):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(width // 20, width // 5), rng.randrange(height // 20, height // 5)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        cv2.rectangle(scene, (x, y), (x + w, y + h), colour, -1)
+    return scene
+
+
+# Method to rotate an image by the given angle (degrees), expanding the canvas so nothing is cropped.
+def _rotate(image: np.ndarray, angle: float, fill) -> np.ndarray:
+    if angle % 360 == 0:
+        return image
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width, new_height = int(height * sin + width * cos), int(height * cos + width * sin)
+    matrix[0, 2] += new_width / 2 - width / 2
+    matrix[1, 2] += new_height / 2 - height / 2
+    return cv2.warpAffine(image, matrix, (new_width, new_height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=fill)
+
+
+# Method to generate a single synthetic scene containing one barcode.
+# Returns a dict describing the sample, including the BGR image under 'image'.
+def generate_sample(symbology: str, resolution, rotation: float, blur: float, noise: float,
+                    rng: random.Random) -> dict:
+    width, height = resolution
+    payload, expected = random_payload(symbology, rng)
+
+    # Size the symbol to roughly a third of the scene width, as a phone photo of a product would be
+    if symbology == 'qr':
+        probe = render_qr(payload, 1)
+    else:
+        probe = render_ean13(payload, 1)
+    module_px = max(1, int(width * 0.35 / probe.shape[1]))
+    symbol = render_qr(payload, module_px) if symbology == 'qr' else render_ean13(payload, module_px)
+
+    # Print the symbol onto a coloured label
+    ink = np.array(rng.choice(_INK_COLOURS), np.uint8)
+    label = np.array(rng.choice(_LABEL_COLOURS), np.uint8)
+    symbol = np.where(symbol[..., None] == 0, ink, label).astype(np.uint8)
+    symbol = _rotate(symbol, rotation, tuple(int(c) for c in label))
+
+    # Shrink the symbol if rotation pushed it past the scene bounds
+    scale = min(1.0, 0.9 * width / symbol.shape[1], 0.9 * height / symbol.shape[0])
+    if scale < 1.0:
+        symbol = cv2.resize(symbol, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    scene = _background(width, height, rng)
+    x = rng.randrange(0, width - symbol.shape[1] + 1)
+    y = rng.randrange(0, height - symbol.shape[0] + 1)
+    scene[y:y + symbol.shape[0], x:x + symbol.shape[1]] = symbol
+
+    if blur:
+        scene = cv2.GaussianBlur(scene, (0, 0), blur)
+    if noise:
+        grain = np.random.default_rng(rng.randrange(2 ** 32)).normal(0, noise, scene.shape)
+        scene = np.clip(scene.astype(np.float32) + grain, 0, 255).astype(np.uint8)
+
+    return {
+        'symbology': symbology,
+        'resolution': f'{width}x{height}',
+        'rotation': rotation,
+        'blur': blur,
+        'noise': noise,
+        'payload': payload,
+        'expected': expected,
+        'image': scene,
+    }
+
+
+# Method to build the list of (symbology, resolution, rotation, blur, noise) conditions to generate.
+# By default each factor is varied on its own from a baseline; full_grid gives every combination.
+def build_conditions(symbologies, resolutions, rotations, blurs, noise_levels, full_grid=False):
+    if full_grid:
+        return [(symbology, resolution, rotation, blur, noise)
+                for symbology in symbologies for resolution in resolutions for rotation in rotations
+                for blur in blurs for noise in noise_levels]
+
+    base_resolution = resolutions[min(1, len(resolutions) - 1)]
+    base = (base_resolution, rotations[0], blurs[0], noise_levels[0])
+    conditions = []
+    for symbology in symbologies:
+        variants = {base}
+        variants.update((resolution, base[1], base[2], base[3]) for resolution in resolutions)
+        variants.update((base[0], rotation, base[2], base[3]) for rotation in rotations)
+        variants.update((base[0], base[1], blur, base[3]) for blur in blurs)
+        variants.update((base[0], base[1], base[2], noise) for noise in noise_levels)
+        conditions.extend((symbology,) + variant for variant in sorted(variants, key=str))
+    return conditions
+
+
+# Method to reduce a grayscale image so its longest side is at most max_side.
+# Returns (resized image, scale factor applied).
+def _downscale(gray: np.ndarray, max_side: int = DOWNSCALE_MAX_SIDE):
+    scale = max_side / max(gray.shape[:2])
+    if scale >= 1.0:
+        return gray, 1.0
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+
+# Method to locate likely barcode regions in a grayscale image using gradient density.
+# Returns a list of (x, y, w, h) boxes, largest first.
+def find_barcode_regions(gray: np.ndarray):
+    grad_x = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3)
+    gradient = cv2.addWeighted(cv2.convertScaleAbs(grad_x), 0.5, cv2.convertScaleAbs(grad_y), 0.5, 0)
+    gradient = cv2.blur(gradient, (9, 9))
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.erode(mask, None, iterations=4)
+    mask = cv2.dilate(mask, None, iterations=4)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = [cv2.boundingRect(contour) for contour in contours]
+    return sorted(boxes, key=lambda box: box[2] * box[3], reverse=True)
+
+
+# Preprocessing strategies. Each takes a BGR frame and returns the decoded value or None.
+
+# Current production path: pass the colour frame straight to pyzbar (which only reads the first channel).
+def strategy_full_colour(frame):
+    return decode_frame(frame)
+
+
+def strategy_grayscale(frame):
+    return decode_frame(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+
+def strategy_downscaled(frame):
+    gray, _ = _downscale(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    return decode_frame(gray)
+
+
+# Finds candidate regions on a downscaled copy, then decodes full resolution crops of those regions only.
+def strategy_roi(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small, scale = _downscale(gray)
+    height, width = gray.shape
+    for x, y, w, h in find_barcode_regions(small)[:ROI_MAX_CANDIDATES]:
+        pad_x, pad_y = int(w * 0.15) + 4, int(h * 0.15) + 4
+        left, top = max(0, int((x - pad_x) / scale)), max(0, int((y - pad_y) / scale))
+        right, bottom = min(width, int((x + w + pad_x) / scale)), min(height, int((y + h + pad_y) / scale))
+        value = decode_frame(gray[top:bottom, left:right])
+        if value:
+            return value
+    return None
+
+
+STRATEGIES = {
+    'full_colour': strategy_full_colour,
+    'grayscale': strategy_grayscale,
+    'downscaled': strategy_downscaled,
+    'roi': strategy_roi,
+}
+
+
+# Method to run every strategy over every sample.
+# Returns a list of result dicts (one per sample and strategy) with median latency over `repeat` runs.
+def run_benchmark(samples, strategies, repeat=3):
+    results = []
+    for sample in samples:
+        for name in strategies:
+            strategy = STRATEGIES[name]
+            timings = []
+            value = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                value = strategy(sample['image'])
+                timings.append((time.perf_counter() - start) * 1000)
+            results.append({
+                'strategy': name,
+                'symbology': sample['symbology'],
+                'resolution': sample['resolution'],
+                'rotation': sample['rotation'],
+                'blur': sample['blur'],
+                'noise': sample['noise'],
+                'decoded': value,
+                'success': value in sample['expected'],
+                'latency_ms': statistics.median(timings),
+            })
+    return results
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+# Method to aggregate results into success rate and latency statistics per strategy, optionally split by a factor.
+def summarise(results, factor=None):
+    groups = {}
+    for result in results:
+        key = (result['strategy'], result[factor]) if factor else (result['strategy'],)
+        groups.setdefault(key, []).append(result)
+
+    summary = []
+    for key, group in groups.items():
+        latencies = [result['latency_ms'] for result in group]
+        row = {
+            'strategy': key[0],
+            'samples': len(group),
+            'success_rate': sum(result['success'] for result in group) / len(group),
+            'p50_ms': _percentile(latencies, 50),
+            'p95_ms': _percentile(latencies, 95),
+            'mean_ms': statistics.fmean(latencies),
+        }
+        if factor:
+            row[factor] = key[1]
+        summary.append(row)
+    return summary
+
+
+def print_report(results, strategies):
+    print(f"{'strategy':<12} {'samples':>7} {'success':>8} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for row in summarise(results):
+        print(f"{row['strategy']:<12} {row['samples']:>7} {row['success_rate']:>8.1%} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['mean_ms']:>8.2f}")
+
+    # Success rate / median latency of every strategy for each level of each factor
+    for factor in ('symbology', 'resolution', 'rotation', 'blur', 'noise'):
+        rows = summarise(results, factor)
+        levels = sorted({row[factor] for row in rows}, key=lambda level: (str(type(level)), level))
+        print(f"\nby {factor}")
+        print(f"{'':<12}" + ''.join(f'{name:>20}' for name in strategies))
+        for level in levels:
+            cells = []
+            for name in strategies:
+                row = next(row for row in rows if row['strategy'] == name and row[factor] == level)
+                cells.append(f"{row['success_rate']:>7.0%} {row['p50_ms']:>8.2f}ms")
+            print(f'{str(level):<12}' + ''.join(f'{cell:>20}' for cell in cells))
+
+
+def _parse_list(text, cast):
+    return tuple(cast(item) for item in text.split(',') if item)
+
+
+def _parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark barcode decoding preprocessing strategies.')
+    parser.add_argument('--symbologies', default=','.join(DEFAULT_SYMBOLOGIES))
+    parser.add_argument('--resolutions', default=','.join(f'{w}x{h}' for w, h in DEFAULT_RESOLUTIONS))
+    parser.add_argument('--rotations', default=','.join(str(r) for r in DEFAULT_ROTATIONS))
+    parser.add_argument('--blurs', default=','.join(str(b) for b in DEFAULT_BLURS),
+                        help='Gaussian blur sigmas in pixels')
+    parser.add_argument('--noise', default=','.join(str(n) for n in DEFAULT_NOISE),
+                        help='Gaussian noise standard deviations (0-255 scale)')
+    parser.add_argument('--strategies', default=','.join(STRATEGIES))
+    parser.add_argument('--full-grid', action='store_true', help='Generate every combination of conditions')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per sample and strategy')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Write raw results to this file')
+    parser.add_argument('--save-dir', help='Write the generated images to this directory')
+    args = parser.parse_args(argv)
+
+    symbologies = _parse_list(args.symbologies, str)
+    if qrcode is None and 'qr' in symbologies:
+        print('qrcode package not installed, skipping QR samples')
+        symbologies = tuple(s for s in symbologies if s != 'qr')
+    strategies = _parse_list(args.strategies, str)
+    conditions = build_conditions(symbologies,
+                                  _parse_list(args.resolutions, _parse_resolution),
+                                  _parse_list(args.rotations, float),
+                                  _parse_list(args.blurs, float),
+                                  _parse_list(args.noise, float),
+                                  full_grid=args.full_grid)
+
+    rng = random.Random(args.seed)
+    samples = [generate_sample(*condition, rng=rng) for condition in conditions]
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+        for i, sample in enumerate(samples):
+            name = (f"{i:04d}_{sample['symbology']}_{sample['resolution']}_r{sample['rotation']:g}"
+                    f"_b{sample['blur']:g}_n{sample['noise']:g}.png")
+            cv2.imwrite(os.path.join(args.save_dir, name), sample['image'])
+
+    print(f'{len(samples)} samples x {len(strategies)} strategies x {args.repeat} runs\n')
+    results = run_benchmark(samples, strategies, repeat=args.repeat)
+    print_report(results, strategies)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# Test file for barcode_benchmark.py
+
+import random
+import unittest
+
+from benchmarks import barcode_benchmark as bb
+
+
+class TestBarcodeBenchmark(unittest.TestCase):
+
+    def test_ean13_check_digit(self) -> None:
+        # Codes taken from barcodes/barcode_test_data
+        self.assertEqual(bb.ean13_check_digit("051234500010"), "7")
+        self.assertEqual(bb.ean13_check_digit("930063392916"), "9")
+
+    def test_ean13_modules_length(self) -> None:
+        self.assertEqual(len(bb.ean13_modules("5022032139942")), 95)
+
+    def test_generated_ean13_decodes(self) -> None:
+        sample = bb.generate_sample('ean13', (1280, 720), 0, 0, 0, rng=random.Random(1))
+        self.assertIn(bb.strategy_grayscale(sample['image']), sample['expected'])
+
+    def test_generated_upca_decodes(self) -> None:
+        sample = bb.generate_sample('upca', (1280, 720), 0, 0, 0, rng=random.Random(2))
+        self.assertIn(bb.strategy_downscaled(sample['image']), sample['expected'])
+
+    def test_run_benchmark_reports_every_strategy(self) -> None:
+        samples = [bb.generate_sample('ean13', (640, 480), 0, 0, 0, rng=random.Random(3))]
+        results = bb.run_benchmark(samples, bb.STRATEGIES, repeat=1)
+        self.assertEqual({result['strategy'] for result in results}, set(bb.STRATEGIES))
+        self.assertTrue(all(result['latency_ms'] >= 0 for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
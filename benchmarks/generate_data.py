@@ -0,0 +1,255 @@
+# Seeded generator of synthetic data for load testing: users, recipes (with ingredients drawn from calories.txt),
+# ratings, pantries, shopping lists and barcodes, in the volumes needed to benchmark against production-sized data.
+# Rows are built in memory and written with executemany inserts of `batch_size` rows in one transaction per run,
+# with primary keys allocated up front so no row has to be read back. The full-text search triggers are suspended
+# meanwhile and the search index rebuilt in one pass at the end. The same seed always builds the same data.
+#
+# Who owns, uses or rates things follows --distribution: "uniform", or "zipf" where a few users write and rate most
+# recipes and a few foods appear in most dishes, pantries and lists. Per-parent counts (ingredients per recipe,
+# items per pantry...) are uniform between 0 and twice the given mean.
+#
+# Usage (from the repository root, against the database configured in .env):
+#   python -m benchmarks.generate_data --users 10000 --recipes 50000
+#   python -m benchmarks.generate_data --users 100 --recipes 200 --distribution uniform --seed 7
+
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from operator import itemgetter
+
+from sqlalchemy import func, select
+
+from app import create_app, db
+from models import (User, Recipe, Rating, FoodItem, QuantifiedFoodItem, Ingredient, PantryItem, ShoppingList,
+                    ShoppingItem, Barcode, format_food_name, rating_prior)
+from nutrition_util import read_calories_file, link_food_items
+from search_index import resume_triggers, suspend_triggers
+from users.password_util import hash_password
+
+BATCH_SIZE = 20000
+DISTRIBUTIONS = ('uniform', 'zipf')
+PASSWORD = 'Password1!'
+START_DATE = datetime(2024, 1, 1)
+
+_FIRST_NAMES = ('Alice', 'Ben', 'Chloe', 'Dev', 'Ella', 'Femi', 'Grace', 'Hiro', 'Isla', 'Jack', 'Kai', 'Lena')
+_LAST_NAMES = ('Jones', 'Smith', 'Patel', 'Nguyen', 'Okafor', 'Garcia', 'Kowalski', 'Chen', 'Murphy', 'Silva')
+_STYLES = ('Roast', 'Spicy', 'Creamy', 'Grilled', 'Baked', 'Quick', 'Slow Cooked', 'Summer', 'Stuffed', 'Crispy')
+_LIST_NAMES = ('Weekly Shop', 'Monday Shop', 'Butchery', 'Bakery', 'Green Grocers', 'Farmers Market', 'Party')
+_UNITS = ('g', 'g', 'g', 'ml', 'kg', 'l')
+
+
+class Picker:
+    """Draws ids either uniformly or with Zipf weights (the i-th most popular id has weight 1 / i ** skew). Which
+    ids are popular is shuffled, so it does not follow id order."""
+
+    def __init__(self, rng, ids, distribution='zipf', skew=1.1):
+        self.rng = rng
+        self.ids = list(ids)
+        self.cum_weights = None
+        if distribution == 'zipf':
+            rng.shuffle(self.ids)
+            self.cum_weights = list(accumulate(1 / (rank + 1) ** skew for rank in range(len(self.ids))))
+
+    def pick(self, k=1) -> list:
+        return self.rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+    # Method to draw up to k different ids
+    def pick_distinct(self, k) -> list:
+        k = min(k, len(self.ids))
+        chosen = set()
+        for _ in range(10):
+            chosen.update(self.pick(k - len(chosen)))
+            if len(chosen) >= k:
+                return list(chosen)[:k]
+        # Rarely drawn ids are slow to hit with Zipf weights, top up uniformly
+        rest = [i for i in self.ids if i not in chosen]
+        return list(chosen) + self.rng.sample(rest, k - len(chosen))
+
+
+class _Writer:
+    """Buffers rows per table and allocates their primary keys. Tables are flushed in dependency order, so foreign
+    keys always point at rows that were inserted first."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.rows = {}
+        self.next_ids = {}
+        self.counts = {}
+
+    def next_id(self, model) -> int:
+        if model not in self.next_ids:
+            self.next_ids[model] = (db.session.scalar(select(func.max(model.id))) or 0) + 1
+        model_id = self.next_ids[model]
+        self.next_ids[model] += 1
+        return model_id
+
+    def add(self, model, **row) -> None:
+        self.rows.setdefault(model, []).append(row)
+        if len(self.rows[model]) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for table in db.metadata.sorted_tables:
+            for model, rows in self.rows.items():
+                if model.__table__ is table and rows:
+                    self._insert(table, rows)
+                    self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+                    rows.clear()
+
+    # The statement is compiled once per batch and the rows go straight to the driver's executemany. Building
+    # SQLAlchemy's per-row parameters would take longer than the inserts themselves.
+    @staticmethod
+    def _insert(table, rows) -> None:
+        connection = db.session.connection()
+        compiled = table.insert().compile(dialect=connection.dialect, column_keys=list(rows[0]))
+        if compiled.positional:
+            rows = list(map(itemgetter(*compiled.positiontup), rows))
+        connection.exec_driver_sql(compiled.string, rows)
+
+
+def _count(rng, mean) -> int:
+    return rng.randint(0, 2 * mean) if mean > 0 else 0
+
+
+def _date(rng, days=365) -> datetime:
+    return START_DATE + timedelta(seconds=rng.randrange(days * 24 * 60 * 60))
+
+
+# Recipe.rating as the app stores it (models._average_rating): the average rounded half up to the nearest 0.5, 0
+# without ratings
+def _rounded_average(rating_sum, rating_count) -> float:
+    return math.floor(rating_sum * 2 / rating_count + 0.5) / 2 if rating_count else 0
+
+
+# Method to make sure a FoodItem exists for every food in calories.txt. Returns {food id: name} for all food items.
+def _food_names(writer) -> dict:
+    existing = {name: food_id for food_id, name in db.session.execute(select(FoodItem.id, FoodItem.name))}
+    for name, _, _, _ in read_calories_file():
+        name = format_food_name(name)[:50]
+        if name and name not in existing:
+            existing[name] = writer.next_id(FoodItem)
+            writer.add(FoodItem, id=existing[name], name=name, description='Generated food item')
+    return {food_id: name for name, food_id in sorted(existing.items(), key=lambda item: item[1])}
+
+
+def _qfood(writer, rng, food_id) -> int:
+    qfood_id = writer.next_id(QuantifiedFoodItem)
+    writer.add(QuantifiedFoodItem, id=qfood_id, food_id=food_id, quantity=float(rng.choice((20, 50, 100, 200, 500))),
+               units=rng.choice(_UNITS))
+    return qfood_id
+
+
+# Method to generate a data set. Returns {table name: rows inserted}.
+def generate(users=1000, recipes=5000, ingredients_per_recipe=6, ratings_per_recipe=4, pantry_items=8, lists=2,
+             list_items=6, barcodes=1000, distribution='zipf', skew=1.1, seed=0, batch_size=BATCH_SIZE) -> dict:
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution: {distribution}")
+    rng = random.Random(seed)
+    writer = _Writer(batch_size)
+    password = hash_password(PASSWORD)      # One hash shared by every generated user, bcrypt is slow on purpose
+    connection = db.session.connection()
+    suspend_triggers(connection)
+
+    food_names = _food_names(writer)
+    food_picker = Picker(rng, food_names, distribution, skew)
+
+    user_ids = []
+    for _ in range(users):
+        user_id = writer.next_id(User)
+        user_ids.append(user_id)
+        registered_on = _date(rng)
+        logins = rng.randint(0, 200)
+        writer.add(User, id=user_id, email=f'user{user_id}@example.com', password=password,
+                   first_name=rng.choice(_FIRST_NAMES), last_name=rng.choice(_LAST_NAMES),
+                   dob=f'{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2006)}', role='user',
+                   registered_on=registered_on, total_logins=logins,
+                   current_login=registered_on + timedelta(days=rng.randint(0, 60)) if logins else None,
+                   current_login_ip=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+                   if logins else None)
+    if not user_ids:
+        writer.flush()
+        resume_triggers(connection)
+        db.session.commit()
+        return writer.counts
+    user_picker = Picker(rng, user_ids, distribution, skew)
+    prior_mean, prior_weight = rating_prior()
+
+    for owner_id in user_picker.pick(recipes):
+        recipe_id = writer.next_id(Recipe)
+        food_ids = food_picker.pick(max(1, _count(rng, ingredients_per_recipe)))
+        # Ratings are drawn first so the recipe row can carry their average and totals
+        ratings = [(rater_id, rng.randint(0, 5))
+                   for rater_id in user_picker.pick_distinct(_count(rng, ratings_per_recipe))]
+        rating_sum = sum(rating for _, rating in ratings)
+        writer.add(Recipe, id=recipe_id, user_id=owner_id,
+                   name=f'{rng.choice(_STYLES)} {food_names[food_ids[0]]}'[:50],
+                   method='\n'.join(f'Step {step}: prepare and cook.' for step in range(1, rng.randint(2, 8))),
+                   serves=rng.choice((1, 2, 4, 6)), calories=rng.randint(150, 1500),
+                   rating=_rounded_average(rating_sum, len(ratings)), rating_sum=rating_sum,
+                   rating_count=len(ratings),
+                   weighted_rating=(rating_sum + prior_mean * prior_weight) / (len(ratings) + prior_weight))
+        for food_id in food_ids:
+            writer.add(Ingredient, id=writer.next_id(Ingredient), recipe_id=recipe_id,
+                       qfood_id=_qfood(writer, rng, food_id))
+        for rater_id, rating in ratings:
+            writer.add(Rating, user_id=rater_id, recipe_id=recipe_id, rating=rating)
+
+    for user_id in user_ids:
+        for food_id in food_picker.pick(_count(rng, pantry_items)):
+            writer.add(PantryItem, id=writer.next_id(PantryItem), user_id=user_id,
+                       qfood_id=_qfood(writer, rng, food_id), expiry=_date(rng, 500).strftime('%Y-%m-%d'),
+                       calories=rng.randint(20, 800))
+        for _ in range(_count(rng, lists)):
+            list_id = writer.next_id(ShoppingList)
+            writer.add(ShoppingList, id=list_id, user_id=user_id, list_name=rng.choice(_LIST_NAMES))
+            for food_id in food_picker.pick(_count(rng, list_items)):
+                writer.add(ShoppingItem, id=writer.next_id(ShoppingItem), list_id=list_id,
+                           qfood_id=str(_qfood(writer, rng, food_id)))
+
+    for food_id in food_picker.pick(barcodes):
+        writer.add(Barcode, id=writer.next_id(Barcode), qfood_id=_qfood(writer, rng, food_id),
+                   barcode=''.join(rng.choice('0123456789') for _ in range(13)))
+
+    writer.flush()
+    resume_triggers(connection)
+    link_food_items()
+    db.session.commit()
+    return writer.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fill the database with seeded synthetic data for load testing.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--ingredients', type=int, default=6, help='Mean ingredients per recipe')
+    parser.add_argument('--ratings', type=int, default=4, help='Mean ratings per recipe')
+    parser.add_argument('--pantry-items', type=int, default=8, help='Mean pantry items per user')
+    parser.add_argument('--lists', type=int, default=2, help='Mean shopping lists per user')
+    parser.add_argument('--list-items', type=int, default=6, help='Mean items per shopping list')
+    parser.add_argument('--barcodes', type=int, default=1000)
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='zipf')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        db.engine.echo = False          # Logging a million parameter sets would take longer than inserting them
+        start = time.perf_counter()
+        counts = generate(users=args.users, recipes=args.recipes, ingredients_per_recipe=args.ingredients,
+                          ratings_per_recipe=args.ratings, pantry_items=args.pantry_items, lists=args.lists,
+                          list_items=args.list_items, barcodes=args.barcodes, distribution=args.distribution,
+                          skew=args.skew, seed=args.seed, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+    for table, count in sorted(counts.items()):
+        print(f'{table:20} {count:>10}')
+    total = sum(counts.values())
+    print(f'{"total":20} {total:>10} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
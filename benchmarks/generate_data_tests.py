@@ -0,0 +1,83 @@
+# Test file for generate_data.py
+
+import unittest
+from collections import Counter
+
+from sqlalchemy import select
+
+import models
+import search_index
+from app import db
+from benchmarks import generate_data as gd
+from testing_util import DatabaseTestCase
+
+
+class TestGenerateData(DatabaseTestCase):
+
+    def generate(self, **kwargs) -> dict:
+        options = dict(users=40, recipes=120, barcodes=30, seed=3, batch_size=100)
+        options.update(kwargs)
+        return gd.generate(**options)
+
+    def snapshot(self):
+        return (db.session.execute(select(models.Recipe.user_id, models.Recipe.name, models.Recipe.rating)
+                                   .order_by(models.Recipe.id)).all(),
+                db.session.execute(select(models.PantryItem.user_id, models.PantryItem.expiry)
+                                   .order_by(models.PantryItem.id)).all())
+
+    def test_rows_are_consistent(self) -> None:
+        existing_users = models.User.query.count()
+        counts = self.generate()
+        self.assertEqual((counts['users'], counts['recipes'], counts['barcodes']), (40, 120, 30))
+        self.assertEqual(models.User.query.count(), existing_users + 40)
+        self.assertEqual(counts['quantifiedfooditem'], counts['ingredients'] + counts['pantryitems'] +
+                         counts['shoppingitems'] + counts['barcodes'])
+
+        qfood_ids = set(db.session.scalars(select(models.QuantifiedFoodItem.id)))
+        self.assertTrue(set(db.session.scalars(select(models.Ingredient.qfood_id))) <= qfood_ids)
+        self.assertTrue({int(i) for i in db.session.scalars(select(models.ShoppingItem.qfood_id))} <= qfood_ids)
+        # The recipes' ratings and totals are what the app itself works out from the ratings
+        aggregates = select(models.Recipe.id, models.Recipe.rating, models.Recipe.rating_sum,
+                            models.Recipe.rating_count, models.Recipe.weighted_rating).order_by(models.Recipe.id)
+        generated = db.session.execute(aggregates).all()
+        models.recompute_rating_aggregates()
+        self.assertEqual(db.session.execute(aggregates).all(), generated)
+        self.assertIn(0, [row.rating for row in generated])
+        # Generated foods are linked to their nutrition data
+        self.assertIsNotNone(models.FoodItem.query.filter_by(name='Strawberries').first().nutrition)
+
+    def test_search_index_is_rebuilt(self) -> None:
+        self.generate()
+        recipe = models.Recipe.query.order_by(models.Recipe.id.desc()).first()
+        food_name = recipe.ingredients[-1].qfooditem.fooditem.name
+        matches = search_index.recipe_matches(food_name, columns=('ingredients',))
+        self.assertIn(recipe.id, db.session.scalars(select(matches.c.recipe_id)).all())
+        # The triggers are back, so rows written afterwards are indexed as they are written
+        recipe.name = 'Zzyzx Stew'
+        db.session.flush()
+        matches = search_index.recipe_matches('zzyzx', columns=('name',))
+        self.assertEqual(db.session.scalars(select(matches.c.recipe_id)).all(), [recipe.id])
+
+    def test_same_seed_builds_same_data(self) -> None:
+        self.generate()
+        first = self.snapshot()
+        self.reset()
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+        self.reset()
+        self.generate(seed=4)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_distributions(self) -> None:
+        self.generate(users=100, recipes=1000, distribution='zipf')
+        zipf_top = Counter(db.session.scalars(select(models.Recipe.user_id))).most_common(1)[0][1]
+        self.reset()
+        self.generate(users=100, recipes=1000, distribution='uniform')
+        uniform_top = Counter(db.session.scalars(select(models.Recipe.user_id))).most_common(1)[0][1]
+        self.assertGreater(zipf_top, 3 * uniform_top)
+        with self.assertRaises(ValueError):
+            self.generate(distribution='normal')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,407 @@
+# End-to-end HTTP benchmark: drives the real routes through scripted user journeys and reports latency
+# percentiles, requests per second and SQL statements per journey, optionally compared against a stored baseline.
+#
+# Journeys (each one is a short sequence of requests made by a logged in virtual user):
+#   login                    POST /user/login
+#   view_pantry              GET  /pantry/items
+#   filter_recipes           GET  /recipes/recipes?can_make=true
+#   use_recipe               POST /recipes/use_recipe/<id>
+#   complete_shopping_list   create a list, add items, POST /shopping/complete_list/<id>
+#   scan_barcode             GET  /pantry/get-barcode-data?filepath=<sample image>
+#
+# Requests go through Flask's test client (--server test) or over HTTP to a threaded WSGI server started in this process
+# (--server wsgi). --server dev and --server gunicorn serve the app from a separate process, through the development
+# server (`flask run`) or gunicorn with gunicorn.conf.py, to compare the two. Data is built with generate_data.py in a
+# scratch database (never the one in .env unless --database-uri points at it), and the Wikipedia / FoodKeeper crawlers
+# are stubbed, so it runs offline.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.http_benchmark --iterations 20 --save-baseline benchmark_baseline.json
+#   python -m benchmarks.http_benchmark --server wsgi --concurrency 4 --baseline benchmark_baseline.json
+#   python -m benchmarks.http_benchmark --server dev --concurrency 8 --save-baseline dev_server.json
+#   python -m benchmarks.http_benchmark --server gunicorn --concurrency 8 --baseline dev_server.json
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import requests
+from sqlalchemy import event
+
+from benchmarks import generate_data
+
+JOURNEYS = ('login', 'view_pantry', 'filter_recipes', 'use_recipe', 'complete_shopping_list', 'scan_barcode')
+SERVERS = ('test', 'wsgi', 'dev', 'gunicorn')
+# Servers run in their own process on {port}, serving the app set up by serve_target.py
+SERVE_TARGET = 'benchmarks.serve_target:app'
+SERVER_COMMANDS = {
+    'dev': ['-m', 'flask', '--app', SERVE_TARGET, 'run', '--host', '127.0.0.1', '--port', '{port}'],
+    'gunicorn': ['-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', '127.0.0.1:{port}', SERVE_TARGET],
+}
+SERVER_START_TIMEOUT = 60
+BARCODE_IMAGE = os.path.join('barcodes', 'barcode_test_data', 'barcode_sample_1.png')
+BARCODE_VALUE = '0512345000107'
+SQL_HEADER = 'X-SQL-Statements'
+# Stand-in for the FoodKeeper data (crawler.fetch_food_storage_info)
+STORAGE_INFO = {'Milk': '1 week', 'Bread': '5 days', 'Apples': '3 weeks', 'Rice': '6 months', 'Chicken': '2 days'}
+# Metrics where a higher value is worse, compared against the baseline per journey
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'sql_per_journey')
+DEFAULT_TOLERANCE = 0.10
+
+
+class SqlCounter:
+    """Counts the SQL statements executed while handling each request and returns the count in a response header,
+    so it reaches the client whether the request was served in this thread or by the WSGI server."""
+
+    def __init__(self, app, engine):
+        self.local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+        app.before_request_funcs.setdefault(None, []).insert(0, self._reset)
+        app.after_request(self._report)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def _reset(self):
+        self.local.count = 0
+
+    def _report(self, response):
+        response.headers[SQL_HEADER] = str(getattr(self.local, 'count', 0))
+        return response
+
+
+class Client:
+    """One virtual user's session, through the test client or over HTTP. Records every request it makes."""
+
+    def __init__(self, app, base_url=None):
+        self.base_url = base_url
+        self.session = requests.Session() if base_url else app.test_client()
+        self.requests = []          # (path, status, latency in seconds, SQL statements)
+
+    def request(self, method, path, data=None, expected=(200, 302)):
+        start = time.perf_counter()
+        if self.base_url:
+            response = self.session.request(method, self.base_url + path, data=data, allow_redirects=False)
+            status, headers = response.status_code, response.headers
+        else:
+            response = self.session.open(path, method=method, data=data)
+            status, headers = response.status_code, response.headers
+        latency = time.perf_counter() - start
+        self.requests.append((path, status, latency, int(headers.get(SQL_HEADER, 0))))
+        if status not in expected:
+            raise RuntimeError(f'{method} {path} returned {status}')
+        return headers
+
+
+def journey_login(client, user):
+    client.request('POST', '/user/login', {'email': user['email'], 'password': generate_data.PASSWORD})
+
+
+def journey_view_pantry(client, user):
+    client.request('GET', '/pantry/items')
+
+
+def journey_filter_recipes(client, user):
+    client.request('GET', '/recipes/recipes?can_make=true')
+
+
+def journey_use_recipe(client, user):
+    client.request('POST', f'/recipes/use_recipe/{user["recipe_id"]}')
+
+
+def journey_complete_shopping_list(client, user):
+    headers = client.request('POST', '/shopping/create_shopping_list', {'listName': 'Benchmark Shop'})
+    list_id = int(headers['Location'].rstrip('/').rsplit('/', 1)[-1])
+    for food in user['shopping']:
+        client.request('POST', f'/shopping/shopping_list_detail/{list_id}',
+                       {'newItem': food, 'itemQuantity': 2, 'itemUnits': 'g'})
+    client.request('POST', f'/shopping/complete_list/{list_id}')
+
+
+def journey_scan_barcode(client, user):
+    client.request('GET', f'/pantry/get-barcode-data?filepath={os.path.abspath(BARCODE_IMAGE)}', expected=(200,))
+
+
+_JOURNEY_FUNCTIONS = {name: globals()[f'journey_{name}'] for name in JOURNEYS}
+
+
+# Method to build the benchmark data set in the app's database, which is emptied first: generated users and
+# recipes, a pantry for every virtual user that holds everything one recipe needs (so use_recipe and can_make have
+# something to find) and the sample barcode. Returns one dict per virtual user.
+def prepare(app, users=50, recipes=200, virtual_users=1, seed=0) -> list:
+    with app.app_context():
+        return _prepare(users, recipes, virtual_users, seed)
+
+
+def _prepare(users, recipes, virtual_users, seed) -> list:
+    import models
+    from app import db
+
+    models.init_db()
+    generate_data.generate(users=max(users, virtual_users), recipes=max(recipes, 1), barcodes=0, seed=seed)
+    rng = random.Random(seed)
+    food_names = [name for name, in db.session.execute(db.select(models.FoodItem.name).limit(500))]
+    recipe_ids = list(db.session.scalars(db.select(models.Recipe.id)))
+
+    accounts = []
+    user_query = db.select(models.User).where(models.User.email.like('user%@example.com')).order_by(models.User.id)
+    for user in db.session.scalars(user_query.limit(virtual_users)).all():
+        recipe = db.session.get(models.Recipe, rng.choice(recipe_ids))
+        for ingredient in recipe.ingredients:
+            qfood_id = models.create_and_get_qfid(ingredient.qfooditem.food_id, 10 ** 9, ingredient.get_units())
+            db.session.add(models.PantryItem(user_id=user.id, qfood_id=qfood_id, expiry='2099-01-01', calories=100))
+        accounts.append({'email': user.email, 'recipe_id': recipe.id, 'shopping': rng.sample(food_names, 3)})
+
+    qfood_id = models.create_and_get_qfid(models.create_or_get_food_item(food_names[0]).id, 500, 'g')
+    db.session.add(models.Barcode(qfood_id, BARCODE_VALUE))
+    db.session.commit()
+    return accounts
+
+
+def percentile(values, fraction) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(samples, elapsed, request_count) -> dict:
+    journeys = {}
+    for name in JOURNEYS:
+        runs = [sample for sample in samples if sample['journey'] == name]
+        if not runs:
+            continue
+        durations = [sample['seconds'] * 1000 for sample in runs if not sample['error']]
+        journeys[name] = {
+            'count': len(runs),
+            'errors': sum(1 for sample in runs if sample['error']),
+            'p50_ms': round(percentile(durations, 0.50), 3),
+            'p95_ms': round(percentile(durations, 0.95), 3),
+            'p99_ms': round(percentile(durations, 0.99), 3),
+            'mean_ms': round(sum(durations) / len(durations), 3) if durations else 0.0,
+            'requests_per_journey': round(sum(sample['requests'] for sample in runs) / len(runs), 2),
+            'sql_per_journey': round(sum(sample['sql'] for sample in runs) / len(runs), 2),
+        }
+    return {'journeys': journeys, 'requests': request_count, 'seconds': round(elapsed, 3),
+            'requests_per_second': round(request_count / elapsed, 2) if elapsed else 0.0}
+
+
+def _run_user(client, user, journeys, iterations, samples, lock):
+    for _ in range(iterations):
+        for name in journeys:
+            first_request = len(client.requests)
+            start = time.perf_counter()
+            error = None
+            try:
+                _JOURNEY_FUNCTIONS[name](client, user)
+            except Exception as e:      # Recorded with the journey, a failed request should not stop the run
+                error = str(e)
+            made = client.requests[first_request:]
+            with lock:
+                samples.append({'journey': name, 'seconds': time.perf_counter() - start, 'error': error,
+                                'requests': len(made), 'sql': sum(request[3] for request in made)})
+
+
+@contextlib.contextmanager
+def _serve(app, server):
+    if server == 'test':
+        yield None
+        return
+    if server in SERVER_COMMANDS:
+        with _serve_process(server) as base_url:
+            yield base_url
+        return
+    from werkzeug.serving import make_server
+    httpd = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{httpd.server_port}'
+    finally:
+        httpd.shutdown()
+        thread.join()
+
+
+@contextlib.contextmanager
+def _serve_process(server):
+    with socket.socket() as free:
+        free.bind(('127.0.0.1', 0))
+        port = free.getsockname()[1]
+    command = [sys.executable] + [part.format(port=port) for part in SERVER_COMMANDS[server]]
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryFile() as output:
+        process = subprocess.Popen(command, stdout=output, stderr=subprocess.STDOUT)
+        try:
+            _wait_until_serving(server, process, base_url, output)
+            yield base_url
+        finally:
+            process.terminate()         # Graceful shutdown, in-flight requests are finished first
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def _wait_until_serving(server, process, base_url, output) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            output.seek(0)
+            tail = output.read().decode(errors='replace')[-2000:]
+            raise RuntimeError(f'The {server} server exited with {process.returncode}:\n{tail}')
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'The {server} server did not start within {SERVER_START_TIMEOUT}s')
+
+
+@contextlib.contextmanager
+def stub_crawlers():
+    with patch('models.fetch_wikipedia_description', return_value='Benchmark food item'), \
+            patch('shopping.shopping_util.fetch_food_storage_info', return_value=STORAGE_INFO):
+        yield
+
+
+# Method to run every journey `iterations` times for each virtual user, in parallel. `warmup` iterations are run
+# first and not recorded. The app should have been set up with install_counter(). Returns the summary.
+def run_benchmark(app, accounts, journeys=JOURNEYS, iterations=10, server='test', warmup=1, quiet=True) -> dict:
+    unknown = set(journeys) - set(JOURNEYS)
+    if unknown:
+        raise ValueError(f"Unknown journeys: {', '.join(sorted(unknown))}")
+    samples, lock = [], threading.Lock()
+    with contextlib.ExitStack() as stack:
+        if quiet:       # The routes print debugging output, keep it out of the report
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        stack.enter_context(stub_crawlers())
+        base_url = stack.enter_context(_serve(app, server))
+        clients = [Client(app, base_url) for _ in accounts]
+        for client, user in zip(clients, accounts):
+            journey_login(client, user)
+            _run_user(client, user, journeys, warmup, [], lock)
+            client.requests.clear()
+
+        threads = [threading.Thread(target=_run_user, args=(client, user, journeys, iterations, samples, lock))
+                   for client, user in zip(clients, accounts)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    return summarize(samples, elapsed, sum(len(client.requests) for client in clients))
+
+
+# Returns the URI of a new SQLite file in a temporary directory, for a database that can be thrown away
+def scratch_database_uri() -> str:
+    return 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='benchmark'), 'benchmark.db')
+
+
+# Method to set an app up for benchmarking: SQL counting, no CSRF tokens and no rate limits.
+def install_counter(app) -> SqlCounter:
+    from app import db
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+    with app.app_context():
+        db.engine.echo = False
+        return SqlCounter(app, db.engine)
+
+
+# Method to compare a summary with a baseline. Returns a row per journey and metric, with `regressed` set when the
+# metric got worse by more than `tolerance` (a fraction).
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE) -> list:
+    rows = []
+    for name, current in results['journeys'].items():
+        before = baseline.get('journeys', {}).get(name)
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric, 0), current.get(metric, 0)
+            change = (new - old) / old if old else 0.0
+            rows.append({'journey': name, 'metric': metric, 'baseline': old, 'current': new,
+                         'change': round(change, 4), 'regressed': change > tolerance})
+    old_rps, new_rps = baseline.get('requests_per_second', 0), results['requests_per_second']
+    change = (new_rps - old_rps) / old_rps if old_rps else 0.0
+    rows.append({'journey': 'all', 'metric': 'requests_per_second', 'baseline': old_rps, 'current': new_rps,
+                 'change': round(change, 4), 'regressed': change < -tolerance})
+    return rows
+
+
+def print_report(results, comparison=None) -> None:
+    print(f"{'journey':24} {'runs':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req':>5} {'sql':>7}")
+    for name, row in results['journeys'].items():
+        print(f"{name:24} {row['count']:>6} {row['errors']:>6} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['requests_per_journey']:>5.1f} {row['sql_per_journey']:>7.1f}")
+    print(f"{results['requests']} requests in {results['seconds']:.2f}s, "
+          f"{results['requests_per_second']:.1f} requests/s")
+    if comparison:
+        print('\nCompared with baseline:')
+        for row in comparison:
+            flag = '  REGRESSION' if row['regressed'] else ''
+            print(f"{row['journey']:24} {row['metric']:20} {row['baseline']:>10} -> {row['current']:>10} "
+                  f"({row['change']:+.1%}){flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the app through scripted user journeys.')
+    parser.add_argument('--server', choices=SERVERS, default='test')
+    parser.add_argument('--journeys', default=','.join(JOURNEYS))
+    parser.add_argument('--iterations', type=int, default=10, help='Runs of every journey per virtual user')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=1, help='Virtual users running at the same time')
+    parser.add_argument('--users', type=int, default=50, help='Generated users in the data set')
+    parser.add_argument('--recipes', type=int, default=200, help='Generated recipes in the data set')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-uri', help='Database to fill and benchmark (default: a scratch SQLite file)')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--baseline', help='Compare with results saved by --save-baseline')
+    parser.add_argument('--save-baseline', help='Save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed slowdown before a metric counts as a regression (0.1 = 10%%)')
+    args = parser.parse_args(argv)
+
+    # Must be set before the app reads its configuration
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database_uri or scratch_database_uri()
+    os.environ['PURGE_ENABLED'] = 'false'
+    from app import create_app
+
+    app = create_app()
+    install_counter(app)
+    accounts = prepare(app, args.users, args.recipes, args.concurrency, args.seed)
+    results = run_benchmark(app, accounts, tuple(args.journeys.split(',')), args.iterations, args.server,
+                            args.warmup)
+    results['settings'] = {key: value for key, value in vars(args).items()
+                           if key in ('server', 'iterations', 'concurrency', 'users', 'recipes', 'seed')}
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline, args.tolerance)
+        if baseline.get('settings') != results['settings']:
+            print(f"Note: the baseline was recorded with different settings: {baseline.get('settings')}")
+    print_report(results, comparison)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+    if comparison and any(row['regressed'] for row in comparison):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
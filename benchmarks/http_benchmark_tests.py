@@ -0,0 +1,86 @@
+# Test file for http_benchmark.py
+
+import importlib.util
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from app import create_app, db
+from benchmarks import http_benchmark as hb
+from config import TestingConfig
+
+
+class TestHttpBenchmark(unittest.TestCase):
+
+    # Runs on a scratch SQLite file rather than the rolled back in-memory database of testing_util.DatabaseTestCase,
+    # as the WSGI server threads and the dev / gunicorn processes need a database they can all open. The URI is also
+    # put in the environment, which is where those processes read it from, along with a LOG_PATH in the scratch
+    # directory so they don't append to app.log.
+    @classmethod
+    def setUpClass(cls) -> None:
+        uri = hb.scratch_database_uri()
+        cls.directory = os.path.dirname(uri[len('sqlite:///'):])
+        environment = patch.dict(os.environ, {'SQLALCHEMY_DATABASE_URI': uri, 'PURGE_ENABLED': 'false',
+                                              'LOG_PATH': os.path.join(cls.directory, 'app.log')})
+        environment.start()
+        cls.addClassCleanup(environment.stop)
+
+        class BenchmarkConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = uri
+            SQLALCHEMY_ENGINE_OPTIONS = None
+
+        cls.app = create_app(BenchmarkConfig)
+        hb.install_counter(cls.app)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        with cls.app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self) -> None:
+        self.accounts = hb.prepare(self.app, users=5, recipes=10, virtual_users=2, seed=1)
+
+    def test_journeys_through_test_client(self) -> None:
+        results = hb.run_benchmark(self.app, self.accounts[:1], iterations=2, warmup=0)
+        self.assertEqual(set(results['journeys']), set(hb.JOURNEYS))
+        for name, row in results['journeys'].items():
+            self.assertEqual((row['count'], row['errors']), (2, 0), msg=name)
+            self.assertGreater(row['sql_per_journey'], 0, msg=name)
+        self.assertEqual(results['journeys']['complete_shopping_list']['requests_per_journey'], 5)
+        self.assertGreater(results['requests_per_second'], 0)
+
+    def test_journeys_through_wsgi_server(self) -> None:
+        results = hb.run_benchmark(self.app, self.accounts, journeys=('view_pantry', 'scan_barcode'), iterations=2,
+                                   server='wsgi', warmup=0)
+        self.assertEqual(results['requests'], 8)
+        self.assertEqual(sum(row['errors'] for row in results['journeys'].values()), 0)
+        with self.assertRaises(ValueError):
+            hb.run_benchmark(self.app, self.accounts, journeys=('checkout',))
+
+    @unittest.skipIf(importlib.util.find_spec('gunicorn') is None, 'gunicorn is not installed')
+    def test_journeys_through_server_processes(self) -> None:
+        for server in ('dev', 'gunicorn'):
+            results = hb.run_benchmark(self.app, self.accounts[:1], journeys=('view_pantry', 'use_recipe'),
+                                       iterations=2, server=server, warmup=0)
+            self.assertEqual(sum(row['errors'] for row in results['journeys'].values()), 0, msg=server)
+            self.assertGreater(results['journeys']['use_recipe']['sql_per_journey'], 0, msg=server)
+
+    def test_compare_with_baseline(self) -> None:
+        journey = {'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 30, 'sql_per_journey': 5}
+        baseline = {'journeys': {'view_pantry': journey}, 'requests_per_second': 100}
+        results = {'journeys': {'view_pantry': dict(journey, p95_ms=25, sql_per_journey=5.2)},
+                   'requests_per_second': 80}
+        regressed = {(row['journey'], row['metric']) for row in hb.compare(results, baseline, tolerance=0.1)
+                     if row['regressed']}
+        self.assertEqual(regressed, {('view_pantry', 'p95_ms'), ('all', 'requests_per_second')})
+
+    def test_percentile(self) -> None:
+        self.assertEqual(hb.percentile([4, 1, 3, 2, 5], 0.5), 3)
+        self.assertAlmostEqual(hb.percentile(list(range(1, 101)), 0.99), 99.01)
+        self.assertEqual(hb.percentile([], 0.95), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
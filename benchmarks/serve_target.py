@@ -0,0 +1,10 @@
+# WSGI target for http_benchmark.py --server dev / gunicorn, which serve the app from a separate process: the
+# production app from wsgi.py with the SQL statement counter installed and CSRF, rate limits and the crawlers off,
+# exactly as the in-process benchmark runs it.
+
+from benchmarks.http_benchmark import install_counter, stub_crawlers
+from wsgi import app
+
+install_counter(app)
+_crawler_stubs = stub_crawlers()     # Kept referenced, the patches are undone when it is garbage collected
+_crawler_stubs.__enter__()
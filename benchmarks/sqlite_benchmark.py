@@ -0,0 +1,144 @@
+# Concurrent writers against one SQLite file, before and after the tuning in sqlite_util.py.
+# Each worker process builds the app, as a gunicorn worker would, and then runs transactions like the pantry and
+# shopping routes do: read a page of quantified food items, create one (models.create_and_get_qfid) and change its
+# quantity (QuantifiedFoodItem.set_quantity). Every mode runs in a fresh database file:
+#   before   SQLite's defaults (rollback journal, synchronous=FULL) and no retries
+#   after    the SQLITE_* settings in config.py: WAL, synchronous=NORMAL, busy_timeout, caches and retry_on_busy
+# The report shows transactions per second, latency percentiles and how many transactions failed with
+# "database is locked".
+#
+# Usage (from the repository root):
+#   python -m benchmarks.sqlite_benchmark --processes 4 --transactions 200
+#   python -m benchmarks.sqlite_benchmark --processes 8 --modes after --json sqlite_after.json
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.http_benchmark import percentile
+
+MODES = {
+    'before': {'SQLITE_PRAGMAS': 'false', 'SQLITE_BUSY_RETRIES': '0'},
+    'after': {},
+}
+FOODS = 20
+READ_LIMIT = 200
+
+_app = None
+_barrier = None
+
+
+# Settings shared by every mode: a quiet production app without background work
+def _environment(database_path, mode) -> dict:
+    environ = {'APP_CONFIG': 'production', 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database_path}',
+               'PURGE_ENABLED': 'false', 'NUTRITION_AUTOLOAD': 'false', 'LOG_LEVEL': 'WARNING'}
+    environ.update(MODES[mode])
+    return environ
+
+
+def _start_worker(environ, barrier) -> None:
+    global _app, _barrier
+    os.environ.update(environ)
+    from app import create_app
+    _app = create_app()
+    _barrier = barrier
+
+
+# Method to create the schema and the food items the writers use, in a process of its own
+def _prepare() -> None:
+    from app import db
+    from models import FoodItem
+    with _app.app_context():
+        for number in range(FOODS):
+            db.session.add(FoodItem(food_name=f'Benchmark Food {number}', description='Benchmark food item'))
+        db.session.commit()
+
+
+# Method to run one worker's transactions once every worker is ready. Returns (latencies, errors).
+def _run_writer(transactions, seed):
+    from sqlalchemy.exc import OperationalError
+    from app import db
+    from models import QuantifiedFoodItem, create_and_get_qfid
+    from sqlite_util import is_busy
+
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    with _app.app_context():
+        _barrier.wait()
+        for _ in range(transactions):
+            start = time.perf_counter()
+            try:
+                QuantifiedFoodItem.query.order_by(QuantifiedFoodItem.id.desc()).limit(READ_LIMIT).all()
+                qfood_id = create_and_get_qfid(rng.randint(1, FOODS), rng.choice((50, 100, 200)), 'g')
+                db.session.get(QuantifiedFoodItem, qfood_id).set_quantity(rng.randint(1, 1000))
+                latencies.append(time.perf_counter() - start)
+            except OperationalError as e:
+                if not is_busy(e):
+                    raise
+                errors += 1
+                db.session.rollback()
+            db.session.remove()         # As at the end of a request
+    return latencies, errors
+
+
+def run_mode(mode, processes=4, transactions=200, seed=0) -> dict:
+    directory = tempfile.mkdtemp(prefix='sqlite_benchmark')
+    environ = _environment(os.path.join(directory, 'benchmark.db'), mode)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=context, initializer=_start_worker,
+                             initargs=(environ, context.Barrier(1))) as executor:
+        executor.submit(_prepare).result()
+
+    barrier = context.Barrier(processes + 1)
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=_start_worker,
+                             initargs=(environ, barrier)) as executor:
+        futures = [executor.submit(_run_writer, transactions, seed + worker) for worker in range(processes)]
+        barrier.wait()
+        start = time.perf_counter()
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for worker_latencies, _ in results for latency in worker_latencies]
+    return {'mode': mode, 'processes': processes, 'transactions': processes * transactions,
+            'committed': len(latencies), 'locked_errors': sum(errors for _, errors in results),
+            'seconds': round(elapsed, 3), 'transactions_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5), 2), 'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2)}
+
+
+def print_report(results) -> None:
+    print(f"{'mode':8} {'procs':>5} {'committed':>10} {'locked':>7} {'tx/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8}")
+    for row in results:
+        print(f"{row['mode']:8} {row['processes']:>5} {row['committed']:>10} {row['locked_errors']:>7} "
+              f"{row['transactions_per_second']:>8.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+              f"{row['p99_ms']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark concurrent writers on SQLite before and after tuning.')
+    parser.add_argument('--processes', type=int, default=4, help='Worker processes writing at the same time')
+    parser.add_argument('--transactions', type=int, default=200, help='Transactions per worker')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args(argv)
+
+    modes = args.modes.split(',')
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(sorted(unknown))}")
+    results = [run_mode(mode, args.processes, args.transactions, args.seed) for mode in modes]
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+# Cache for the results of read-only queries, shared by every request of a worker process or, with CACHE_URL set to
+# a redis:// URL (memory:// for the in-process stand-in, see local_redis.py), by every worker.
+# Functions are cached with the memoize decorator of the Cache in app.py:
+#
+#   @cache.memoize(ttl=600, tags=lambda recipe_id: (f'recipes:{recipe_id}',))
+#   def recipe_ingredients(recipe_id): ...
+#
+# Each result is kept for ttl seconds (a number, or the name of a config setting) and is keyed by the function's
+# arguments, so cached functions should return plain values (dicts, tuples, numbers), not ORM objects.
+#
+# Tags name the rows a result depends on: the table name ('recipes') for any change to a table and
+# '<table>:<id>' for one row. Every tag has a random token, stored alongside the results. A result is saved with the
+# tokens its tags had before it was computed and is only used while they are unchanged. Invalidating a tag deletes
+# its token and the next reader creates a new one, so every result depending on it becomes stale at once without
+# finding and deleting them.
+# Committing a session invalidates the tags of every row it inserted, updated or deleted. A row's tags are its table,
+# the row itself and the rows its foreign keys point to, so a new ingredient also invalidates 'recipes:<recipe_id>'.
+# Bulk INSERT, UPDATE and DELETE statements invalidate their whole table. The listeners are registered in models.py.
+
+import functools
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import inspect
+
+from local_redis import get_redis
+
+DEFAULT_TTL = 300               # seconds
+DEFAULT_MAX_ENTRIES = 10000
+TAG_TTL = 24 * 60 * 60          # seconds a tag's token is kept, once gone its results are stale
+_TAG_PREFIX = 'tag:'
+
+
+class MemoryBackend:
+    """Least recently used entries held in this process, each with its own expiry time."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self._clock = clock
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()       # key -> (expires_at, value)
+
+    def get_many(self, keys) -> list:
+        now = self._clock()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                values.append(entry[1] if entry else None)
+        return values
+
+    # Method to store a value for ttl seconds. With only_new, an existing entry is kept. Returns whether it was stored.
+    def set(self, key, value, ttl, only_new=False) -> bool:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if only_new and entry is not None and entry[0] > now:
+                return False
+            self._entries[key] = (now + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def delete(self, *keys) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Entries shared by every worker through Redis, which expires them itself."""
+
+    def __init__(self, client, prefix='cache:'):
+        self._client = client
+        self._prefix = prefix
+
+    def get_many(self, keys) -> list:
+        return self._client.mget([self._prefix + key for key in keys])
+
+    def set(self, key, value, ttl, only_new=False) -> bool:
+        return bool(self._client.set(self._prefix + key, value, ex=max(int(ttl), 1), nx=only_new))
+
+    def delete(self, *keys) -> None:
+        self._client.delete(*(self._prefix + key for key in keys))
+
+    def clear(self) -> None:
+        keys = list(self._client.scan_iter(match=self._prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+class Cache:
+    def __init__(self):
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    # Method to get the backend for the current app's CACHE_URL. Like the rate limiter's, backends are kept for the
+    # life of the process.
+    def backend(self):
+        url = current_app.config.get('CACHE_URL') or ''
+        with self._lock:
+            if url not in self._backends:
+                self._backends[url] = RedisBackend(get_redis(url)) if url else \
+                    MemoryBackend(current_app.config.get('CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+            return self._backends[url]
+
+    @staticmethod
+    def enabled() -> bool:
+        return has_app_context() and current_app.config.get('CACHE_ENABLED', True)
+
+    # Method to cache a function's results, see the top of this file. tags is a list of tags or a function of the
+    # cached function's arguments returning one. The function's own name is always a tag, so its results can be
+    # dropped with func.invalidate(). func.uncached calls it without the cache.
+    def memoize(self, ttl=None, tags=()):
+        def decorator(func):
+            name = f'{func.__module__}.{func.__qualname__}'
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled():
+                    return func(*args, **kwargs)
+                key = f'{name}:{_key_for(args, kwargs)}'
+                func_tags = (name,) + tuple(tags(*args, **kwargs) if callable(tags) else tags)
+                tokens, value = self._read(key, func_tags)
+                if value is not _MISSING:
+                    return value
+                value = func(*args, **kwargs)
+                self._write(key, value, _ttl(ttl), tokens)
+                return value
+
+            wrapper.uncached = func
+            wrapper.invalidate = lambda: self.invalidate(name)
+            return wrapper
+        return decorator
+
+    # Method to make every cached result depending on any of the tags stale
+    def invalidate(self, *tags) -> None:
+        if tags and has_app_context():
+            self.backend().delete(*(_TAG_PREFIX + tag for tag in set(tags)))
+
+    def clear(self) -> None:
+        with self._lock:
+            backends = list(self._backends.values())
+        for backend in backends:
+            backend.clear()
+
+    # Reads the entry and the current tokens of its tags in one round trip. Tags without a token are given one.
+    # Returns (tokens, cached value or _MISSING).
+    def _read(self, key, tags):
+        backend = self.backend()
+        tag_keys = [_TAG_PREFIX + tag for tag in tags]
+        entry, *tokens = backend.get_many([key] + tag_keys)
+        for i, token in enumerate(tokens):
+            if token is None:
+                backend.set(tag_keys[i], _new_token(), TAG_TTL, only_new=True)
+                tokens[i] = backend.get_many([tag_keys[i]])[0]
+        tokens = tuple(zip(tags, tokens))
+
+        if entry is not None:
+            entry_tokens, value = pickle.loads(entry)
+            if entry_tokens == tokens:
+                return tokens, value
+        return tokens, _MISSING
+
+    def _write(self, key, value, ttl, tokens) -> None:
+        if ttl > 0 and None not in (token for _, token in tokens):
+            self.backend().set(key, pickle.dumps((tokens, value)), ttl)
+
+
+_MISSING = object()
+
+
+def _ttl(ttl) -> float:
+    if ttl is None:
+        return current_app.config.get('CACHE_DEFAULT_TTL', DEFAULT_TTL)
+    if isinstance(ttl, str):
+        return current_app.config.get(ttl, DEFAULT_TTL)
+    return ttl
+
+
+def _new_token() -> bytes:
+    return os.urandom(8).hex().encode()
+
+
+def _key_for(args, kwargs) -> str:
+    return repr((args, sorted(kwargs.items())))
+
+
+# Method to get the tags of a row written by a session: its table, the row and the rows its foreign keys point to.
+# Only loaded values are used, so this never emits SQL.
+def row_tags(instance) -> set:
+    state = inspect(instance)
+    table = state.mapper.local_table
+    values = {column: state.dict.get(state.mapper.get_property_by_column(column).key) for column in table.columns}
+    tags = {table.name}
+    primary_key = [values[column] for column in table.primary_key]
+    if None not in primary_key:
+        tags.add(f"{table.name}:{':'.join(str(value) for value in primary_key)}")
+    for column, value in values.items():
+        if value is not None:
+            tags.update(f'{foreign_key.column.table.name}:{value}' for foreign_key in column.foreign_keys)
+    return tags
+
+
+# Session event listener (after_flush). Records the tags of the flushed rows until the transaction ends.
+def collect_flushed(session, flush_context) -> None:
+    tags = session.info.setdefault('cache_tags', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        tags.update(row_tags(instance))
+
+
+# Session event listener (do_orm_execute). Bulk INSERT, UPDATE and DELETE statements don't flush, the whole table is
+# tagged.
+def collect_bulk(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            orm_execute_state.session.info.setdefault('cache_tags', set()).add(table.name)
+
+
+# Session event listener (after_commit).
+def invalidate_committed(session) -> None:
+    from app import cache
+    cache.invalidate(*session.info.pop('cache_tags', ()))
+
+
+# Session event listener (after_rollback).
+def discard_uncommitted(session) -> None:
+    session.info.pop('cache_tags', None)
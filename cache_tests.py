@@ -0,0 +1,176 @@
+# Test file for cache.py
+
+import unittest
+
+from flask import current_app
+
+import models
+from app import db, cache
+from barcodes.barcode_util import find_barcode
+from cache import MemoryBackend, RedisBackend, row_tags
+from local_redis import LocalRedis
+from recipes.recipe_util import find_recipes, recipe_ingredients
+from testing_util import DatabaseTestCase
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestCacheBackends(unittest.TestCase):
+
+    def test_memory_backend_expiry_and_lru(self) -> None:
+        clock = FakeClock()
+        backend = MemoryBackend(max_entries=2, clock=clock)
+        backend.set('a', b'1', 10)
+        backend.set('b', b'2', 60)
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), [b'1', b'2', None])
+
+        # 'b' was read after 'a', so 'a' is the least recently used
+        backend.get_many(['b'])
+        backend.set('c', b'3', 60)
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), [None, b'2', b'3'])
+
+        clock.now += 61
+        self.assertEqual(backend.get_many(['b', 'c']), [None, None])
+
+    def test_memory_backend_only_new(self) -> None:
+        backend = MemoryBackend()
+        self.assertTrue(backend.set('a', b'1', 10, only_new=True))
+        self.assertFalse(backend.set('a', b'2', 10, only_new=True))
+        backend.delete('a')
+        self.assertTrue(backend.set('a', b'3', 10, only_new=True))
+        self.assertEqual(backend.get_many(['a']), [b'3'])
+
+    def test_redis_backend(self) -> None:
+        client = LocalRedis()
+        client.set('ratelimit:ip:1', 1)
+        backend = RedisBackend(client)
+        backend.set('a', b'1', 10)
+        self.assertFalse(backend.set('a', b'2', 10, only_new=True))
+        self.assertEqual(backend.get_many(['a', 'b']), [b'1', None])
+        self.assertEqual(client.ttl('cache:a'), 10)
+
+        # Only the cache's own keys are cleared
+        backend.clear()
+        self.assertEqual(backend.get_many(['a']), [None])
+        self.assertEqual(client.get('ratelimit:ip:1'), b'1')
+
+
+class TestMemoize(DatabaseTestCase):
+    cache_url = None
+
+    def setUp(self) -> None:
+        super().setUp()
+        current_app.config['CACHE_URL'] = self.cache_url
+        self.calls = []
+
+        @cache.memoize(tags=lambda name: ('things', f'things:{name}'))
+        def lookup(name):
+            self.calls.append(name)
+            return {'name': name, 'calls': len(self.calls)}
+        self.lookup = lookup
+
+    def test_results_cached_per_arguments(self) -> None:
+        self.assertEqual(self.lookup('a'), {'name': 'a', 'calls': 1})
+        self.assertEqual(self.lookup('a'), {'name': 'a', 'calls': 1})
+        self.assertEqual(self.lookup('b'), {'name': 'b', 'calls': 2})
+        self.assertEqual(self.calls, ['a', 'b'])
+
+    def test_invalidate_tags(self) -> None:
+        self.lookup('a')
+        self.lookup('b')
+        cache.invalidate('things:a')
+        self.lookup('a')
+        self.lookup('b')
+        self.assertEqual(self.calls, ['a', 'b', 'a'])
+
+        # A table tag makes every result depending on it stale, and so does the function's own tag
+        cache.invalidate('things')
+        self.lookup('b')
+        self.lookup.invalidate()
+        self.lookup('b')
+        self.assertEqual(self.calls, ['a', 'b', 'a', 'b', 'b'])
+
+    def test_disabled(self) -> None:
+        current_app.config['CACHE_ENABLED'] = False
+        self.lookup('a')
+        self.lookup('a')
+        self.assertEqual(self.calls, ['a', 'a'])
+
+
+class TestMemoizeLocalRedis(TestMemoize):
+    cache_url = 'memory://cache-tests'
+
+
+class TestModelInvalidation(DatabaseTestCase):
+
+    def add_recipe(self, name) -> models.Recipe:
+        recipe = models.Recipe(user_id=2, recipe_name=name, cooking_method='Mix', serves=1, calories=100)
+        db.session.add(recipe)
+        db.session.commit()
+        return recipe
+
+    def recipe_names(self, **filters) -> list:
+        return [recipe['name'] for recipe in find_recipes(**filters)]
+
+    def test_row_tags(self) -> None:
+        recipe = self.add_recipe('Toast')
+        ingredient = models.Ingredient(recipe_id=recipe.id, qfood_id=7)
+        self.assertEqual(row_tags(ingredient), {'ingredients', f'recipes:{recipe.id}', 'quantifiedfooditem:7'})
+        db.session.add(ingredient)
+        db.session.flush()
+        self.assertIn(f'ingredients:{ingredient.id}', row_tags(ingredient))
+
+    def test_commit_invalidates_recipe_list(self) -> None:
+        before = self.recipe_names()
+        self.add_recipe('Zzz Toast')
+        self.assertEqual(self.recipe_names(), before + ['Zzz Toast'])
+
+        # Uncommitted changes leave the cached result alone
+        db.session.add(models.Recipe(user_id=2, recipe_name='Zzz Porridge', cooking_method='Boil', serves=1,
+                                     calories=100))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.recipe_names(), before + ['Zzz Toast'])
+
+    def test_bulk_delete_invalidates_table(self) -> None:
+        recipe = self.add_recipe('Toast')
+        self.assertIn('Toast', self.recipe_names())
+        models.Recipe.query.filter_by(id=recipe.id).delete()
+        db.session.commit()
+        self.assertNotIn('Toast', self.recipe_names())
+
+    def test_new_ingredient_invalidates_recipe_ingredients(self) -> None:
+        recipe = self.add_recipe('Toast')
+        self.assertEqual(recipe_ingredients(recipe.id), [])
+        qfood_id = models.create_and_get_qfid(models.create_or_get_food_item('Bread').id, 2, 'g')
+        db.session.add(models.Ingredient(recipe_id=recipe.id, qfood_id=qfood_id))
+        db.session.commit()
+        self.assertEqual([tuple(row) for row in recipe_ingredients(recipe.id)], [('Bread', 2, 'g')])
+
+    def test_ingredient_changes_invalidate_recipe_ingredients(self) -> None:
+        recipe = self.add_recipe('Toast')
+        qfood_id = models.create_and_get_qfid(models.create_or_get_food_item('Bread').id, 2, 'g')
+        ingredient = models.Ingredient(recipe_id=recipe.id, qfood_id=qfood_id)
+        db.session.add(ingredient)
+        db.session.commit()
+        self.assertEqual([tuple(row) for row in recipe_ingredients(recipe.id)], [('Bread', 2, 'g')])
+        ingredient.set_quantity(3)
+        ingredient.set_units('slices')
+        self.assertEqual([tuple(row) for row in recipe_ingredients(recipe.id)], [('Bread', 3, 'slices')])
+
+    def test_barcode_lookup(self) -> None:
+        self.assertIsNone(find_barcode('5000'))
+        qfood_id = models.create_and_get_qfid(models.create_or_get_food_item('Milk').id, 500, 'ml')
+        db.session.add(models.Barcode(qfood_id, '5000'))
+        db.session.commit()
+        self.assertEqual(find_barcode('5000'), {'name': 'Milk', 'quantity': 500, 'units': 'ml'})
+
+
+if __name__ == '__main__':
+    unittest.main()
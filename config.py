@@ -0,0 +1,222 @@
+# Configuration profiles for create_app(config=...): DevelopmentConfig, TestingConfig and ProductionConfig. The
+# profile can be passed as a class or by name, and defaults to the APP_CONFIG environment variable ('development'
+# unless set, wsgi.py defaults to 'production').
+# Every setting is a typed class attribute. An environment variable (or .env entry) with the same name overrides
+# it and is converted to the attribute's type, so a deployment is tuned without editing code, e.g.
+#   APP_CONFIG=production SQLALCHEMY_POOL_SIZE=20 CACHE_URL=redis://redis:6379/0 gunicorn -c gunicorn.conf.py wsgi:app
+# SQLALCHEMY_ENGINE_OPTIONS is built from the SQLALCHEMY_POOL_* settings unless a profile sets it (it can't be set
+# from the environment).
+
+import os
+import typing
+
+from sqlalchemy.pool import StaticPool
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    # Settings are read from the environment unless this is False
+    read_environment = True
+    # Whether the profile is served by several worker processes (gunicorn), which only share a cache through CACHE_URL
+    multiprocess = False
+
+    SECRET_KEY: typing.Optional[str] = None
+    ENCRYPTION_KEY: typing.Optional[str] = None
+    RECAPTCHA_PUBLIC_KEY: typing.Optional[str] = None
+    RECAPTCHA_PRIVATE_KEY: typing.Optional[str] = None
+
+    SQLALCHEMY_DATABASE_URI: str = 'sqlite:///database.db'
+    SQLALCHEMY_ECHO: bool = False
+    SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
+    SQLALCHEMY_ENGINE_OPTIONS: typing.Optional[dict] = None
+    # Connection pool: connections kept open, extra ones allowed under load, seconds to wait for a free connection,
+    # seconds before a connection is replaced (-1 never) and whether to test a connection before using it. SQLite
+    # in-memory databases only use the last two.
+    SQLALCHEMY_POOL_SIZE: int = 5
+    SQLALCHEMY_MAX_OVERFLOW: int = 10
+    SQLALCHEMY_POOL_TIMEOUT: int = 30
+    SQLALCHEMY_POOL_RECYCLE: int = -1
+    SQLALCHEMY_POOL_PRE_PING: bool = False
+    # Milliseconds a single statement may run before the database cancels it (PostgreSQL only). 0 disables it.
+    SQLALCHEMY_STATEMENT_TIMEOUT: int = 0
+    # Pragmas run on every new SQLite connection (sqlite_util.py). SQLITE_PRAGMAS=false keeps SQLite's defaults.
+    # The cache size is in KiB when negative (-64000 = 64 MB per connection), the mmap size in bytes.
+    SQLITE_PRAGMAS: bool = True
+    SQLITE_JOURNAL_MODE: str = 'WAL'
+    SQLITE_SYNCHRONOUS: str = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    SQLITE_CACHE_SIZE: int = -64000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_TEMP_STORE: str = 'MEMORY'
+    # Times a write transaction is rerun when the database is locked (sqlite_util.retry_on_busy)
+    SQLITE_BUSY_RETRIES: int = 3
+
+    # File the app's records are written to (logging_util.py), unset to write no log file. The admin log viewer
+    # reads it and its rotated backups.
+    LOG_PATH: typing.Optional[str] = 'app.log'
+    # Level of the records written to LOG_PATH, and whether the app rotates the file itself. Turn rotation off where
+    # several processes write the file and leave it to logrotate.
+    LOG_LEVEL: str = 'INFO'
+    LOG_ROTATE: bool = True
+    # Shared store for caches and rate limits, e.g. redis://redis:6379/0 (or memory:// for the in-process stand-in,
+    # see local_redis.py). Unset, every worker process keeps its own.
+    CACHE_URL: typing.Optional[str] = None
+    # Cached query results (cache.py): seconds they are kept for unless a function sets its own, and the number of
+    # entries each worker keeps when CACHE_URL is unset
+    CACHE_ENABLED: bool = True
+    CACHE_DEFAULT_TTL: int = 300
+    CACHE_MAX_ENTRIES: int = 10000
+    # A worker's own cache is only invalidated by that worker's commits. Where several workers run without CACHE_URL,
+    # results are kept for at most this many seconds, so a write shows up everywhere soon after.
+    CACHE_UNSHARED_TTL: int = 5
+
+    # Where session data is kept (users/session_store.py): 'database', 'redis' (SESSION_REDIS_URL, defaults to
+    # CACHE_URL) or 'cookie' for Flask's signed cookie
+    SESSION_STORE: str = 'database'
+    SESSION_REDIS_URL: typing.Optional[str] = None
+
+    # Seconds an authenticated user is served from the per-process cache (users/user_cache.py). 0 disables it.
+    USER_CACHE_TTL: int = 30
+    # Password hashing (users/password_util.py): bcrypt cost factor, worker threads, maximum queued jobs and seconds
+    # a request waits for its job
+    BCRYPT_LOG_ROUNDS: int = 12
+    BCRYPT_MAX_WORKERS: int = 2
+    BCRYPT_MAX_PENDING: int = 32
+    BCRYPT_TIMEOUT: float = 10.0
+    # Rate limits for expensive endpoints (rate_limit.py). The storage URL defaults to CACHE_URL.
+    RATELIMIT_ENABLED: bool = True
+    RATELIMIT_STORAGE_URL: typing.Optional[str] = None
+    RATELIMIT_LOGIN: str = '10/minute'
+    RATELIMIT_REGISTER: str = '5/minute'
+    RATELIMIT_BARCODES: str = '30/minute'
+    # Soft deleted recipes, shopping lists and users can be restored for SOFT_DELETE_RETENTION seconds, after which
+    # the purger (purge_util.py) removes them in batches every PURGE_INTERVAL seconds
+    SOFT_DELETE_RETENTION: int = 24 * 60 * 60
+    PURGE_ENABLED: bool = True
+    PURGE_INTERVAL: int = 5 * 60
+    PURGE_BATCH_SIZE: int = 50
+    PURGE_BATCH_PAUSE: float = 0.2
+    # Recipes are ranked by a Bayesian average of their ratings (models.Recipe.weighted_rating): their ratings plus
+    # RATING_PRIOR_WEIGHT ratings of RATING_PRIOR_MEAN. Run models.recompute_rating_aggregates() after changing them.
+    RATING_PRIOR_MEAN: float = 3.0
+    RATING_PRIOR_WEIGHT: int = 5
+    # Ratings are buffered in memory and written in batches every RATING_BUFFER_INTERVAL seconds, or once
+    # RATING_BUFFER_MAX_SIZE are waiting (recipes/rating_buffer.py). RATING_BUFFER_FLUSH_ON_EXIT writes what is left
+    # when the process exits.
+    RATING_BUFFER_ENABLED: bool = True
+    RATING_BUFFER_INTERVAL: float = 1.0
+    RATING_BUFFER_MAX_SIZE: int = 500
+    RATING_BUFFER_FLUSH_ON_EXIT: bool = True
+    # Recipe and pantry searches use SQLite's FTS5 full-text index (search_index.py). False searches with LIKE instead.
+    SEARCH_FTS_ENABLED: bool = True
+    # Seconds the aggregate user statistics on the admin page are cached for (admin/admin_util.py)
+    ADMIN_STATS_TTL: int = 60
+    # Load calories.txt into the nutrition table on start up if it is empty (nutrition_util.py)
+    NUTRITION_AUTOLOAD: bool = True
+
+
+class DevelopmentConfig(Config):
+    """python app.py / flask run: every SQL statement is logged."""
+
+    SQLALCHEMY_ECHO = True
+
+
+class TestingConfig(Config):
+    """The test suite (testing_util.py): a private in-memory database, cheap password hashes, no background work
+    and no log file. Ignores the environment, so tests never touch the database in .env or app.log."""
+
+    read_environment = False
+
+    TESTING = True
+    SECRET_KEY = 'testing'
+    WTF_CSRF_ENABLED = False
+    # One connection shared by every session and thread, so they all see the same in-memory database. SQLite
+    # starts its own transactions (and ends them on SAVEPOINT) unless isolation_level is None, testing_util sends
+    # BEGIN instead.
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {'poolclass': StaticPool,
+                                 'connect_args': {'check_same_thread': False, 'isolation_level': None}}
+    BCRYPT_LOG_ROUNDS = 4
+    RATELIMIT_ENABLED = False
+    PURGE_ENABLED = False
+    RATING_BUFFER_ENABLED = False
+    LOG_PATH = None
+
+
+class ProductionConfig(Config):
+    """gunicorn (wsgi.py): no statement logging, connections checked and recycled before the database or a
+    firewall drops them, static files cached by browsers and app.log left to logrotate. Without CACHE_URL cached
+    results are only kept for CACHE_UNSHARED_TTL seconds and gunicorn.conf.py runs a single worker."""
+
+    SQLALCHEMY_POOL_SIZE = 10
+    SQLALCHEMY_MAX_OVERFLOW = 20
+    SQLALCHEMY_POOL_RECYCLE = 30 * 60
+    SQLALCHEMY_POOL_PRE_PING = True
+    SQLALCHEMY_STATEMENT_TIMEOUT = 30 * 1000
+    SEND_FILE_MAX_AGE_DEFAULT = 12 * 60 * 60
+    TEMPLATES_AUTO_RELOAD = False
+    # Every gunicorn worker appends to app.log, rotating it is left to logrotate
+    LOG_ROTATE = False
+
+    multiprocess = True
+
+
+PROFILES = {'development': DevelopmentConfig, 'testing': TestingConfig, 'production': ProductionConfig}
+
+
+# Method to convert an environment variable to the type of the setting it overrides
+def _parse(value: str, kind):
+    if typing.get_origin(kind) is typing.Union:           # Optional[...]
+        if value == '':
+            return None
+        kind = next(arg for arg in typing.get_args(kind) if arg is not type(None))
+    if kind is bool:
+        return value.strip().lower() in _TRUE
+    if kind in (int, float):
+        return kind(value)
+    return value
+
+
+# Method to build the engine options from the pool settings
+def engine_options(settings: dict) -> dict:
+    uri = settings['SQLALCHEMY_DATABASE_URI'] or ''
+    options = {'pool_pre_ping': settings['SQLALCHEMY_POOL_PRE_PING'],
+               'pool_recycle': settings['SQLALCHEMY_POOL_RECYCLE']}
+    in_memory = uri.startswith('sqlite') and (uri.rstrip('/') in ('sqlite:', 'sqlite:///:memory:')
+                                              or 'mode=memory' in uri)
+    if not in_memory:               # Only the queue pool used for files and servers has a size
+        options.update(pool_size=settings['SQLALCHEMY_POOL_SIZE'], max_overflow=settings['SQLALCHEMY_MAX_OVERFLOW'],
+                       pool_timeout=settings['SQLALCHEMY_POOL_TIMEOUT'])
+    if uri.startswith('postgresql') and settings['SQLALCHEMY_STATEMENT_TIMEOUT'] > 0:
+        options['connect_args'] = {'options': f"-c statement_timeout={settings['SQLALCHEMY_STATEMENT_TIMEOUT']}"}
+    return options
+
+
+# Method to get the settings of a profile (a Config subclass or its name, APP_CONFIG when None), with the
+# environment applied. Returns a dict for app.config.
+def load(config=None) -> dict:
+    if config is None:
+        config = os.getenv('APP_CONFIG', 'development')
+    if isinstance(config, str):
+        if config not in PROFILES:
+            raise ValueError(f"Unknown config profile: {config} (expected one of {', '.join(PROFILES)})")
+        config = PROFILES[config]
+
+    # Dicts are copied, so an app can't change the profile's
+    settings = {key: dict(value) if isinstance(value, dict) else value
+                for key, value in ((key, getattr(config, key)) for key in dir(config) if key.isupper())}
+    if config.read_environment:
+        for key, kind in typing.get_type_hints(config).items():
+            value = os.getenv(key)
+            if value is not None and dict not in (kind,) + typing.get_args(kind):
+                settings[key] = _parse(value, kind)
+    if settings['SQLALCHEMY_ENGINE_OPTIONS'] is None:
+        settings['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(settings)
+    if config.multiprocess and not settings['CACHE_URL']:
+        settings['CACHE_DEFAULT_TTL'] = min(settings['CACHE_DEFAULT_TTL'], settings['CACHE_UNSHARED_TTL'])
+    if settings['RATELIMIT_STORAGE_URL'] is None:
+        settings['RATELIMIT_STORAGE_URL'] = settings['CACHE_URL']
+    return settings
@@ -0,0 +1,59 @@
+# Test file for config.py
+
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy.pool import StaticPool
+
+import config
+
+
+class TestConfig(unittest.TestCase):
+
+    def test_profiles_by_name_and_class(self) -> None:
+        with patch.dict('os.environ', {'APP_CONFIG': 'production'}):
+            self.assertEqual(config.load()['SQLALCHEMY_POOL_SIZE'], 10)
+        self.assertTrue(config.load('development')['SQLALCHEMY_ECHO'])
+        self.assertFalse(config.load(config.ProductionConfig)['SQLALCHEMY_ECHO'])
+        with self.assertRaises(ValueError):
+            config.load('staging')
+
+    def test_environment_overrides_are_typed(self) -> None:
+        environ = {'SQLALCHEMY_POOL_SIZE': '20', 'SQLALCHEMY_POOL_PRE_PING': 'false', 'PURGE_BATCH_PAUSE': '0.5',
+                   'RATELIMIT_STORAGE_URL': '', 'CACHE_URL': 'memory://', 'LOG_LEVEL': 'warning',
+                   'BCRYPT_TIMEOUT': '2.5'}
+        with patch.dict('os.environ', environ):
+            settings = config.load('production')
+        self.assertEqual(settings['SQLALCHEMY_POOL_SIZE'], 20)
+        self.assertIs(settings['SQLALCHEMY_POOL_PRE_PING'], False)
+        self.assertEqual(settings['PURGE_BATCH_PAUSE'], 0.5)
+        self.assertEqual(settings['LOG_LEVEL'], 'warning')
+        self.assertEqual(settings['BCRYPT_TIMEOUT'], 2.5)
+        # An empty storage URL falls back to the shared cache
+        self.assertEqual(settings['RATELIMIT_STORAGE_URL'], 'memory://')
+
+    def test_workers_without_shared_cache_get_short_ttl(self) -> None:
+        with patch.dict('os.environ', {'CACHE_URL': ''}):
+            self.assertEqual(config.load('production')['CACHE_DEFAULT_TTL'], 5)
+            self.assertEqual(config.load('development')['CACHE_DEFAULT_TTL'], 300)
+        with patch.dict('os.environ', {'CACHE_URL': 'redis://redis:6379/0'}):
+            self.assertEqual(config.load('production')['CACHE_DEFAULT_TTL'], 300)
+
+    def test_engine_options(self) -> None:
+        with patch.dict('os.environ', {'SQLALCHEMY_DATABASE_URI': 'postgresql://db/pantry'}):
+            options = config.load('production')['SQLALCHEMY_ENGINE_OPTIONS']
+        self.assertEqual(options, {'pool_pre_ping': True, 'pool_recycle': 1800, 'pool_size': 10, 'max_overflow': 20,
+                                   'pool_timeout': 30, 'connect_args': {'options': '-c statement_timeout=30000'}})
+        with patch.dict('os.environ', {'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'}):
+            self.assertNotIn('pool_size', config.load('development')['SQLALCHEMY_ENGINE_OPTIONS'])
+
+    def test_testing_ignores_environment(self) -> None:
+        with patch.dict('os.environ', {'SQLALCHEMY_DATABASE_URI': 'sqlite:///database.db'}):
+            settings = config.load('testing')
+        self.assertEqual(settings['SQLALCHEMY_DATABASE_URI'], 'sqlite://')
+        self.assertIs(settings['SQLALCHEMY_ENGINE_OPTIONS']['poolclass'], StaticPool)
+        self.assertIsNot(settings['SQLALCHEMY_ENGINE_OPTIONS'], config.TestingConfig.SQLALCHEMY_ENGINE_OPTIONS)
+
+
+if __name__ == '__main__':
+    unittest.main()
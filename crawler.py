@@ -1,27 +1,115 @@
+import codecs
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import quote
+
 import requests
 from bs4 import BeautifulSoup
 
+from crawler_calories import make_session
+
+WIKIPEDIA_URL = "https://en.wikipedia.org"
+WIKIPEDIA_TIMEOUT = 10
+WIKIPEDIA_WORKERS = 8
+NO_DESCRIPTION = "No description available."
+CHUNK_SIZE = 16 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Method to get the session shared by all description lookups, so connections to Wikipedia are reused. Failed
+# lookups are not retried, a missing description is not worth holding up the request.
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = make_session(WIKIPEDIA_WORKERS, retries=0)
+    return _session
+
+
+class FirstParagraphParser(HTMLParser):
+    """Collects the text of the first non-empty <p> of a page. `done` is set as soon as it has been read, so the
+    caller can stop feeding (and downloading) the rest of the page."""
+
+    def __init__(self):
+        super().__init__()
+        self.in_paragraph = False
+        self.parts = []
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'p' and not self.done:
+            self.in_paragraph = True
+            self.parts = []
+
+    def handle_endtag(self, tag):
+        if tag == 'p' and self.in_paragraph and not self.done:
+            self.in_paragraph = False
+            self.done = bool(self.text())
+
+    def handle_data(self, data):
+        if self.in_paragraph and not self.done:
+            self.parts.append(data)
 
-def fetch_wikipedia_description(food_name):
-    url = f"https://en.wikipedia.org/wiki/{food_name.replace(' ', '_')}"
+    def text(self) -> str:
+        return ''.join(self.parts).strip()
+
+
+def _title(food_name):
+    return quote(food_name.strip().replace(' ', '_'), safe='')
+
+
+# Method to get a food's summary from the REST API (a small JSON document instead of the rendered article).
+# Returns None if there is no usable summary.
+def _fetch_summary(session, food_name, base_url, timeout):
+    response = session.get(f"{base_url}/api/rest_v1/page/summary/{_title(food_name)}", timeout=timeout,
+                           headers={'Accept': 'application/json'})
+    if response.status_code != 200:
+        return None
     try:
-        response = requests.get(url, timeout=10)
+        return response.json().get('extract', '').strip() or None
+    except ValueError:
+        return None
+
+
+# Method to read the first paragraph of the article, stopping the download as soon as it has been parsed.
+def _fetch_first_paragraph(session, food_name, base_url, timeout):
+    with session.get(f"{base_url}/wiki/{_title(food_name)}", timeout=timeout, stream=True) as response:
         response.raise_for_status()
-    except requests.RequestException:
-        return "No description available."
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        parser = FirstParagraphParser()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            parser.feed(decoder.decode(chunk))
+            if parser.done:
+                break
+        return parser.text() if parser.done else None
+
 
-    soup = BeautifulSoup(response.content, 'html.parser')
-    description = ""
+def fetch_wikipedia_description(food_name, session=None, base_url=WIKIPEDIA_URL, timeout=WIKIPEDIA_TIMEOUT):
+    session = session or get_session()
+    try:
+        description = (_fetch_summary(session, food_name, base_url, timeout)
+                       or _fetch_first_paragraph(session, food_name, base_url, timeout))
+    except requests.RequestException:
+        return NO_DESCRIPTION
+    return description or NO_DESCRIPTION
 
-    for paragraph in soup.find_all('p'):
-        if paragraph.text.strip():
-            description = paragraph.text.strip()
-            break
 
-    if not description:
-        description = "No description available."
+# Method to fetch the descriptions of many foods concurrently. Returns {food name: description}.
+def fetch_wikipedia_descriptions(food_names, session=None, base_url=WIKIPEDIA_URL, timeout=WIKIPEDIA_TIMEOUT,
+                                 max_workers=WIKIPEDIA_WORKERS):
+    session = session or get_session()
+    food_names = list(dict.fromkeys(food_names))
+    if not food_names:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(food_names))) as executor:
+        descriptions = executor.map(lambda name: fetch_wikipedia_description(name, session, base_url, timeout),
+                                    food_names)
+        return dict(zip(food_names, descriptions))
 
-    return description
 
 def fetch_food_storage_info():
     url = "https://www.foodsafety.gov/keep-food-safe/foodkeeper-app"
@@ -1,21 +1,57 @@
+# Crawler for the calories.txt dataset ("food name,serving size in grams,calories" per line), read by
+# fetch_calories_from_file() in shopping/shopping_util.py.
+# Category pages are fetched concurrently over one pooled requests.Session with timeouts and retries. The ETag /
+# Last-Modified of every category is kept in calories_state.json together with its rows, so a refresh sends
+# conditional GETs and only parses categories that changed. calories.txt and the state file are replaced
+# atomically, and calories.txt is only rewritten when its contents changed and every category's rows are known: a
+# category that fails without cached rows leaves the existing file as it is.
+
+import argparse
+import json
+import os
 import re
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 BASE_URL = "https://www.calories.info"
-
-
-def fetch_category_links():
-    response = requests.get(BASE_URL)
+OUTPUT_PATH = 'calories.txt'
+STATE_PATH = 'calories_state.json'
+MAX_WORKERS = 8
+TIMEOUT = 10        # seconds, for connecting and for each read
+RETRIES = 3
+
+
+# Method to create the shared session. Connections are pooled for max_workers threads, and connection errors and
+# 429/5xx responses are retried with exponential backoff.
+def make_session(max_workers: int = MAX_WORKERS, retries: int = RETRIES, backoff: float = 0.5) -> requests.Session:
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(['GET']), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_category_links(session=None, base_url=BASE_URL, timeout=TIMEOUT):
+    response = (session or requests).get(base_url, timeout=timeout)
+    response.raise_for_status()
     soup = BeautifulSoup(response.text, 'html.parser')
     categories_section = soup.find_all('div', {'class': 'MuiBox-root css-10ib5jr'})
-    category_links = [BASE_URL + a['href'] for div in categories_section for a in div.find_all('a') if 'food' in a['href']]
+    category_links = [base_url + a['href'] for div in categories_section for a in div.find_all('a') if 'food' in a['href']]
     return category_links
 
 
-def fetch_calorie_info(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+# Method to extract (food name, serving size, calories) rows from a category page's table.
+def parse_calorie_table(html):
+    soup = BeautifulSoup(html, 'html.parser')
 
     data = []
     table_rows = soup.select('table tr')
@@ -34,33 +70,128 @@ def fetch_calorie_info(url):
     return data
 
 
-def save_to_file(data):
-    with open('calories.txt', 'w', encoding='utf-8') as f:
-        for item in data:
-            f.write(f"{item[0]},{item[1]},{item[2]}\n")
+def fetch_calorie_info(url, session=None, timeout=TIMEOUT):
+    response = (session or requests).get(url, timeout=timeout)
+    response.raise_for_status()
+    return parse_calorie_table(response.text)
+
+
+# Method to fetch one category, sending the validators from its cached entry (if any).
+# Returns (entry, status) where status is 'changed', 'unchanged' or 'failed'. A failed category keeps its
+# cached entry.
+def fetch_category(session, url, cached=None, timeout=TIMEOUT):
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            return cached, 'unchanged'
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Error fetching {url}: {e}")
+        return cached, 'failed'
+
+    entry = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'rows': [list(row) for row in parse_calorie_table(response.text)],
+    }
+    if cached and entry['rows'] == cached.get('rows'):
+        return entry, 'unchanged'
+    return entry, 'changed'
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'categories': {}}
+
+
+# Method to replace a file's contents atomically: readers see either the old or the new file, never a partial one.
+# The file keeps its permissions (mkstemp creates files only the owner can read), a new one is made 0644.
+def write_atomic(path, content) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def format_rows(category_links, categories):
+    return ''.join(f"{name},{serving},{calories}\n"
+                   for url in category_links if url in categories
+                   for name, serving, calories in categories[url]['rows'])
+
+
+# Method to bring the dataset up to date. Returns counts of changed, unchanged and failed categories, whether
+# calories.txt was rewritten and the categories whose rows are missing (failed, with nothing cached), in which case
+# it is not.
+def refresh(base_url=BASE_URL, output_path=OUTPUT_PATH, state_path=STATE_PATH, max_workers=MAX_WORKERS,
+            timeout=TIMEOUT, session=None):
+    session = session or make_session(max_workers)
+    state = load_state(state_path)
+    cached_categories = state.get('categories', {})
+
+    category_links = fetch_category_links(session, base_url, timeout)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda url: fetch_category(session, url, cached_categories.get(url), timeout),
+                                    category_links))
+
+    summary = {'changed': 0, 'unchanged': 0, 'failed': 0, 'missing': []}
+    categories = {}
+    for url, (entry, status) in zip(category_links, results):
+        summary[status] += 1
+        if entry is not None:
+            categories[url] = entry
+        else:
+            summary['missing'].append(url)
+
+    output_changed = False
+    if not summary['missing']:
+        content = format_rows(category_links, categories)
+        try:
+            with open(output_path, encoding='utf-8') as f:
+                output_changed = f.read() != content
+        except FileNotFoundError:
+            output_changed = True
+        if output_changed:
+            write_atomic(output_path, content)
+    write_atomic(state_path, json.dumps({'categories': categories}))
+    summary['output_changed'] = output_changed
+    return summary
 
 
 def main():
-    all_data = []
-    category_links = fetch_category_links()
-    for url in category_links:
-        print(f"Fetching data from: {url}")
-        data = fetch_calorie_info(url)
-        all_data.extend(data)
-    save_to_file(all_data)
-    print(f"Data fetched and saved for {len(category_links)} categories.")
+    parser = argparse.ArgumentParser(description='Refresh calories.txt from ' + BASE_URL)
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--timeout', type=float, default=TIMEOUT)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = refresh(base_url=args.base_url, max_workers=args.workers, timeout=args.timeout)
+    print(f"Categories changed: {summary['changed']}, unchanged: {summary['unchanged']}, "
+          f"failed: {summary['failed']} ({time.perf_counter() - start:.1f}s)")
+    if summary['missing']:
+        print(f"calories.txt was left unchanged, no rows for: {', '.join(summary['missing'])}")
+    elif not summary['output_changed']:
+        print("calories.txt is already up to date.")
+
 
 if __name__ == "__main__":
     main()
-
-
-
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,142 @@
+# Test file for crawler_calories.py, run against a local stand-in for the calories website
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import crawler_calories as cc
+
+INDEX = """<html><body><div class="MuiBox-root css-10ib5jr">
+<a href="/food/fruit">Fruit</a><a href="/food/potato">Potato</a><a href="/about">About</a>
+</div></body></html>"""
+
+
+def category_page(rows):
+    cells = ''.join(f'<tr><td>{name}</td><td>{grams} g</td><td>{calories} cal</td></tr>' for name, grams, calories
+                    in rows)
+    return f'<html><body><table><tr><th>Food</th><th>Serving</th><th>Calories</th></tr>{cells}</table></body></html>'
+
+
+class FakeSite:
+    """Serves the index and category pages with ETags, answering matching conditional GETs with 304."""
+
+    def __init__(self):
+        self.pages = {
+            '/': INDEX,
+            '/food/fruit': category_page([('Apple', 100, 52), ('Banana', 100, 89)]),
+            '/food/potato': category_page([('Baked Potato', 100, 122)]),
+        }
+        self.failures = {}          # path -> number of 503 responses before succeeding
+        self.requests = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests.append((self.path, self.headers.get('If-None-Match')))
+                if site.failures.get(self.path):
+                    site.failures[self.path] -= 1
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                body = site.pages.get(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                etag = f'"{hash(body) & 0xffffffff:x}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestCalorieCrawler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.site = FakeSite()
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'calories.txt')
+        self.state = os.path.join(self.directory, 'calories_state.json')
+
+    def tearDown(self) -> None:
+        self.site.close()
+        shutil.rmtree(self.directory)
+
+    def refresh(self):
+        return cc.refresh(base_url=self.site.url, output_path=self.output, state_path=self.state, max_workers=4,
+                          timeout=5, session=cc.make_session(4, backoff=0))
+
+    def read_output(self):
+        with open(self.output, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_full_refresh(self) -> None:
+        summary = self.refresh()
+        self.assertEqual((summary['changed'], summary['failed']), (2, 0))
+        self.assertEqual(self.read_output(), ['Apple,100,52', 'Banana,100,89', 'Baked Potato,100,122'])
+
+    def test_incremental_refresh_uses_conditional_gets(self) -> None:
+        self.refresh()
+        modified = os.stat(self.output).st_mtime_ns
+        self.site.requests.clear()
+
+        summary = self.refresh()
+        self.assertEqual((summary['changed'], summary['unchanged']), (0, 2))
+        self.assertFalse(summary['output_changed'])
+        self.assertEqual(os.stat(self.output).st_mtime_ns, modified)
+        self.assertTrue(all(etag for path, etag in self.site.requests if path.startswith('/food')))
+
+        self.site.pages['/food/potato'] = category_page([('Baked Potato', 100, 122), ('Gnocchi', 100, 163)])
+        summary = self.refresh()
+        self.assertEqual((summary['changed'], summary['unchanged']), (1, 1))
+        self.assertEqual(self.read_output()[-1], 'Gnocchi,100,163')
+
+    def test_retries_and_keeps_cached_rows_on_failure(self) -> None:
+        self.site.failures['/food/fruit'] = 1
+        summary = self.refresh()
+        self.assertEqual(summary['failed'], 0, msg="A single 503 should be retried")
+
+        self.site.failures['/food/fruit'] = 10
+        summary = self.refresh()
+        self.assertEqual(summary['failed'], 1)
+        self.assertIn('Apple,100,52', self.read_output())
+
+    def test_failed_category_without_cache_keeps_existing_file(self) -> None:
+        with open(self.output, 'w', encoding='utf-8') as f:
+            f.write('Apple,100,52\nBaked Potato,100,122\n')
+        os.chmod(self.output, 0o644)
+        self.site.failures['/food/fruit'] = 10
+        summary = self.refresh()
+        self.assertEqual(summary['missing'], [self.site.url + '/food/fruit'])
+        self.assertFalse(summary['output_changed'])
+        self.assertEqual(self.read_output(), ['Apple,100,52', 'Baked Potato,100,122'])
+
+        self.site.failures.clear()
+        self.site.pages['/food/potato'] = category_page([('Gnocchi', 100, 163)])
+        self.assertTrue(self.refresh()['output_changed'])
+        self.assertEqual(self.read_output()[-1], 'Gnocchi,100,163')
+        self.assertEqual(os.stat(self.output).st_mode & 0o777, 0o644)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# Test file for the Wikipedia description lookups in crawler.py, run against a local stand-in for Wikipedia
+
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import crawler
+
+ARTICLE_HEAD = ('<html><body><p class="mw-empty-elt">\n</p>'
+                '<p><b>Kale</b> is a <a href="/wiki/Cabbage">cabbage</a> &amp; leaf vegetable.</p>'
+                '<p>Second paragraph.</p>' + '<div>infobox</div>' * (crawler.CHUNK_SIZE // 10))
+ARTICLE_TAIL = '<div>references</div>' * 1000 + '</body></html>'
+
+
+class QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass                # Clients hang up early on purpose
+
+
+class FakeWikipedia:
+    """Serves summaries for the foods in `summaries` and an article for every /wiki/ page. The end of the article
+    is held back until `release` is set, so a client that reads the whole page times out."""
+
+    def __init__(self):
+        self.summaries = {'Apple': 'An apple is a round fruit.'}
+        self.requests = []
+        self.ports = set()
+        self.release = threading.Event()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                site.requests.append(self.path)
+                site.ports.add(self.client_address[1])
+                if self.path.startswith('/api/rest_v1/page/summary/'):
+                    title = self.path.rsplit('/', 1)[-1]
+                    if title in site.summaries:
+                        return self.send(200, json.dumps({'extract': site.summaries[title]}), 'application/json')
+                    return self.send(404, '{}', 'application/json')
+                if self.path == '/wiki/Missing':
+                    return self.send(404, 'Not found', 'text/html')
+                return self.send(200, ARTICLE_HEAD + ARTICLE_TAIL, 'text/html; charset=utf-8',
+                                 split=len(ARTICLE_HEAD.encode('utf-8')))
+
+            def send(self, status, body, content_type, split=None):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data[:split])
+                if split is not None:
+                    self.wfile.flush()
+                    site.release.wait(10)
+                    self.wfile.write(data[split:])
+
+            def log_message(self, *args):
+                pass
+
+        self.server = QuietServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestWikipediaDescriptions(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.site = FakeWikipedia()
+        self.session = crawler.make_session(4, backoff=0)
+
+    def tearDown(self) -> None:
+        self.session.close()
+        self.site.close()
+
+    def fetch(self, name):
+        return crawler.fetch_wikipedia_description(name, session=self.session, base_url=self.site.url, timeout=2)
+
+    def test_uses_summary_endpoint(self) -> None:
+        self.assertEqual(self.fetch('Apple'), 'An apple is a round fruit.')
+        self.assertEqual(self.site.requests, ['/api/rest_v1/page/summary/Apple'])
+
+    def test_falls_back_to_first_paragraph(self) -> None:
+        # Only the start of the article is sent, reading all of it would time out
+        self.assertEqual(self.fetch('Kale'), 'Kale is a cabbage & leaf vegetable.')
+        self.assertEqual(self.fetch('Missing'), crawler.NO_DESCRIPTION)
+
+    def test_unreachable_site(self) -> None:
+        self.site.close()
+        self.assertEqual(self.fetch('Apple'), crawler.NO_DESCRIPTION)
+
+    def test_batch_fetch(self) -> None:
+        self.site.summaries.update({f'Food_{i}': f'Food {i}.' for i in range(20)})
+        names = [f'Food {i}' for i in range(20)] + ['Food 0']
+        descriptions = crawler.fetch_wikipedia_descriptions(names, session=self.session, base_url=self.site.url,
+                                                            timeout=5, max_workers=4)
+        self.assertEqual(descriptions, {f'Food {i}': f'Food {i}.' for i in range(20)})
+        self.assertEqual(len(self.site.requests), 20)
+        self.assertLessEqual(len(self.site.ports), 4, msg="Connections should be reused")
+
+    def test_first_paragraph_parser(self) -> None:
+        parser = crawler.FirstParagraphParser()
+        parser.feed('<p> </p><p>Rice is a <i>cereal</i>')
+        self.assertFalse(parser.done)
+        parser.feed(' grain.</p><p>More</p>')
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.text(), 'Rice is a cereal grain.')
+
+
+if __name__ == '__main__':
+    unittest.main()
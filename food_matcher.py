@@ -0,0 +1,188 @@
+# Fuzzy food name matching, used to look up calories (nutrition table), storage times (FoodKeeper data) and to
+# avoid creating duplicate food items ("Tomatoes" / "tomato" / "Tomato (raw)").
+# Names are normalised (lower case, no punctuation or parenthesised notes, singular words) and indexed once when a
+# matcher is built: an exact lookup on the normalised name, a token index and a trigram index. A query only scores
+# the entries that share a word with it plus the entries sharing the most trigrams, instead of every entry.
+
+import re
+import threading
+from collections import Counter, namedtuple
+
+DEFAULT_THRESHOLD = 0.6
+MAX_TRIGRAM_CANDIDATES = 50
+# Trigrams found in more than this fraction of the entries (" ch", "ed ") say little and are skipped when blocking
+COMMON_TRIGRAM_FRACTION = 0.1
+TOKEN_MATCH_SIMILARITY = 0.7
+
+STOP_WORDS = frozenset(['a', 'an', 'and', 'the', 'of', 'with', 'in', 'or'])
+
+_PARENTHESES = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+Match = namedtuple('Match', ['name', 'value', 'score'])
+
+
+# Method to reduce a plural word to its singular form ("berries" -> "berry", "tomatoes" -> "tomato").
+def singular(word: str) -> str:
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('oes', 'ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+# Method to split a food name into normalised words.
+def tokenize(name: str) -> tuple:
+    name = _PARENTHESES.sub(' ', (name or '').lower().replace('&', ' and '))
+    return tuple(singular(word) for word in _NON_WORD.split(name) if word and word not in STOP_WORDS)
+
+
+def normalize(name: str) -> str:
+    return ' '.join(tokenize(name))
+
+
+def trigrams(word: str) -> frozenset:
+    padded = f' {word} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def dice(first: frozenset, second: frozenset) -> float:
+    if not first or not second:
+        return 0.0
+    return 2 * len(first & second) / (len(first) + len(second))
+
+
+class FoodMatcher:
+    """Index of food names for fuzzy lookups. Each name can carry a value (e.g. a row id) returned with matches."""
+
+    def __init__(self, names=()):
+        self._entries = []          # (name, value, normalised name, tokens, trigrams of each token, all trigrams)
+        self._exact = {}
+        self._tokens = {}
+        self._trigrams = {}
+        for item in names:
+            name, value = item if isinstance(item, tuple) else (item, item)
+            self.add(name, value)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Method to index a name. The first name added for a normalised name wins exact lookups.
+    def add(self, name, value=None) -> None:
+        tokens = tokenize(name)
+        if not tokens:
+            return
+        entry_id = len(self._entries)
+        token_trigrams = tuple(trigrams(token) for token in tokens)
+        all_trigrams = frozenset().union(*token_trigrams)
+        self._entries.append((name, name if value is None else value, ' '.join(tokens), tokens, token_trigrams,
+                              all_trigrams))
+        self._exact.setdefault(' '.join(tokens), entry_id)
+        for token in set(tokens):
+            self._tokens.setdefault(token, []).append(entry_id)
+        for trigram in all_trigrams:
+            self._trigrams.setdefault(trigram, []).append(entry_id)
+
+    # Method to find the entries worth scoring: those sharing a word with the query, plus the entries that share
+    # the most (uncommon) trigrams with it, so misspelt words are still found.
+    def candidates(self, tokens, query_trigrams) -> set:
+        found = {entry_id for token in set(tokens) for entry_id in self._tokens.get(token, ())}
+        common = max(MAX_TRIGRAM_CANDIDATES, len(self._entries) * COMMON_TRIGRAM_FRACTION)
+        hits = Counter()
+        for trigram in query_trigrams:
+            postings = self._trigrams.get(trigram, ())
+            if len(postings) <= common:
+                hits.update(postings)
+        found.update(entry_id for entry_id, _ in hits.most_common(MAX_TRIGRAM_CANDIDATES))
+        return found
+
+    # Similarity between 0 and 1. Every query word is paired with its most similar word in the entry (misspelt
+    # words count if they are similar enough), blended with the trigram similarity of the whole names.
+    @staticmethod
+    def score(tokens, token_trigrams, query_trigrams, entry) -> float:
+        _, _, _, entry_tokens, entry_token_trigrams, entry_trigrams = entry
+        matched = 0.0
+        for token, token_grams in zip(tokens, token_trigrams):
+            if token in entry_tokens:
+                matched += 1
+                continue
+            best = max(dice(token_grams, other) for other in entry_token_trigrams)
+            if best >= TOKEN_MATCH_SIMILARITY:
+                matched += best
+        word_score = matched / max(len(tokens), len(entry_tokens))
+        return 0.7 * word_score + 0.3 * dice(query_trigrams, entry_trigrams)
+
+    # Method to rank the entries most similar to a name. Returns up to `limit` Matches, best first.
+    def search(self, name, limit=5, threshold=0.0) -> list:
+        tokens = tokenize(name)
+        if not tokens:
+            return []
+        exact = self._exact.get(' '.join(tokens))
+        if exact is not None and limit == 1:
+            entry = self._entries[exact]
+            return [Match(entry[0], entry[1], 1.0)]
+
+        token_trigrams = tuple(trigrams(token) for token in tokens)
+        query_trigrams = frozenset().union(*token_trigrams)
+        scored = []
+        for entry_id in self.candidates(tokens, query_trigrams):
+            entry = self._entries[entry_id]
+            score = 1.0 if entry_id == exact else self.score(tokens, token_trigrams, query_trigrams, entry)
+            if score >= threshold:
+                scored.append((score, -entry_id, entry))
+        scored.sort(reverse=True)
+        return [Match(entry[0], entry[1], score) for score, _, entry in scored[:limit]]
+
+    # Method to find the most similar entry. Returns a Match, or None if nothing scores at least `threshold`.
+    def best(self, name, threshold=DEFAULT_THRESHOLD):
+        matches = self.search(name, limit=1, threshold=threshold)
+        return matches[0] if matches else None
+
+
+# Matchers built from the database are shared by the whole process and rebuilt after their data changes
+_matchers = {}
+_lock = threading.Lock()
+_last_mapping = (None, None)
+
+
+# Method to get the shared matcher for `key`, building it with build() (an iterable of names or (name, value)
+# pairs) the first time.
+def get_matcher(key, build) -> FoodMatcher:
+    matcher = _matchers.get(key)
+    if matcher is None:
+        with _lock:
+            matcher = _matchers.get(key)
+            if matcher is None:
+                matcher = _matchers[key] = FoodMatcher(build())
+    return matcher
+
+
+# Method to add a name to a shared matcher. Matchers that are not built yet pick it up when they are built.
+def add(key, name, value=None) -> None:
+    matcher = _matchers.get(key)
+    if matcher is not None:
+        with _lock:
+            matcher.add(name, value)
+
+
+# Method to drop a shared matcher (or all of them) after its data was reloaded.
+def invalidate(key=None) -> None:
+    global _last_mapping
+    with _lock:
+        if key is None:
+            _matchers.clear()
+            _last_mapping = (None, None)
+        else:
+            _matchers.pop(key, None)
+
+
+# Method to get a matcher over a dict's keys, reusing the last one built while the same dict is passed in.
+def matcher_for(mapping) -> FoodMatcher:
+    global _last_mapping
+    source, matcher = _last_mapping
+    if source is not mapping:
+        matcher = FoodMatcher(mapping.keys())
+        _last_mapping = (mapping, matcher)
+    return matcher
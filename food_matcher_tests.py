@@ -0,0 +1,78 @@
+# Test file for food_matcher.py and its uses for calories, storage times and food item dedupe
+
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+
+import food_matcher as fm
+import models
+import nutrition_util as nu
+from shopping.shopping_util import get_storage_duration, fetch_calories_from_file
+from testing_util import DatabaseTestCase
+
+
+class TestFoodMatcher(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.matcher = fm.FoodMatcher(['Apple', 'Pineapple', 'Banana', 'Strawberry', 'Spaghetti', 'Chicken Breast',
+                                       'Chicken Soup', 'Tomato (raw)', 'Peach'])
+
+    def test_normalize(self) -> None:
+        self.assertEqual(fm.normalize('  Tomatoes (Roma) '), 'tomato')
+        self.assertEqual(fm.normalize('Strawberries & Cream'), 'strawberry cream')
+        self.assertEqual(fm.normalize('Peaches'), 'peach')
+        self.assertEqual(fm.normalize('Hummus, plain'), 'hummus plain')
+
+    def test_best_match(self) -> None:
+        self.assertEqual(self.matcher.best('tomatoes'), ('Tomato (raw)', 'Tomato (raw)', 1.0))
+        self.assertEqual(self.matcher.best('Strawberries').name, 'Strawberry')
+        self.assertEqual(self.matcher.best('spagetti').name, 'Spaghetti')
+        self.assertEqual(self.matcher.best('chicken breasts').name, 'Chicken Breast')
+        self.assertIsNone(self.matcher.best('Cheddar Cheese'))
+        self.assertNotEqual(getattr(self.matcher.best('Apples'), 'name', None), 'Pineapple')
+
+    def test_search_is_ranked(self) -> None:
+        names = [match.name for match in self.matcher.search('chicken', limit=3, threshold=0.3)]
+        self.assertEqual(set(names), {'Chicken Breast', 'Chicken Soup'})
+        scores = [match.score for match in self.matcher.search('apple pie', limit=5)]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_queries_only_score_candidates(self) -> None:
+        matcher = fm.FoodMatcher(f'Food {i} Item{i}' for i in range(3000))
+        matcher.add('Blueberry Muffin', 'muffin')
+        tokens = fm.tokenize('Bluebery Muffins')
+        candidates = matcher.candidates(tokens, frozenset().union(*(fm.trigrams(token) for token in tokens)))
+        self.assertLessEqual(len(candidates), fm.MAX_TRIGRAM_CANDIDATES + 1)
+        self.assertEqual(matcher.best('Bluebery Muffins').value, 'muffin')
+
+
+class TestMatcherUses(DatabaseTestCase):
+
+    def add_food(self, name) -> models.FoodItem:
+        with patch('models.fetch_wikipedia_description', return_value='Food'):
+            return models.create_or_get_food_item(name)
+
+    def test_food_items_are_deduplicated(self) -> None:
+        tomato = self.add_food('tomatoes')
+        self.assertEqual(self.add_food('Tomato').id, tomato.id)
+        self.assertEqual(self.add_food('tomato (raw)').id, tomato.id)
+        self.assertNotEqual(self.add_food('Tomato Soup').id, tomato.id)
+
+        self.reset()                # The index is rebuilt for the rolled back database
+        self.assertEqual(self.add_food('Tomatoes').name, 'Tomatoes')
+
+    def test_storage_duration_uses_similar_names(self) -> None:
+        storage_info = {'Apples': '3 weeks', 'Bananas': '5 days', 'Raw chicken': 'not safe'}
+        self.assertEqual(get_storage_duration('Apple', storage_info), timedelta(days=21))
+        self.assertEqual(get_storage_duration('banana', storage_info), timedelta(days=5))
+        self.assertEqual(get_storage_duration('Caviar', storage_info), timedelta(days=1))
+
+    def test_calories_use_similar_names(self) -> None:
+        self.assertIsNone(nu.get_nutrition('Strawberry'))          # calories.txt only has "Strawberries"
+        self.assertEqual(fetch_calories_from_file('Strawberry'), (100, 36))
+        self.assertEqual(fetch_calories_from_file('Cooked spagetti'), (100, 131))
+        self.assertEqual(fetch_calories_from_file('Zzyzx Root'), (None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app
+# Every setting can be overridden from the environment (GUNICORN_WORKERS=4 ...) or on the command line.
+#
+# Worker model: pre-forked processes, each running a small pool of threads (gthread). Processes let requests use
+# every CPU core, which the dev server can't. The threads keep a worker serving other requests while one waits
+# on SQLite, the crawlers or the bcrypt pool (bcrypt releases the GIL).
+# The app is imported once in the master process (preload_app), so workers start quickly and share the loaded code
+# copy-on-write. The soft-delete purger (purge_util.py) started by create_app() keeps running in the master only,
+# so there is one purger however many workers there are.
+
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# 2 x cores + 1, the usual starting point: while one worker waits on I/O another has the core. Workers only share
+# the query cache (cache.py) through Redis, without CACHE_URL one worker serves everything on its threads, so no
+# worker keeps serving results another worker's writes have made stale.
+if os.getenv('CACHE_URL'):
+    workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+else:
+    workers = int(os.getenv('GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = True
+
+# Restart each worker after this many requests (give or take the jitter, so they don't all restart at once), which
+# bounds the growth of per-process caches and any slow leaks
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Seconds an idle keep-alive connection is held open. A few seconds covers a page and its static files without
+# tying up threads for clients that have gone away (nginx or a load balancer in front keeps its own connections).
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# A worker silent for this long is killed and replaced, the barcode and crawler routes are the slowest
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+# On SIGTERM, workers stop accepting connections and get this long to finish the requests they have
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from wsgi import reset_after_fork
+    reset_after_fork()
+
+
+# Writes out the worker's buffered ratings and queued log records and closes its own connections before it exits
+def worker_exit(server, worker):
+    from app import db
+    from logging_util import stop_logging
+    from wsgi import app
+
+    with app.app_context():
+        buffer = app.extensions.get('rating_buffer')
+        if buffer is not None:
+            buffer.stop()
+        db.engine.dispose()
+    stop_logging()
@@ -0,0 +1,142 @@
+# In-process stand-in for the Redis server declared in docker-compose.yml.
+# LocalRedis implements the small subset of the redis-py client API the app uses, so shared backends (rate
+# limiting, caching, sessions) can run and be tested without a Redis server. It is only shared between threads
+# of one process; use a redis:// URL to share state between worker processes.
+
+import fnmatch
+import threading
+import time
+
+_local_instances = {}
+_local_lock = threading.Lock()
+
+
+# Method to get a Redis client for a URL. "memory://" (optionally with a name, e.g. "memory://sessions")
+# returns a process-wide LocalRedis; anything else is handed to redis-py.
+def get_redis(url: str):
+    if url.startswith('memory://'):
+        with _local_lock:
+            if url not in _local_instances:
+                _local_instances[url] = LocalRedis()
+            return _local_instances[url]
+
+    import redis        # Optional dependency, only needed for a real Redis server
+    return redis.Redis.from_url(url)
+
+
+class LocalRedis:
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._data = {}
+        self._expires = {}
+
+    # Removes the key if its expiry time has passed. Must be called with the lock held.
+    def _check_expired(self, name) -> None:
+        expires_at = self._expires.get(name)
+        if expires_at is not None and expires_at <= self._clock():
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode('utf-8')
+
+    def get(self, name):
+        with self._lock:
+            self._check_expired(name)
+            return self._data.get(name)
+
+    def mget(self, names):
+        with self._lock:
+            return [self.get(name) for name in names]
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False) -> bool:
+        with self._lock:
+            self._check_expired(name)
+            if nx and name in self._data:
+                return False
+            if xx and name not in self._data:
+                return False
+            self._data[name] = self._encode(value)
+            self._expires.pop(name, None)
+            if ex is not None:
+                self._expires[name] = self._clock() + ex
+            elif px is not None:
+                self._expires[name] = self._clock() + px / 1000
+            return True
+
+    def delete(self, *names) -> int:
+        with self._lock:
+            removed = 0
+            for name in names:
+                self._check_expired(name)
+                if self._data.pop(name, None) is not None:
+                    removed += 1
+                self._expires.pop(name, None)
+            return removed
+
+    def exists(self, name) -> int:
+        return int(self.get(name) is not None)
+
+    def incr(self, name, amount=1) -> int:
+        with self._lock:
+            self._check_expired(name)
+            value = int(self._data.get(name, b'0')) + amount
+            self._data[name] = self._encode(value)
+            return value
+
+    # Sets are held as Python sets of bytes
+    def sadd(self, name, *values) -> int:
+        with self._lock:
+            self._check_expired(name)
+            members = self._data.setdefault(name, set())
+            added = {self._encode(value) for value in values} - members
+            members.update(added)
+            return len(added)
+
+    def srem(self, name, *values) -> int:
+        with self._lock:
+            self._check_expired(name)
+            members = self._data.get(name, set())
+            removed = {self._encode(value) for value in values} & members
+            members.difference_update(removed)
+            if not members:
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return len(removed)
+
+    def smembers(self, name) -> set:
+        with self._lock:
+            self._check_expired(name)
+            return set(self._data.get(name, ()))
+
+    def expire(self, name, seconds) -> bool:
+        with self._lock:
+            self._check_expired(name)
+            if name not in self._data:
+                return False
+            self._expires[name] = self._clock() + seconds
+            return True
+
+    # Returns the remaining time to live in seconds, -1 if the key has no expiry and -2 if it does not exist.
+    def ttl(self, name) -> int:
+        with self._lock:
+            self._check_expired(name)
+            if name not in self._data:
+                return -2
+            if name not in self._expires:
+                return -1
+            return int(round(self._expires[name] - self._clock()))
+
+    def scan_iter(self, match='*'):
+        with self._lock:
+            names = list(self._data)
+        return [name for name in names if self.exists(name) and fnmatch.fnmatchcase(name, match)]
+
+    def flushdb(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
@@ -0,0 +1,165 @@
+# Non-blocking, structured logging for the app logger.
+# Request threads only put records on a queue (QueueHandler). A single QueueListener thread per process formats
+# them as JSON lines and writes them to the LOG_PATH file (app.log) through the RotatingFileHandler, so file writes
+# and rotation checks never happen while a request is being served. Without LOG_PATH no file is written.
+# A file must only be rotated by one process: when several write it (gunicorn's workers) each would rename it under
+# the others. With LOG_ROTATE false (the production profile) the file is opened with a WatchedFileHandler instead,
+# which only appends and reopens app.log once logrotate has moved it (see README.md).
+# Each record carries the request context it was logged in: user id, IP address, endpoint, method, path and the
+# time since the request started (latency_ms). admin/log_util.py reads these lines back for the admin log viewer.
+# install_logging() is idempotent, so calling create_app() more than once doesn't stack handlers.
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+
+from flask import g, has_request_context, request
+
+MAX_BYTES = 500000
+BACKUP_COUNT = 10
+
+_lock = threading.Lock()
+_queue = None
+_listener = None
+_registered_atexit = False
+
+# Attributes of every LogRecord, anything else on a record was passed through `extra` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+_TRACEBACKS = logging.Formatter()
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the current request's details to records logged while handling a request."""
+
+    # Fields already given through `extra` (e.g. the user id of a user who has just logged out) are kept.
+    def filter(self, record) -> bool:
+        if has_request_context():
+            from flask_login import current_user
+
+            started = g.get('request_started')
+            context = {
+                'user_id': getattr(current_user, 'id', None),
+                'ip': request.remote_addr,
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 1) if started else None,
+            }
+            for key, value in context.items():
+                if getattr(record, key, None) is None:
+                    setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON."""
+
+    def format(self, record) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'source': f'{record.pathname}:{record.lineno}',
+            'message': record.getMessage(),
+        }
+        # Queued records carry their traceback as the exception attribute (_ContextQueueHandler.prepare)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# The context fields have to be captured on the request thread, before the record is queued.
+class _ContextQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.addFilter(RequestContextFilter())
+
+    # QueueHandler.prepare() would append the traceback to the message and drop exc_info, which can't be pickled or
+    # outlive the request thread. The traceback is formatted here and kept apart as the record's exception field.
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exception = _TRACEBACKS.formatException(record.exc_info)
+        elif record.exc_text:
+            record.exception = record.exc_text
+        record.msg, record.args, record.exc_info, record.exc_text = record.message, None, None, None
+        return record
+
+
+# Method to start the listener thread and its file handler. Returns the shared queue.
+def _start_listener(log_path, rotate):
+    global _queue, _listener, _registered_atexit
+    if _listener is None:
+        _queue = queue.SimpleQueue()
+        if rotate:
+            file_handler = RotatingFileHandler(log_path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+        else:
+            file_handler = WatchedFileHandler(log_path)
+        file_handler.setLevel(logging.INFO)
+        file_handler.setFormatter(JsonFormatter())
+        _listener = QueueListener(_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        if not _registered_atexit:
+            atexit.register(stop_logging)
+            _registered_atexit = True
+    return _queue
+
+
+# Method to route app.logger through the queue. Safe to call on every create_app().
+# The records are written to log_path, the app's LOG_PATH setting by default.
+def install_logging(app, log_path: str = None) -> None:
+    if log_path is None:
+        log_path = app.config.get('LOG_PATH')
+    with _lock:
+        log_queue = _start_listener(log_path, app.config.get('LOG_ROTATE', True)) if log_path else None
+        installed = False
+        for handler in list(app.logger.handlers):
+            if isinstance(handler, _ContextQueueHandler):
+                if handler.queue is log_queue:
+                    installed = True
+                else:       # Left over from a listener that has since been stopped
+                    app.logger.removeHandler(handler)
+        if log_queue is not None and not installed:
+            app.logger.addHandler(_ContextQueueHandler(log_queue))
+        app.logger.setLevel(app.config.get('LOG_LEVEL', 'INFO').upper())
+
+    if not app.extensions.get('logging_util'):
+        app.extensions['logging_util'] = True
+        app.before_request(_start_timer)
+
+
+def _start_timer() -> None:
+    g.request_started = time.perf_counter()
+
+
+# Method to write out any queued records and stop the listener thread.
+def stop_logging() -> None:
+    global _queue, _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _queue = _listener = None
+
+
+# The listener thread doesn't survive fork(). A pre-forking server's children drop the parent's listener and start
+# their own when install_logging() is called again (wsgi.reset_after_fork).
+def _forget_listener() -> None:
+    global _lock, _queue, _listener
+    _lock = threading.Lock()
+    _queue = _listener = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_listener)
@@ -0,0 +1,122 @@
+# Test file for logging_util.py
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import logging_util as lu
+from admin.log_util import LogIndex
+from app import create_app
+from config import TestingConfig
+from testing_util import DatabaseTestCase
+
+
+class TestLoggingUtil(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'app.log')
+        lu.stop_logging()
+        lu.install_logging(self.app, self.path)
+
+    def tearDown(self) -> None:
+        lu.stop_logging()
+        lu.install_logging(self.app)
+        shutil.rmtree(self.directory)
+
+    def read_entries(self):
+        lu.stop_logging()           # Flushes the queue
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def queue_handlers(self):
+        return [handler for handler in self.app.logger.handlers if isinstance(handler, lu._ContextQueueHandler)]
+
+    def test_install_is_idempotent(self) -> None:
+        lu.install_logging(self.app, self.path)
+        create_app(type('LoggingConfig', (TestingConfig,), {'LOG_PATH': self.path}))
+        self.assertEqual(len(self.queue_handlers()), 1)
+
+    def test_log_path_setting(self) -> None:
+        lu.stop_logging()
+        lu.install_logging(self.app)
+        self.assertEqual(self.queue_handlers(), [], msg="TestingConfig writes no log file")
+        with patch.dict(self.app.config, {'LOG_PATH': self.path}):
+            lu.install_logging(self.app)
+        self.app.logger.info("Configured")
+        self.assertEqual([entry['message'] for entry in self.read_entries()], ["Configured"])
+
+    def test_records_include_request_context(self) -> None:
+        with self.app.test_request_context('/user/login', method='POST', environ_base={'REMOTE_ADDR': '10.1.2.3'}):
+            self.app.preprocess_request()
+            self.app.logger.info("User logged in: a@email.com, IP: 10.1.2.3")
+            self.app.logger.warning("Logged out", extra={'user_id': 7})
+
+        first, second = self.read_entries()
+        self.assertEqual(first['message'], "User logged in: a@email.com, IP: 10.1.2.3")
+        self.assertEqual(first['level'], 'INFO')
+        self.assertEqual(first['ip'], '10.1.2.3')
+        self.assertEqual(first['method'], 'POST')
+        self.assertEqual(first['endpoint'], 'users.login')
+        self.assertGreaterEqual(first['latency_ms'], 0)
+        self.assertNotIn('user_id', first)          # Anonymous
+        self.assertEqual(second['user_id'], 7)
+
+    def test_exceptions_are_logged_apart_from_message(self) -> None:
+        try:
+            raise ValueError('Bad barcode')
+        except ValueError:
+            self.app.logger.exception("Scan failed: %s", 'sample.png')
+
+        entry, = self.read_entries()
+        self.assertEqual(entry['message'], "Scan failed: sample.png")
+        self.assertTrue(entry['exception'].startswith('Traceback'))
+        self.assertIn('ValueError: Bad barcode', entry['exception'])
+
+    def test_writes_happen_on_listener_thread(self) -> None:
+        writers = []
+        real_emit = lu.RotatingFileHandler.emit
+
+        def emit(handler, record):
+            writers.append(threading.current_thread())
+            real_emit(handler, record)
+
+        with patch.object(lu.RotatingFileHandler, 'emit', emit):
+            self.app.logger.info("Queued")
+            self.read_entries()
+        self.assertEqual(len(writers), 1)
+        self.assertIsNot(writers[0], threading.current_thread())
+
+    def test_production_leaves_rotation_to_logrotate(self) -> None:
+        lu.stop_logging()
+        self.app.config['LOG_ROTATE'] = False
+        lu.install_logging(self.app, self.path)
+        self.assertEqual([type(handler) for handler in lu._listener.handlers], [lu.WatchedFileHandler])
+        self.app.logger.info("Before rotation")
+        for _ in range(100):
+            if os.path.getsize(self.path):
+                break
+            time.sleep(0.01)
+        os.rename(self.path, self.path + '.1')          # What logrotate does, while the listener keeps running
+        self.app.logger.info("After rotation")
+        self.assertEqual([entry['message'] for entry in self.read_entries()], ["After rotation"])
+
+    def test_log_viewer_reads_json_records(self) -> None:
+        with self.app.test_request_context('/', environ_base={'REMOTE_ADDR': '10.9.9.9'}):
+            self.app.logger.info("User registered: New@email.com, IP: 10.9.9.9")
+        self.app.logger.error("Something failed")
+        self.read_entries()
+
+        index = LogIndex(self.path)
+        self.assertEqual(index.search(email='new@email.com', ip='10.9.9.9')[1], 1)
+        self.assertEqual(index.search(level='error')[1], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,45 @@
+from flask import current_app, has_app_context
 from flask_login import UserMixin
-from app import db
+from app import db, cache as query_cache
 from datetime import datetime
-import bcrypt
+from sqlalchemy import case, func, inspect, select, text, update
+from sqlalchemy.orm import Session, column_property, object_session, with_loader_criteria
 from crawler import fetch_wikipedia_description
+import cache
+import food_matcher
+import search_index
+from users import user_cache
+from users.password_util import hash_password, check_password, needs_rehash, PasswordServiceBusy
+from sqlite_util import retry_on_busy
 
 
-class User(db.Model, UserMixin):
+class SoftDeleteMixin:
+    """Rows are hidden by setting deleted_at instead of being deleted. Soft deleted rows are left out of every ORM
+    query (see hide_soft_deleted) until they are restored or removed for good by the purger (purge_util.py)."""
+
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    def is_deleted(self) -> bool:
+        return self.deleted_at is not None
+
+    # Method to hide the row. Cheap, the row and its children stay in the database until purged.
+    @retry_on_busy
+    def soft_delete(self) -> None:
+        self.deleted_at = datetime.now()
+        db.session.commit()
+
+    @retry_on_busy
+    def restore(self) -> None:
+        self.deleted_at = None
+        db.session.commit()
+
+    # Method to get a query of the soft deleted rows, which can be restored until the purger removes them
+    @classmethod
+    def query_deleted(cls):
+        return cls.query.execution_options(include_deleted=True).filter(cls.deleted_at.isnot(None))
+
+
+class User(db.Model, UserMixin, SoftDeleteMixin):
     __tablename__ = 'users'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -21,12 +55,13 @@ class User(db.Model, UserMixin):
     role = db.Column(db.String(100), nullable=False, default='user')
 
     # security details
-    registered_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    current_login = db.Column(db.DateTime, nullable=True)
+    # (indexed for sorting and aggregating in the admin user views, see admin/admin_util.py)
+    registered_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    current_login = db.Column(db.DateTime, nullable=True, index=True)
     last_login = db.Column(db.DateTime, nullable=True)
     current_login_ip = db.Column(db.String(45), nullable=True)
     last_login_ip = db.Column(db.String(45), nullable=True)
-    total_logins = db.Column(db.Integer, default=0)
+    total_logins = db.Column(db.Integer, default=0, index=True)
 
     # declaring relationships to other tables
     recipes = db.relationship('Recipe', backref='user')
@@ -38,7 +73,7 @@ class User(db.Model, UserMixin):
     def __init__(self, email, password, first_name, last_name, dob, role='user'):
         self.email = email
         # Hash password before storing in database
-        self.password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        self.password = hash_password(password)
         self.first_name = first_name
         self.last_name = last_name
         self.dob = dob
@@ -46,19 +81,28 @@ class User(db.Model, UserMixin):
         self.role = role
 
     # Method to update last and current logins and ips. Takes current request's ip address.
-    def update_security_fields_on_login(self, ip_addr: str) -> None:
+    # If the plain text password used to log in is given and the stored hash was made with a different
+    # cost factor than BCRYPT_LOG_ROUNDS, the password is rehashed. Everything is saved in a single commit.
+    @retry_on_busy
+    def update_security_fields_on_login(self, ip_addr: str, password: str = None) -> None:
         self.last_login = self.current_login
         self.current_login = datetime.now()
-        self.last_login_ip = self.current_login_ip
+        self.last_login_ip = self.current_login_ip or ip_addr
         self.current_login_ip = ip_addr
-        self.total_logins += 1
+        self.total_logins = (self.total_logins or 0) + 1
+        if password is not None and needs_rehash(self.password):
+            try:
+                self.password = hash_password(password)
+            except PasswordServiceBusy:
+                pass            # Keep the old hash, it will be upgraded on a later login
         db.session.commit()
 
     def verify_password(self, password) -> bool:
-        return bcrypt.checkpw(password.encode('utf-8'), self.password)
+        return check_password(password, self.password)
 
+    @retry_on_busy
     def set_password(self, password) -> None:
-        self.password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        self.password = hash_password(password)
         db.session.commit()
 
     # Method to get user's shoppings lists. Returns a list of ShoppingList objects i.e. List[ShoppingList]
@@ -96,8 +140,54 @@ class User(db.Model, UserMixin):
         return self.role == 'admin'
 
 
-class Recipe(db.Model):
+# Drop cached copies of a user (users/user_cache.py) once changes to the user, such as a new password, role or
+# login security fields, are committed.
+db.event.listen(User, 'after_update', user_cache.mark_changed)
+db.event.listen(User, 'after_delete', user_cache.mark_changed)
+db.event.listen(Session, 'after_commit', user_cache.invalidate_committed)
+db.event.listen(Session, 'after_rollback', user_cache.discard_uncommitted)
+
+# Make cached query results (cache.py) that depend on the rows a transaction wrote stale once it commits
+db.event.listen(Session, 'after_flush', cache.collect_flushed)
+db.event.listen(Session, 'do_orm_execute', cache.collect_bulk)
+db.event.listen(Session, 'after_commit', cache.invalidate_committed)
+db.event.listen(Session, 'after_rollback', cache.discard_uncommitted)
+
+# Full-text search tables (search_index.py) are created and dropped with the rest of the schema
+db.event.listen(db.metadata, 'after_create', search_index.create)
+db.event.listen(db.metadata, 'before_drop', search_index.drop)
+
+
+# Session event listener (do_orm_execute). Leaves soft deleted rows out of every ORM query, including relationship
+# loads such as user.recipes. Pass execution_options(include_deleted=True) to see them, e.g. to restore a row.
+@db.event.listens_for(Session, 'do_orm_execute')
+def hide_soft_deleted(orm_execute_state) -> None:
+    if orm_execute_state.is_select and not orm_execute_state.is_column_load and \
+            not orm_execute_state.execution_options.get('include_deleted', False):
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            with_loader_criteria(SoftDeleteMixin, lambda cls: cls.deleted_at.is_(None), include_aliases=True))
+
+
+DEFAULT_RATING_PRIOR_MEAN = 3.0
+DEFAULT_RATING_PRIOR_WEIGHT = 5
+
+
+# Returns (mean, weight) of the prior used for Recipe.weighted_rating, from RATING_PRIOR_MEAN and RATING_PRIOR_WEIGHT
+def rating_prior() -> tuple:
+    if not has_app_context():
+        return DEFAULT_RATING_PRIOR_MEAN, DEFAULT_RATING_PRIOR_WEIGHT
+    return (current_app.config.get('RATING_PRIOR_MEAN', DEFAULT_RATING_PRIOR_MEAN),
+            current_app.config.get('RATING_PRIOR_WEIGHT', DEFAULT_RATING_PRIOR_WEIGHT))
+
+
+class Recipe(db.Model, SoftDeleteMixin):
     __tablename__ = 'recipes'
+    # Best rated recipes first without sorting: every ORM query filters on deleted_at, and the recipes page can also
+    # filter on serves
+    __table_args__ = (
+        db.Index('ix_recipes_leaderboard', 'deleted_at', 'weighted_rating'),
+        db.Index('ix_recipes_serves_leaderboard', 'serves', 'deleted_at', 'weighted_rating'),
+    )
 
     # Recipe details
     id = db.Column(db.Integer, primary_key=True)
@@ -107,6 +197,13 @@ class Recipe(db.Model):
     serves = db.Column(db.Integer, nullable=False)
     calories = db.Column(db.Integer, nullable=True)
     rating = db.Column(db.Float, nullable=True)
+    # Sum and number of the recipe's ratings, kept up to date as ratings change (see rating_added) so the average
+    # never has to be worked out from every rating
+    rating_sum = db.Column(db.Integer, nullable=True, default=0)
+    rating_count = db.Column(db.Integer, nullable=True, default=0)
+    # Bayesian average used for ranking: the ratings plus RATING_PRIOR_WEIGHT made-up ratings of RATING_PRIOR_MEAN, so
+    # a recipe needs several good ratings to rank above well-loved ones
+    weighted_rating = db.Column(db.Float, nullable=True, default=lambda: rating_prior()[0])
 
     # Links to other tables
     ingredients = db.relationship("Ingredient", cascade="all, delete", backref='recipe')
@@ -120,6 +217,9 @@ class Recipe(db.Model):
         self.serves = serves
         self.calories = calories
         self.rating = 0
+        self.rating_sum = 0
+        self.rating_count = 0
+        self.weighted_rating = rating_prior()[0]
 
     def __str__(self):
         ingredient_block = 'Ingredients: \n' + '\n'.join([ingredient.__str__() for ingredient in self.ingredients])
@@ -148,22 +248,14 @@ class Recipe(db.Model):
     def get_calories(self) -> int:
         return self.calories
 
-    # Method to get the recipe's rating
+    # Method to get the recipe's rating, the average of its ratings rounded to the nearest 0.5
     def get_rating(self) -> float:
-        self.update_rating()
         return self.rating
 
     # Method to get recipe's ingredients
     def get_ingredients(self):
         return self.ingredients
 
-    # Method to update recipe's rating attribute. Made for internal use (shouldn't need to be called from front end)
-    def update_rating(self):
-        ratings = self.ratings
-        avg_rating = sum([rating.get_rating() for rating in ratings]) / len(ratings)
-        self.rating = round(avg_rating * 2) / 2         # Round to nearest 0.5
-        db.session.commit()
-
     def get_qfoods_ingredients(self):     # -> List[QuantifiedFoodItem]
         return [ingredient.qfooditem for ingredient in self.get_ingredients()]
 
@@ -172,7 +264,8 @@ class Rating(db.Model):
     __tablename__ = 'ratings'
     user_id = db.Column(db.Integer, db.ForeignKey(User.id, ondelete='CASCADE'), primary_key=True, nullable=False)
     recipe_id = db.Column(db.Integer, db.ForeignKey(Recipe.id), primary_key=True, nullable=False)
-    rating = db.Column(db.Integer)              # Need to validate that incoming value is between 0 & 5
+    # Need to validate that incoming value is between 0 & 5. The old value is loaded before a change, see rating_updated
+    rating = column_property(db.Column(db.Integer), active_history=True)
 
     def __init__(self, user_id: int, recipe_id: int, rating: int):
         self.user_id = user_id
@@ -182,12 +275,103 @@ class Rating(db.Model):
     def get_rating(self) -> int:
         return self.rating
 
+    @retry_on_busy
     def set_rating(self, rating: int) -> None:
         self.rating = rating
         db.session.commit()
 
 
-class ShoppingList(db.Model):
+# Recipe.rating for a sum and number of ratings, rounded to the nearest 0.5. 0 when there are no ratings.
+def _average_rating(rating_sum, rating_count):
+    return case((rating_count > 0, func.round(rating_sum * 2.0 / rating_count) / 2.0), else_=0)
+
+
+# Recipe.weighted_rating for a sum and number of ratings. Changing the prior only affects recipes rated afterwards until
+# recompute_rating_aggregates() is run.
+def _weighted_rating(rating_sum, rating_count):
+    mean, weight = rating_prior()
+    return (rating_sum + mean * weight) / (rating_count + weight)
+
+
+# Method to add to a recipe's rating_sum and rating_count and update its ratings, in one UPDATE so concurrent ratings
+# can't overwrite each other's changes. Run on the flush's connection from the Rating mapper events below.
+def _add_to_rating(connection, target, rating_sum, rating_count) -> None:
+    if not rating_sum and not rating_count:
+        return
+    recipes = Recipe.__table__
+    connection.execute(update(recipes).where(recipes.c.id == target.recipe_id).values(
+        rating_sum=recipes.c.rating_sum + rating_sum, rating_count=recipes.c.rating_count + rating_count,
+        rating=_average_rating(recipes.c.rating_sum + rating_sum, recipes.c.rating_count + rating_count),
+        weighted_rating=_weighted_rating(recipes.c.rating_sum + rating_sum, recipes.c.rating_count + rating_count)))
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('rated_recipe_ids', set()).add(target.recipe_id)
+
+
+def _counted(rating) -> tuple:
+    return (0, 0) if rating is None else (rating, 1)
+
+
+# Mapper event listeners for Rating. Ratings without a value aren't counted.
+def rating_added(mapper, connection, target) -> None:
+    _add_to_rating(connection, target, *_counted(target.rating))
+
+
+def rating_updated(mapper, connection, target) -> None:
+    history = inspect(target).attrs.rating.history
+    if history.added or history.deleted:
+        (new_sum, new_count), (old_sum, old_count) = _counted(target.rating), \
+            _counted(history.deleted[0] if history.deleted else None)
+        _add_to_rating(connection, target, new_sum - old_sum, new_count - old_count)
+
+
+# Runs before the row is deleted, so its value can still be loaded if it was expired
+def rating_removed(mapper, connection, target) -> None:
+    rating_sum, rating_count = _counted(target.rating)
+    _add_to_rating(connection, target, -rating_sum, -rating_count)
+
+
+# Session event listener (after_flush_postexec). Recipes in the session whose totals were changed by SQL are expired, so
+# their new rating is loaded the next time it is used.
+def expire_rated_recipes(session, flush_context) -> None:
+    for recipe_id in session.info.pop('rated_recipe_ids', ()):
+        recipe = session.identity_map.get(session.identity_key(Recipe, recipe_id))
+        if recipe is not None:
+            session.expire(recipe, ['rating', 'rating_sum', 'rating_count', 'weighted_rating'])
+
+
+# Method to work out rating_sum, rating_count, rating and weighted_rating again from the ratings table, for the
+# recipes with the given ids (a list or a select) or every recipe. Needed when ratings are removed by bulk DELETE
+# statements, which skip the mapper events, after the rating prior is changed and to fill in the columns of an existing
+# database. With excluding_user_id, that user's ratings are left out, so the statement can run before they are
+# deleted. Returns one UPDATE statement.
+def rating_aggregate_update(recipe_ids=None, excluding_user_id=None):
+    recipes, ratings = Recipe.__table__, Rating.__table__
+    rated = [ratings.c.recipe_id == recipes.c.id]
+    if excluding_user_id is not None:
+        rated.append(ratings.c.user_id != excluding_user_id)
+    rating_sum = select(func.coalesce(func.sum(ratings.c.rating), 0)).where(*rated).scalar_subquery()
+    rating_count = select(func.count(ratings.c.rating)).where(*rated).scalar_subquery()
+    statement = update(recipes).values(rating_sum=rating_sum, rating_count=rating_count,
+                                       rating=_average_rating(rating_sum, rating_count),
+                                       weighted_rating=_weighted_rating(rating_sum, rating_count))
+    if recipe_ids is not None:
+        statement = statement.where(recipes.c.id.in_(recipe_ids))
+    return statement
+
+
+# Method to run rating_aggregate_update() in the current transaction (or on the given connection)
+def recompute_rating_aggregates(recipe_ids=None, connection=None) -> None:
+    (connection or db.session).execute(rating_aggregate_update(recipe_ids))
+
+
+db.event.listen(Rating, 'after_insert', rating_added)
+db.event.listen(Rating, 'after_update', rating_updated)
+db.event.listen(Rating, 'before_delete', rating_removed)
+db.event.listen(Session, 'after_flush_postexec', expire_rated_recipes)
+
+
+class ShoppingList(db.Model, SoftDeleteMixin):
     __tablename__ = 'shoppinglists'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey(User.id), nullable=False)
@@ -208,6 +392,7 @@ class ShoppingList(db.Model):
     def get_name(self) -> str:
         return self.list_name
 
+    @retry_on_busy
     def set_name(self, list_name: str) -> None:
         self.list_name = list_name
         db.session.commit()
@@ -216,6 +401,11 @@ class ShoppingList(db.Model):
         return self.shopping_items
 
 
+# 转换名称为首字母大写，其余小写，保留单个空格
+def format_food_name(food_name: str) -> str:
+    return ' '.join(word.capitalize() for word in food_name.strip().split())
+
+
 class FoodItem(db.Model):
     __tablename__ = 'fooditems'
 
@@ -226,11 +416,11 @@ class FoodItem(db.Model):
     # Declaring relationships to other tables
     quantified_food_item = db.relationship('QuantifiedFoodItem', backref='fooditem')
 
-    def __init__(self, food_name):
-        # 转换名称为首字母大写，其余小写，保留单个空格
-        formatted_name = ' '.join(word.capitalize() for word in food_name.strip().split())
+    def __init__(self, food_name, description=None):
+        formatted_name = format_food_name(food_name)
         self.name = formatted_name
-        self.description = fetch_wikipedia_description(formatted_name)
+        # The description can be passed in when it was fetched in bulk (crawler.fetch_wikipedia_descriptions)
+        self.description = description or fetch_wikipedia_description(formatted_name)
 
     def get_name(self) -> str:
         return self.name
@@ -239,11 +429,52 @@ class FoodItem(db.Model):
         return self.description
 
 
+# Method to normalise a food name for matching: lower case with single spaces.
+def normalize_food_name(name: str) -> str:
+    return ' '.join(name.lower().split())
+
+
+class Nutrition(db.Model):
+    """Calories per serving for a food, loaded from calories.txt / the crawler's output by nutrition_util.py."""
+    __tablename__ = 'nutrition'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    normalized_name = db.Column(db.String(100), nullable=False, unique=True)    # normalize_food_name(name)
+    serving_grams = db.Column(db.Float, nullable=False)
+    kcal = db.Column(db.Float, nullable=False)                                  # per serving
+    category = db.Column(db.String(50), nullable=True)
+    food_id = db.Column(db.Integer, db.ForeignKey(FoodItem.id), nullable=True, index=True)
+
+    fooditem = db.relationship(FoodItem, backref=db.backref('nutrition', uselist=False))
+
+    def __init__(self, name, serving_grams, kcal, category=None):
+        self.name = name
+        self.normalized_name = normalize_food_name(name)
+        self.serving_grams = serving_grams
+        self.kcal = kcal
+        self.category = category
+
+    # Method to get the calories in the given quantity (in grams) of the food
+    def calories_for(self, grams: float) -> float:
+        return grams / self.serving_grams * self.kcal if self.serving_grams else 0
+
+
+# Mapper event listener (after_insert on FoodItem). Links the new food item to its nutrition row, if there is one.
+@db.event.listens_for(FoodItem, 'after_insert')
+def link_nutrition(mapper, connection, target) -> None:
+    nutrition = Nutrition.__table__
+    connection.execute(nutrition.update()
+                       .where(nutrition.c.normalized_name == normalize_food_name(target.name),
+                              nutrition.c.food_id.is_(None))
+                       .values(food_id=target.id))
+
+
 class QuantifiedFoodItem(db.Model):
     __tablename__ = 'quantifiedfooditem'
 
     id = db.Column(db.Integer, primary_key=True)
-    food_id = db.Column(db.Integer, db.ForeignKey(FoodItem.id), nullable=False)
+    food_id = db.Column(db.Integer, db.ForeignKey(FoodItem.id), nullable=False, index=True)
     quantity = db.Column(db.Float, default=0.0)
     units = db.Column(db.String(5), default="g")
 
@@ -276,10 +507,12 @@ class QuantifiedFoodItem(db.Model):
         difference = self.quantity - other.quantity
         return difference
 
+    @retry_on_busy
     def set_quantity(self, quantity: float) -> None:
         self.quantity = quantity
         db.session.commit()
 
+    @retry_on_busy
     def set_units(self, units: str) -> None:
         self.units = units
         db.session.commit()
@@ -328,8 +561,9 @@ class Ingredient(db.Model):
     __tablename__ = 'ingredients'
 
     id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey(Recipe.id, ondelete='CASCADE'), nullable=True)
-    qfood_id = db.Column(db.Integer, db.ForeignKey(QuantifiedFoodItem.id), nullable=True)
+    # Indexed for the recipe's ingredient list and the search index triggers (search_index.py)
+    recipe_id = db.Column(db.Integer, db.ForeignKey(Recipe.id, ondelete='CASCADE'), nullable=True, index=True)
+    qfood_id = db.Column(db.Integer, db.ForeignKey(QuantifiedFoodItem.id), nullable=True, index=True)
 
     def __init__(self, recipe_id, qfood_id):
         self.recipe_id = recipe_id
@@ -356,11 +590,15 @@ class Ingredient(db.Model):
     def get_units(self) -> str:
         return self.qfooditem.get_units()
 
+    # The quantity and units are committed to the quantified food item, which the recipe's cached ingredients
+    # (recipe_util.recipe_ingredients) aren't tagged with, so the recipe's tag is invalidated afterwards
     def set_quantity(self, quantity: float) -> None:
-        self.qfooditem.qfood.set_qauntity(quantity)
+        self.qfooditem.set_quantity(quantity)
+        query_cache.invalidate(f'recipes:{self.recipe_id}')
 
     def set_units(self, units: str) -> None:
         self.qfooditem.set_units(units)
+        query_cache.invalidate(f'recipes:{self.recipe_id}')
 
     def get_name(self) -> str:
         return self.qfooditem.get_name()
@@ -396,6 +634,7 @@ class PantryItem(db.Model):
     def get_expiry(self) -> str:
         return self.expiry
 
+    @retry_on_busy
     def set_expiry(self, expiry: str) -> None:
         self.expiry = expiry
         db.session.commit()
@@ -505,8 +744,20 @@ class InUseRecipe(db.Model):
         self.recipe_id = recipe_id
 
 
+# Server-side session data (users/session_store.py). Not linked to users by a foreign key: anonymous visitors have
+# sessions too, and a deleted user's sessions are simply never loaded again before they expire.
+class UserSession(db.Model):
+    __tablename__ = 'user_sessions'
+
+    id = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
 # Method to create a new QuantifiedFoodItem.
 # Returns the id of the newly created qfooditem.
+@retry_on_busy
 def create_and_get_qfid(food_id, quantity, units) -> int:
     qfi = QuantifiedFoodItem(food_id=food_id,
                              quantity=quantity,
@@ -517,24 +768,77 @@ def create_and_get_qfid(food_id, quantity, units) -> int:
     return qfi.id
 
 
+# Food items whose names only differ in plurals, punctuation or notes ("Tomatoes", "tomato (raw)") are the same food
+FOOD_DEDUPE_THRESHOLD = 0.9
+
+
+def _food_item_matcher():
+    return food_matcher.get_matcher(
+        'fooditems', lambda: [(name, food_id) for food_id, name in
+                              db.session.execute(db.select(FoodItem.id, FoodItem.name).order_by(FoodItem.id))])
+
+
+# Method to find an existing food item with a near identical name. The index is rebuilt once if it refers to a
+# food item that no longer exists.
+def _find_similar_food_item(food_name):
+    for _ in range(2):
+        match = _food_item_matcher().best(food_name, FOOD_DEDUPE_THRESHOLD)
+        if match is None:
+            return None
+        food = db.session.get(FoodItem, match.value)
+        if food is not None and food.name == match.name:
+            return food
+        food_matcher.invalidate('fooditems')
+    return None
+
+
 # Method to either retrieve a food item with matching food_name from db.
 # If no food item with the name exists, a new instance is created with the name
 # and returned.
+@retry_on_busy
 def create_or_get_food_item(food_name) -> FoodItem:
-    food = FoodItem.query.filter_by(name=food_name).first()
+    food = FoodItem.query.filter_by(name=format_food_name(food_name)).first() or _find_similar_food_item(food_name)
     if food is None:  # Add a new food_item to the database if queried food doesn't already exist
         food = FoodItem(food_name=food_name)
         db.session.add(food)
         db.session.commit()
+        food_matcher.add('fooditems', food.name, food.id)
     return food
 
 
+# Method to add nullable columns and indexes that were added to a model after its table was created.
+# db.create_all() only creates missing tables, so existing databases would otherwise lack e.g. the deleted_at columns.
+# Runs in its own transaction unless a connection is given.
+def add_missing_columns(connection=None) -> None:
+    if connection is None:
+        with db.engine.begin() as connection:
+            return add_missing_columns(connection)
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+        # Recipes rated before the rating totals were stored
+        if table is Recipe.__table__ and not {'rating_count', 'weighted_rating'} <= existing:
+            recompute_rating_aggregates(connection=connection)
+
+
 def init_db():
     from app import create_app
     app = create_app()
     with app.app_context():
         db.drop_all()
         db.create_all()
+        food_matcher.invalidate()
+        from nutrition_util import load_nutrition
+        load_nutrition()
         admin = User(email='admin@email.com',
                      password='Admin1!',
                      first_name='Alice',
@@ -0,0 +1,145 @@
+# Loads calorie data into the Nutrition table (models.py) and computes calories from it with SQL joins.
+# Rows come from the crawler's per-category state (calories_state.json, see crawler_calories.py) when it exists,
+# and from calories.txt. Loading is one bulk upsert keyed on the normalised name, so re-running it is idempotent
+# and picks up changed values. Food items are linked to their nutrition row by food id, so calorie lookups are
+# an indexed join instead of a scan of calories.txt. Names without an exact match are looked up with the fuzzy
+# matcher in food_matcher.py, whose index is rebuilt after every load.
+
+import json
+
+from sqlalchemy import func, select, update
+
+from app import db
+import food_matcher
+from models import Nutrition, FoodItem, QuantifiedFoodItem, Ingredient, normalize_food_name
+
+CALORIES_PATH = 'calories.txt'
+STATE_PATH = 'calories_state.json'
+
+
+# Method to read (name, serving grams, kcal, category) rows from calories.txt ("name,grams,kcal" per line; names
+# can contain commas).
+def read_calories_file(path=CALORIES_PATH):
+    rows = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                name, _, rest = line.strip().rpartition(',')
+                name, _, grams = name.rpartition(',')
+                try:
+                    rows.append((name, float(grams), float(rest), None))
+                except ValueError:      # Blank or malformed line
+                    continue
+    except FileNotFoundError:
+        pass
+    return rows
+
+
+# Method to read rows from the crawler's state file, with the category taken from each category page's URL.
+def read_crawler_state(path=STATE_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            categories = json.load(f).get('categories', {})
+    except (FileNotFoundError, ValueError):
+        return []
+    return [(name, float(grams), float(kcal), url.rstrip('/').rsplit('/', 1)[-1])
+            for url, entry in categories.items()
+            for name, grams, kcal in entry.get('rows', []) if grams and kcal]
+
+
+def _insert(dialect_name):
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+# Method to (re)load the Nutrition table. The first row for each normalised name wins. Returns the number of rows.
+def load_nutrition(calories_path=CALORIES_PATH, state_path=STATE_PATH) -> int:
+    values = {}
+    for name, grams, kcal, category in read_crawler_state(state_path) + read_calories_file(calories_path):
+        normalized = normalize_food_name(name)
+        if normalized and grams > 0 and normalized not in values:
+            values[normalized] = {'name': name.strip()[:100], 'normalized_name': normalized[:100],
+                                  'serving_grams': grams, 'kcal': kcal, 'category': category}
+    if not values:
+        return 0
+
+    insert = _insert(db.engine.dialect.name)
+    statement = insert(Nutrition.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Nutrition.normalized_name],
+        set_={key: statement.excluded[key] for key in ('name', 'serving_grams', 'kcal', 'category')})
+    db.session.execute(statement, list(values.values()))
+    link_food_items()
+    db.session.commit()
+    food_matcher.invalidate('nutrition')
+    return len(values)
+
+
+# Method to link nutrition rows to existing food items with the same name, in one UPDATE. Food items added through
+# the ORM are linked as they are inserted (models.link_nutrition), this catches the others. Does not commit.
+def link_food_items() -> None:
+    food_id = select(FoodItem.id).where(func.lower(FoodItem.name) == Nutrition.normalized_name) \
+        .order_by(FoodItem.id).limit(1).scalar_subquery()
+    db.session.execute(update(Nutrition).where(Nutrition.food_id.is_(None)).values(food_id=food_id),
+                       execution_options={'synchronize_session': False})
+
+
+# Method to load the table on start up if it is empty
+def ensure_nutrition_loaded() -> None:
+    if db.session.execute(select(Nutrition.id).limit(1)).first() is None:
+        load_nutrition()
+
+
+# Method to find the nutrition row for a food name. Returns a Nutrition or None.
+def get_nutrition(food_name: str):
+    return Nutrition.query.filter_by(normalized_name=normalize_food_name(food_name)).first()
+
+
+# Method to find the nutrition row for a food name, falling back to the most similar name ("Strawberries",
+# "Spagetti") when there is no exact match. Returns a Nutrition or None.
+def match_nutrition(food_name: str, threshold=food_matcher.DEFAULT_THRESHOLD):
+    nutrition = get_nutrition(food_name)
+    if nutrition is not None:
+        return nutrition
+    matcher = food_matcher.get_matcher(
+        'nutrition', lambda: [(name, nutrition_id) for name, nutrition_id in
+                              db.session.execute(select(Nutrition.name, Nutrition.id).order_by(Nutrition.id))])
+    match = matcher.best(food_name, threshold)
+    return db.session.get(Nutrition, match.value) if match else None
+
+
+# SQL expression for the calories in a quantified food item, for use in queries that join Nutrition on
+# Nutrition.food_id == QuantifiedFoodItem.food_id. NULL when the food has no nutrition data.
+def qfood_calories():
+    return QuantifiedFoodItem.quantity / Nutrition.serving_grams * Nutrition.kcal
+
+
+# Method to calculate the calories in `grams` of a food item. Returns 0 if there is no nutrition data.
+def food_calories(food_id: int, grams: float) -> float:
+    nutrition = Nutrition.query.filter_by(food_id=food_id).first()
+    return nutrition.calories_for(grams) if nutrition else 0
+
+
+# Method to calculate calories for many quantified food items in one query. Returns {qfood id: calories}.
+def calories_by_qfood(qfood_ids) -> dict:
+    qfood_ids = [int(qfood_id) for qfood_id in qfood_ids if qfood_id is not None]
+    if not qfood_ids:
+        return {}
+    rows = db.session.execute(
+        select(QuantifiedFoodItem.id, qfood_calories())
+        .outerjoin(Nutrition, Nutrition.food_id == QuantifiedFoodItem.food_id)
+        .where(QuantifiedFoodItem.id.in_(qfood_ids)))
+    return {qfood_id: calories or 0 for qfood_id, calories in rows}
+
+
+# Method to calculate a recipe's calories from its ingredients with a single aggregate query.
+def recipe_calories(recipe_id: int) -> float:
+    return db.session.scalar(
+        select(func.coalesce(func.sum(qfood_calories()), 0))
+        .select_from(Ingredient)
+        .join(QuantifiedFoodItem, Ingredient.qfood_id == QuantifiedFoodItem.id)
+        .join(Nutrition, Nutrition.food_id == QuantifiedFoodItem.food_id)
+        .where(Ingredient.recipe_id == recipe_id))
@@ -0,0 +1,98 @@
+# Test file for nutrition_util.py
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import models
+import nutrition_util as nu
+from app import db
+from shopping.shopping_util import fetch_calories_from_file
+from testing_util import DatabaseTestCase
+
+
+class TestNutritionUtil(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        # The tests add their own food items, start without the sample ones
+        db.session.execute(db.update(models.Nutrition).values(food_id=None))
+        db.session.execute(db.delete(models.FoodItem))
+        self.directory = tempfile.mkdtemp()
+        self.calories_path = os.path.join(self.directory, 'calories.txt')
+        self.state_path = os.path.join(self.directory, 'calories_state.json')
+        self.write_calories(['\n', 'Apple,100,52\n', 'French Fries, deep-fried,100,129\n', 'apple,100,60\n',
+                             'Rice,100,130\n', 'Broken line\n'])
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def write_calories(self, lines) -> None:
+        with open(self.calories_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+
+    def load(self) -> int:
+        return nu.load_nutrition(self.calories_path, self.state_path)
+
+    def add_food(self, name) -> models.FoodItem:
+        with patch('models.fetch_wikipedia_description', return_value='Food'):
+            food = models.FoodItem(food_name=name)
+        db.session.add(food)
+        db.session.commit()
+        return food
+
+    def test_load_is_idempotent(self) -> None:
+        db.session.execute(db.delete(models.Nutrition))
+        self.assertEqual(self.load(), 3)
+        self.assertEqual(self.load(), 3)
+        self.assertEqual(models.Nutrition.query.count(), 3)
+        # The first row for a name wins, names may contain commas
+        self.assertEqual(nu.get_nutrition('APPLE').kcal, 52)
+        self.assertEqual(nu.get_nutrition('french fries,  deep-fried').kcal, 129)
+
+    def test_reload_updates_values_and_uses_crawler_categories(self) -> None:
+        self.load()
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump({'categories': {'https://example.com/food/fruit': {'rows': [['Apple', '100', '55']]}}}, f)
+        self.load()
+        apple = nu.get_nutrition('apple')
+        self.assertEqual((apple.kcal, apple.category), (55, 'fruit'))
+
+    def test_food_items_are_linked(self) -> None:
+        existing = self.add_food('rice')            # Created before the data is loaded
+        db.session.execute(db.delete(models.Nutrition))
+        db.session.commit()
+        self.load()
+        new = self.add_food('apple')                # Linked when inserted
+        self.assertEqual(db.session.get(models.FoodItem, existing.id).nutrition.name, 'Rice')
+        self.assertEqual(new.nutrition.name, 'Apple')
+        self.assertEqual(nu.food_calories(new.id, 200), 104)
+
+    def test_calorie_joins(self) -> None:
+        self.load()
+        apple, rice, unknown = self.add_food('Apple'), self.add_food('Rice'), self.add_food('Zzyzx Root')
+        apple_qfood = models.create_and_get_qfid(apple.id, 50, 'g')
+        rice_qfood = models.create_and_get_qfid(rice.id, 200, 'g')
+        unknown_qfood = models.create_and_get_qfid(unknown.id, 100, 'g')
+        self.assertEqual(nu.calories_by_qfood([apple_qfood, str(rice_qfood), unknown_qfood]),
+                         {apple_qfood: 26, rice_qfood: 260, unknown_qfood: 0})
+
+        recipe = models.Recipe(user_id=1, recipe_name='Rice', cooking_method='Boil', serves=1, calories=None)
+        db.session.add(recipe)
+        db.session.flush()
+        for qfood_id in (apple_qfood, rice_qfood, unknown_qfood):
+            db.session.add(models.Ingredient(recipe_id=recipe.id, qfood_id=qfood_id))
+        db.session.commit()
+        self.assertEqual(nu.recipe_calories(recipe.id), 286)
+
+    def test_fetch_calories_from_file(self) -> None:
+        self.load()
+        self.assertEqual(fetch_calories_from_file('Rice'), (100, 130))
+        self.assertEqual(fetch_calories_from_file('Unknown food'), (None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,12 +3,16 @@
 
 from models import PantryItem, create_and_get_qfid, create_or_get_food_item
 from app import db
+from nutrition_util import food_calories
 
 
 # Method to add a new item to a users pantry by creating a new pantryitem linked to the user.
+# If no calories are given they are calculated from the nutrition table.
 def create_pantry_item(user_id: int, food_name: str, quantity: str, calories: str, expiry: str) -> PantryItem:
     food_item = create_or_get_food_item(food_name)
     qfood_id = create_and_get_qfid(food_id=food_item.id, quantity=float(quantity), units='g')
+    if calories in (None, ''):
+        calories = food_calories(food_item.id, float(quantity))
     pantry_item = PantryItem(user_id=user_id, qfood_id=qfood_id, expiry=expiry, calories=float(calories))
     db.session.add(pantry_item)
     db.session.commit()
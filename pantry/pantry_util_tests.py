@@ -3,18 +3,11 @@
 
 import unittest
 import models
-from app import create_app, db
-from populate_db import add_sample_users, add_food_items
+from testing_util import DatabaseTestCase
 import pantry.pantry_util as pu
 
 
-class TestPantryUtils(unittest.TestCase):
-
-    # Setup method to initialize the database and populate it with sample data before each test
-    def setUp(self) -> None:
-        models.init_db()
-        add_sample_users()
-        add_food_items()
+class TestPantryUtils(DatabaseTestCase):
 
     # Test case for creating a pantry item
     def test_create_pantry_item(self) -> None:
@@ -34,6 +27,4 @@ class TestPantryUtils(unittest.TestCase):
 
 
 if __name__ == '__main__':
-    app = create_app()
-    with app.app_context():
-        unittest.main(exit=False)
+    unittest.main()
@@ -4,14 +4,18 @@ import datetime
 
 from flask_login import login_required, current_user
 
-from app import db
-from models import PantryItem, QuantifiedFoodItem, FoodItem, Barcode
+import search_index
+from app import db, limiter
+from models import PantryItem, QuantifiedFoodItem, FoodItem
 from pantry.pantry_util import create_pantry_item, delete_pantry_item
-from barcodes.barcode_util import scan_barcode_file, scan_barcode_webcam
+from barcodes.barcode_util import scan_barcode_file, scan_barcode_webcam, find_barcode
 
 # Initialize pantry blueprint
 pantry_blueprint = Blueprint('pantry', __name__, template_folder='templates')
 
+# Scanning shares its limit with the barcodes blueprint (see rate_limit.py)
+limiter.limit_blueprint(pantry_blueprint, 'RATELIMIT_BARCODES', endpoints={'pantry.get_barcode_data'})
+
 # Debugging to confirm the correct template folder
 print("Template folder:", pantry_blueprint.template_folder)
 
@@ -91,15 +95,9 @@ def get_barcode_data():
         scan = scan_barcode_webcam(timeout_length=10)
     else:
         scan = scan_barcode_file(filepath)
-    barcode = Barcode.query.filter(Barcode.barcode == scan).first()
-    if barcode is None:
+    data = find_barcode(scan)
+    if data is None:
         return None
-
-    data = {
-        'name': barcode.get_name(),
-        'quantity': barcode.get_quantity(),
-        'units': barcode.get_units(),
-    }
     return jsonify(data)
 
 @pantry_blueprint.route('/search', methods=['GET', 'POST'])
@@ -111,9 +109,9 @@ def search():
         items = (db.session.query(PantryItem)
                  .join(QuantifiedFoodItem)
                  .join(FoodItem)
-                 .filter(FoodItem.name.ilike(f"%{item_name}%"))
-                 .filter(PantryItem.user_id == current_user.id)
-                 .all())
+                 .filter(PantryItem.user_id == current_user.id))
+        food_ids = search_index.food_ids_matching(item_name)     # Full-text search, see search_index.py
+        items = items.filter(FoodItem.id.in_(food_ids)).all() if food_ids is not None else items.all()
 
     return render_template('pantry/search.html', items=items)  # Pass the result directly to the template
 
@@ -6,6 +6,7 @@
 import random
 from typing import Dict
 from app import create_app, db
+from crawler import fetch_wikipedia_descriptions
 
 import models
 
@@ -182,8 +183,11 @@ def add_sample_users():
 
 
 def add_food_items():
-    for food in foodItems:
-        new_food = models.FoodItem(food_name=food['name'])
+    # Fetch every description concurrently up front instead of one request per FoodItem
+    names = [models.format_food_name(food['name']) for food in foodItems]
+    descriptions = fetch_wikipedia_descriptions(names)
+    for name in names:
+        new_food = models.FoodItem(food_name=name, description=descriptions[name])
         db.session.add(new_food)
         db.session.flush()
         db.session.refresh(new_food)
@@ -307,8 +311,6 @@ def create_ratings() -> None:
             new_rating = models.Rating(chosen_user.id, recipe.id, rating)
             db.session.add(new_rating)
     db.session.commit()
-    for recipe in recipeObjects:
-        recipe.update_rating()
 
 
 def create_barcodes() -> None:
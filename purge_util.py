@@ -0,0 +1,123 @@
+# Background purger for soft deleted recipes, shopping lists and users (see SoftDeleteMixin in models.py).
+# Deleting in a request only sets deleted_at, which hides the row straight away and can be undone with restore().
+# Once a row has been deleted for longer than SOFT_DELETE_RETENTION seconds the purger removes it, together with
+# its children and their QuantifiedFoodItems, in small batches. Each batch is its own short transaction and the
+# purger pauses between batches, so it never holds the SQLite write lock for long.
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from app import db
+from models import Recipe, ShoppingList, User, Ingredient, Rating, CompatibleDiet, InUseRecipe, ShoppingItem, \
+    Barcode, QuantifiedFoodItem
+from users.session_store import sweep_expired_sessions
+
+DEFAULT_RETENTION = 24 * 60 * 60    # seconds a soft deleted row can be restored
+DEFAULT_INTERVAL = 5 * 60           # seconds between purges
+DEFAULT_BATCH_SIZE = 50             # rows per transaction
+DEFAULT_BATCH_PAUSE = 0.2           # seconds between transactions
+
+_purger = None
+_purger_lock = threading.Lock()
+
+
+# Method to select the ids of up to `limit` rows of a model that were soft deleted before the cutoff.
+def _expired_ids(model, cutoff, limit):
+    statement = select(model.id).where(model.deleted_at < cutoff).order_by(model.deleted_at).limit(limit)
+    return db.session.scalars(statement, execution_options={'include_deleted': True}).all()
+
+
+# Deletes barcodes and quantified food items by id. Must be called inside the batch's transaction.
+def _delete_qfoods(qfood_ids) -> None:
+    qfood_ids = [int(qfood_id) for qfood_id in qfood_ids if qfood_id is not None]
+    if qfood_ids:
+        db.session.execute(delete(Barcode).where(Barcode.qfood_id.in_(qfood_ids)))
+        db.session.execute(delete(QuantifiedFoodItem).where(QuantifiedFoodItem.id.in_(qfood_ids)))
+
+
+# Method to remove recipes, their ingredients (and the ingredients' qfoods), ratings, diets and in-use entries.
+def purge_recipes(recipe_ids) -> None:
+    qfood_ids = db.session.scalars(select(Ingredient.qfood_id).where(Ingredient.recipe_id.in_(recipe_ids))).all()
+    for model in (Ingredient, Rating, CompatibleDiet, InUseRecipe):
+        db.session.execute(delete(model).where(model.recipe_id.in_(recipe_ids)))
+    db.session.execute(delete(Recipe).where(Recipe.id.in_(recipe_ids)))
+    _delete_qfoods(qfood_ids)
+    db.session.commit()
+
+
+# Method to remove shopping lists, their shopping items and the items' qfoods.
+def purge_shopping_lists(list_ids) -> None:
+    qfood_ids = db.session.scalars(select(ShoppingItem.qfood_id).where(ShoppingItem.list_id.in_(list_ids))).all()
+    db.session.execute(delete(ShoppingItem).where(ShoppingItem.list_id.in_(list_ids)))
+    db.session.execute(delete(ShoppingList).where(ShoppingList.id.in_(list_ids)))
+    _delete_qfoods(qfood_ids)
+    db.session.commit()
+
+
+# Method to permanently remove everything that was soft deleted more than `retention` seconds ago.
+# Returns the number of recipes, shopping lists and users removed.
+def purge_deleted(app, retention=None, batch_size=None, pause=None):
+    from admin.admin_util import delete_user_related_data
+
+    retention = app.config.get('SOFT_DELETE_RETENTION', DEFAULT_RETENTION) if retention is None else retention
+    batch_size = batch_size or app.config.get('PURGE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    pause = app.config.get('PURGE_BATCH_PAUSE', DEFAULT_BATCH_PAUSE) if pause is None else pause
+    cutoff = datetime.now() - timedelta(seconds=retention)
+
+    purged = {'recipes': 0, 'shopping_lists': 0, 'users': 0}
+    for key, model, purge in (('recipes', Recipe, purge_recipes), ('shopping_lists', ShoppingList,
+                                                                    purge_shopping_lists)):
+        while True:
+            ids = _expired_ids(model, cutoff, batch_size)
+            if not ids:
+                break
+            try:
+                purge(ids)
+            except Exception:
+                db.session.rollback()
+                raise
+            purged[key] += len(ids)
+            time.sleep(pause)
+
+    # Users can own a lot of data, so each user is a batch of its own
+    while True:
+        ids = _expired_ids(User, cutoff, 1)
+        if not ids:
+            break
+        delete_user_related_data(ids[0])
+        purged['users'] += 1
+        time.sleep(pause)
+    return purged
+
+
+# Method to start the purger thread for this process. Calling it again (create_app() is called more than once
+# per process) has no effect.
+def start_purger(app) -> None:
+    global _purger
+    with _purger_lock:
+        if _purger is not None and _purger.is_alive():
+            return
+        _purger = threading.Thread(target=_run_purger, args=(app,), name='soft-delete-purger', daemon=True)
+        _purger.start()
+
+
+def _run_purger(app) -> None:
+    while True:
+        time.sleep(app.config.get('PURGE_INTERVAL', DEFAULT_INTERVAL))
+        with app.app_context():
+            try:
+                purged = purge_deleted(app)
+                if any(purged.values()):
+                    app.logger.info(f"Purged soft deleted rows: {purged}")
+            except Exception as e:
+                app.logger.error(f"Purging soft deleted rows failed: {e}")
+            # Expired server-side sessions go at the same time (users/session_store.py)
+            try:
+                swept = sweep_expired_sessions()
+                if swept:
+                    app.logger.info(f"Deleted {swept} expired sessions")
+            except Exception as e:
+                app.logger.error(f"Deleting expired sessions failed: {e}")
@@ -0,0 +1,152 @@
+# Test file for purge_util.py and soft deletion (SoftDeleteMixin in models.py)
+
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from flask import current_app
+from sqlalchemy import text
+
+import models
+from app import db
+from purge_util import purge_deleted
+from recipes.recipe_util import delete_recipe_instance, restore_recipe_instance
+from shopping.shopping_util import delete_shopping_list, restore_shopping_list
+from testing_util import DatabaseTestCase
+from users import user_cache
+
+
+class TestSoftDelete(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        with patch('models.fetch_wikipedia_description', return_value='Food'):
+            food = models.FoodItem(food_name='Rice')
+        db.session.add(food)
+        db.session.commit()
+        self.food_id = food.id
+
+        self.recipe = models.Recipe(user_id=2, recipe_name='Rice', cooking_method='Boil', serves=1, calories=10)
+        self.s_list = models.ShoppingList(user_id=2, list_name='Weekly')
+        db.session.add_all([self.recipe, self.s_list])
+        db.session.flush()
+        db.session.add(models.Ingredient(recipe_id=self.recipe.id, qfood_id=self.new_qfood_id()))
+        db.session.add(models.ShoppingItem(list_id=self.s_list.id, qfood_id=self.new_qfood_id()))
+        db.session.add(models.Rating(user_id=3, recipe_id=self.recipe.id, rating=4))
+        db.session.commit()
+
+    def new_qfood_id(self) -> int:
+        return models.create_and_get_qfid(self.food_id, 100, 'g')
+
+    # Moves deleted_at back so the rows are past the undo window
+    def age_deleted_rows(self, seconds) -> None:
+        for model in (models.Recipe, models.ShoppingList, models.User):
+            db.session.execute(db.update(model).where(model.deleted_at.isnot(None))
+                               .values(deleted_at=datetime.now() - timedelta(seconds=seconds)))
+        db.session.commit()
+
+    def test_soft_deleted_rows_are_hidden(self) -> None:
+        recipe_id, list_id = self.recipe.id, self.s_list.id
+        delete_recipe_instance(self.recipe)
+        delete_shopping_list(self.s_list)
+        db.session.expunge_all()        # As in a new request
+
+        self.assertIsNone(models.Recipe.query.filter_by(id=recipe_id).first())
+        self.assertIsNone(db.session.get(models.ShoppingList, list_id))
+        user = db.session.get(models.User, 2)
+        self.assertEqual(user.get_recipes(), [])
+        self.assertEqual(user.get_shopping_lists(), [])
+        # Nothing has actually been deleted yet
+        self.assertIsNotNone(models.Recipe.query.execution_options(include_deleted=True).filter_by(id=recipe_id).first())
+        self.assertEqual(models.Ingredient.query.filter_by(recipe_id=recipe_id).count(), 1)
+
+    def test_restore(self) -> None:
+        recipe_id, list_id = self.recipe.id, self.s_list.id
+        delete_recipe_instance(self.recipe)
+        delete_shopping_list(self.s_list)
+
+        self.assertIsNone(restore_recipe_instance(recipe_id, user_id=3), msg="Only the owner can restore")
+        self.assertIsNotNone(restore_recipe_instance(recipe_id, user_id=2))
+        self.assertIsNotNone(restore_shopping_list(list_id, user_id=2))
+        self.assertIsNotNone(models.Recipe.query.filter_by(id=recipe_id).first())
+        self.assertIsNotNone(models.ShoppingList.query.filter_by(id=list_id).first())
+
+    def test_deleted_rows_can_be_restored_from_their_pages(self) -> None:
+        delete_recipe_instance(self.recipe)
+        delete_shopping_list(self.s_list)
+        client = self.app.test_client()
+        client.post('/user/login', data={'email': 'gathelstan0@npr.org', 'password': 'pO6>#*9hV'})
+        self.assertIn(f'/recipes/restore_recipe/{self.recipe.id}', client.get('/recipes/your_recipes').text)
+        self.assertIn(f'/shopping/restore_list/{self.s_list.id}', client.get('/shopping/shopping_list').text)
+
+    def test_recipe_in_use_by_another_user_can_be_deleted(self) -> None:
+        recipe_id = self.recipe.id
+        db.session.add(models.InUseRecipe(user_id=3, recipe_id=recipe_id))
+        db.session.commit()
+        delete_recipe_instance(self.recipe)
+        db.session.expunge_all()        # As in a new request
+        client = self.app.test_client()
+        client.post('/user/login', data={'email': 'dkosel1@noaa.gov', 'password': 'aX7|S&9hZrRT'})
+        response = client.get('/recipes/in_use_recipes')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(f'/recipes/recipes/complete_recipe/{recipe_id}', response.text)
+        client.post(f'/recipes/recipes/complete_recipe/{recipe_id}', data={'rating': '5'})
+        self.assertEqual(models.Rating.query.filter_by(user_id=3, recipe_id=recipe_id).one().rating, 4)
+        # The recipe is back in the list once its owner restores it
+        restore_recipe_instance(recipe_id, user_id=2)
+        self.assertIn(f'/recipes/recipes/complete_recipe/{recipe_id}', client.get('/recipes/in_use_recipes').text)
+
+    def test_only_deleted_users_can_be_purged(self) -> None:
+        client = self.app.test_client()
+        client.post('/user/login', data={'email': 'admin@email.com', 'password': 'Admin1!'})
+        with patch('admin.views.start_delete_user_job', return_value='job') as start:
+            client.post('/admin/purge_user/2')
+            start.assert_not_called()
+            db.session.get(models.User, 2).soft_delete()
+            self.assertIn('/admin/purge_user/2', client.get('/admin/view_all_users').text)
+            client.post('/admin/purge_user/2')
+            start.assert_called_once_with(2)
+
+    def test_soft_deleted_user_cannot_be_loaded(self) -> None:
+        user = db.session.get(models.User, 2)
+        user_cache.get_user(2)
+        user.soft_delete()
+        db.session.expunge_all()        # As in a new request
+        self.assertIsNone(user_cache.get_user(2))
+        self.assertIsNone(models.User.query.filter_by(email='gathelstan0@npr.org').first())
+
+    def test_purge_waits_for_retention(self) -> None:
+        delete_recipe_instance(self.recipe)
+        self.assertEqual(purge_deleted(current_app, retention=60, pause=0),
+                         {'recipes': 0, 'shopping_lists': 0, 'users': 0})
+        self.assertEqual(models.Ingredient.query.count(), 1)
+
+    def test_purge_removes_rows_and_children(self) -> None:
+        recipe_id = self.recipe.id
+        delete_recipe_instance(self.recipe)
+        delete_shopping_list(self.s_list)
+        db.session.get(models.User, 3).soft_delete()
+        self.age_deleted_rows(120)
+
+        purged = purge_deleted(current_app, retention=60, batch_size=1, pause=0)
+        self.assertEqual(purged, {'recipes': 1, 'shopping_lists': 1, 'users': 1})
+        self.assertIsNone(models.Recipe.query.execution_options(include_deleted=True).filter_by(id=recipe_id).first())
+        self.assertEqual(models.Ingredient.query.count(), 0)
+        self.assertEqual(models.ShoppingItem.query.count(), 0)
+        self.assertEqual(models.Rating.query.count(), 0)
+        self.assertEqual(models.QuantifiedFoodItem.query.count(), 0)
+        self.assertEqual(models.User.query.execution_options(include_deleted=True).filter_by(id=3).count(), 0)
+
+    def test_add_missing_columns(self) -> None:
+        db.session.execute(text('DROP INDEX ix_shoppinglists_deleted_at'))
+        db.session.execute(text('ALTER TABLE shoppinglists DROP COLUMN deleted_at'))
+        db.session.commit()
+        models.add_missing_columns(db.session.connection())
+        columns = [row[1] for row in db.session.execute(text('PRAGMA table_info(shoppinglists)'))]
+        self.assertIn('deleted_at', columns)
+        indexes = [row[1] for row in db.session.execute(text('PRAGMA index_list(shoppinglists)'))]
+        self.assertIn('ix_shoppinglists_deleted_at', indexes)
+
+
+if __name__ == '__main__':
+    unittest.main()
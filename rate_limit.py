@@ -0,0 +1,153 @@
+# Rate limiting for the most CPU-expensive endpoints: login and registration (bcrypt) and barcode scanning.
+# Limits are attached to whole blueprints (optionally narrowed to some endpoints/methods) as before_request hooks,
+# so a client over its limit gets a cheap 429 before any hashing or decoding work starts.
+#
+# Limits are strings such as "10/minute" or "5/30s", read from the app config key named when the limit is
+# attached. Clients are keyed by user id when logged in, otherwise by IP address.
+# By default each worker process keeps its own token buckets. Setting RATELIMIT_STORAGE_URL to a redis:// URL
+# (or memory:// for the in-process stand-in, see local_redis.py) switches to a sliding window counter shared by
+# every worker.
+
+import math
+import threading
+import time
+
+from flask import current_app, request, Response
+from flask_login import current_user
+
+from local_redis import get_redis
+
+_PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600,
+            'd': 86400, 'day': 86400}
+
+
+# Method to parse a limit string such as "10/minute", "10 per hour" or "5/30s".
+# Returns (number of requests, period in seconds).
+def parse_rate(rate: str):
+    count, _, period = rate.replace(' per ', '/').partition('/')
+    period = period.strip().lower()
+    multiplier = ''.join(ch for ch in period if ch.isdigit())
+    unit = period[len(multiplier):].rstrip('s') or 's'
+    if unit not in _PERIODS:
+        raise ValueError(f'Invalid rate limit: {rate}')
+    return int(count), _PERIODS[unit] * int(multiplier or 1)
+
+
+class MemoryBackend:
+    """Token buckets held in this process. Each bucket holds up to `limit` tokens and refills at limit/period."""
+
+    def __init__(self, max_keys=10000, clock=time.monotonic):
+        self._clock = clock
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}      # key -> [tokens, last refill time]
+
+    # Method to take one token for the key. Returns (allowed, seconds until a token is available).
+    def hit(self, key: str, limit: int, period: float):
+        now = self._clock()
+        rate = limit / period
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self._max_keys:
+                    self._prune(now, period)
+                bucket = self._buckets[key] = [float(limit), now]
+            else:
+                bucket[0] = min(float(limit), bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0
+            return False, (1 - bucket[0]) / rate
+
+    # Drops buckets that have had time to refill completely, they are equivalent to new ones.
+    def _prune(self, now, period) -> None:
+        for key in [key for key, (_, last) in self._buckets.items() if now - last >= period]:
+            del self._buckets[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBackend:
+    """Sliding window counter shared through Redis. The count for the current fixed window is combined with the
+    previous window's count, weighted by how much of the previous window still overlaps the sliding window."""
+
+    def __init__(self, client, prefix='ratelimit:', clock=time.time):
+        self._client = client
+        self._prefix = prefix
+        self._clock = clock
+
+    # The request is counted first and the count INCR returns decides, so workers hitting the same key at once each
+    # see a different count and no more than the limit get through. A rejected request is taken off the count again.
+    def hit(self, key: str, limit: int, period: float):
+        now = self._clock()
+        window = int(now // period)
+        elapsed = now - window * period
+        current_key = f'{self._prefix}{key}:{window}'
+        previous = int(self._client.get(f'{self._prefix}{key}:{window - 1}') or 0)
+        weight = 1 - elapsed / period
+
+        current = int(self._client.incr(current_key))
+        self._client.expire(current_key, int(math.ceil(period * 2)))
+        if previous * weight + current > limit:
+            self._client.incr(current_key, -1)
+            return False, self._retry_after(limit, previous, current - 1, period, elapsed)
+        return True, 0
+
+    # Time until the weighted previous window has decayed enough to admit one more request.
+    @staticmethod
+    def _retry_after(limit, previous, current, period, elapsed):
+        if previous and current < limit:
+            decay_needed = (previous - (limit - 1 - current)) / previous * period
+            return max(min(decay_needed, period) - elapsed, 0.1)
+        return period - elapsed
+
+
+class RateLimiter:
+    def __init__(self):
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    # Method to get the backend for the current app's RATELIMIT_STORAGE_URL. Backends are kept for the life of
+    # the process so that buckets survive create_app() being called again.
+    def backend(self):
+        url = current_app.config.get('RATELIMIT_STORAGE_URL') or ''
+        with self._lock:
+            if url not in self._backends:
+                self._backends[url] = RedisBackend(get_redis(url)) if url else MemoryBackend()
+            return self._backends[url]
+
+    # Method to apply the limit stored in app.config[config_key] to a blueprint. If endpoints or methods are
+    # given, only matching requests count towards (and are checked against) the limit.
+    def limit_blueprint(self, blueprint, config_key: str, endpoints=None, methods=None, key_func=None) -> None:
+        key_func = key_func or client_key
+
+        @blueprint.before_request
+        def check_rate_limit():
+            if not current_app.config.get('RATELIMIT_ENABLED', True):
+                return None
+            if endpoints is not None and request.endpoint not in endpoints:
+                return None
+            if methods is not None and request.method not in methods:
+                return None
+
+            limit, period = parse_rate(current_app.config[config_key])
+            allowed, retry_after = self.backend().hit(f'{config_key}:{key_func()}', limit, period)
+            if not allowed:
+                return too_many_requests(retry_after)
+            return None
+
+
+# Method to identify the client for rate limiting: the user id when logged in, otherwise the IP address.
+def client_key() -> str:
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    return f'ip:{request.remote_addr}'
+
+
+def too_many_requests(retry_after: float) -> Response:
+    return Response('Too Many Requests', status=429, mimetype='text/plain',
+                    headers={'Retry-After': str(max(1, int(math.ceil(retry_after))))})
@@ -0,0 +1,126 @@
+# Test file for rate_limit.py
+
+import threading
+import unittest
+from unittest.mock import patch
+
+from flask import current_app
+
+import models
+from app import limiter
+from local_redis import LocalRedis
+import rate_limit as rl
+from testing_util import DatabaseTestCase
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimitBackends(unittest.TestCase):
+
+    def test_parse_rate(self) -> None:
+        self.assertEqual(rl.parse_rate("10/minute"), (10, 60))
+        self.assertEqual(rl.parse_rate("10 per hour"), (10, 3600))
+        self.assertEqual(rl.parse_rate("5/30s"), (5, 30))
+        self.assertEqual(rl.parse_rate("100/days"), (100, 86400))
+        with self.assertRaises(ValueError):
+            rl.parse_rate("5/fortnight")
+
+    def test_memory_backend_burst_then_refill(self) -> None:
+        clock = FakeClock()
+        backend = rl.MemoryBackend(clock=clock)
+        results = [backend.hit('ip:1', 3, 60)[0] for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+
+        allowed, retry_after = backend.hit('ip:1', 3, 60)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 20)
+
+        clock.now += 20         # One token refilled
+        self.assertTrue(backend.hit('ip:1', 3, 60)[0])
+        self.assertFalse(backend.hit('ip:1', 3, 60)[0])
+        # Other clients have their own bucket
+        self.assertTrue(backend.hit('ip:2', 3, 60)[0])
+
+    def test_memory_backend_prunes_full_buckets(self) -> None:
+        clock = FakeClock()
+        backend = rl.MemoryBackend(max_keys=2, clock=clock)
+        backend.hit('a', 5, 10)
+        backend.hit('b', 5, 10)
+        clock.now += 10
+        backend.hit('c', 5, 10)
+        self.assertEqual(set(backend._buckets), {'c'})
+
+    def test_redis_backend_sliding_window(self) -> None:
+        clock = FakeClock(6000.0)       # Start of a 60 second window
+        backend = rl.RedisBackend(LocalRedis(), clock=clock)
+        self.assertEqual([backend.hit('ip:1', 2, 60)[0] for _ in range(3)], [True, True, False])
+
+        # Half way through the next window half of the previous window's requests still count
+        clock.now += 90
+        self.assertTrue(backend.hit('ip:1', 2, 60)[0])
+        allowed, retry_after = backend.hit('ip:1', 2, 60)
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+
+        clock.now += 60
+        self.assertTrue(backend.hit('ip:1', 2, 60)[0])
+
+    def test_redis_backend_concurrent_hits(self) -> None:
+        # Every worker has read the counts before any of them counts its request
+        workers = 20
+        barrier = threading.Barrier(workers)
+
+        class ConcurrentRedis(LocalRedis):
+            def get(self, name):
+                value = super().get(name)
+                barrier.wait(5)
+                return value
+
+        backend = rl.RedisBackend(ConcurrentRedis(), clock=FakeClock(6000.0))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(backend.hit('ip:1', 5, 60)[0]))
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 5)
+
+
+class TestRateLimitedRoutes(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        current_app.config['RATELIMIT_ENABLED'] = True
+        current_app.config['RATELIMIT_LOGIN'] = '2/minute'
+        current_app.config['RATELIMIT_STORAGE_URL'] = None
+        limiter.backend().reset()
+        self.addCleanup(lambda: limiter.backend().reset())
+        self.client = current_app.test_client()
+
+    def test_login_limited_before_password_check(self) -> None:
+        form = {'email': 'admin@email.com', 'password': 'Wrong1!'}
+        with patch.object(models.User, 'verify_password', return_value=False) as verify:
+            statuses = [self.client.post('/user/login', data=form).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(verify.call_count, 2, msg="Over limit request should not hash the password")
+
+    def test_login_page_not_limited(self) -> None:
+        statuses = {self.client.get('/user/login').status_code for _ in range(5)}
+        self.assertEqual(statuses, {200})
+
+    def test_disabled_limits(self) -> None:
+        current_app.config['RATELIMIT_ENABLED'] = False
+        form = {'email': 'nobody@email.com', 'password': 'Wrong1!'}
+        statuses = {self.client.post('/user/login', data=form).status_code for _ in range(4)}
+        self.assertEqual(statuses, {200})
+
+
+if __name__ == '__main__':
+    unittest.main()
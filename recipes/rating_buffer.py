@@ -0,0 +1,193 @@
+# Write-behind buffer for recipe ratings, installed by create_app() as app.extensions['rating_buffer'].
+# Rating a recipe used to take several write transactions, and a burst of ratings for a popular recipe queued up on
+# SQLite's write lock. With RATING_BUFFER_ENABLED, save_rating() (recipe_util.py) only records the rating in memory
+# and returns. Ratings are kept per (user, recipe), so a user changing their mind before the next flush leaves only
+# their last rating. A flusher thread writes the buffered ratings every RATING_BUFFER_INTERVAL seconds, or as soon as
+# RATING_BUFFER_MAX_SIZE are waiting, in one transaction: an upsert of the ratings and one UPDATE of the rating totals
+# of the recipes they are for (models.rating_aggregate_update).
+#
+# A batch that fails because the database is busy is put back and tried again with the next flush. Any other error
+# (e.g. a rating for a recipe purged meanwhile breaking a foreign key) would fail every time and hold up the ratings
+# after it, so the batch is written again one rating at a time and the ratings that still fail are logged and dropped.
+#
+# Until it is flushed a rating is only held by the worker process. With RATING_BUFFER_FLUSH_ON_EXIT the buffer is
+# flushed when the process exits normally (and by gunicorn's worker_exit hook), so a restart doesn't lose ratings, but
+# a crash loses up to one interval's worth.
+
+import atexit
+import contextlib
+import os
+import threading
+
+from flask import current_app, has_app_context
+
+from app import db
+from models import Rating, rating_aggregate_update
+from sqlite_util import is_busy, retry_on_busy
+
+DEFAULT_INTERVAL = 1.0          # seconds between flushes
+DEFAULT_MAX_SIZE = 500          # buffered ratings that trigger a flush straight away
+
+
+class RatingBuffer:
+    """Ratings waiting to be written, keyed by (user id, recipe id). With background=False there is no flusher thread
+    and full buffers are flushed by the thread adding to them, flush() can be called at any time."""
+
+    def __init__(self, app, interval=DEFAULT_INTERVAL, max_size=DEFAULT_MAX_SIZE, background=True):
+        self._app = app
+        self._interval = interval
+        self._max_size = max_size
+        self._background = background
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()         # One flush at a time, so batches are written in order
+        self._flusher = None
+        self._flusher_pid = None
+        self._stopped = False
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    # Method to buffer a rating. Replaces a rating of the same recipe by the same user that hasn't been written yet.
+    def add(self, user_id: int, recipe_id: int, rating: int) -> None:
+        with self._lock:
+            self._pending[(user_id, recipe_id)] = rating
+            full = len(self._pending) >= self._max_size
+            if self._background:
+                self._start_flusher()
+                if full:
+                    self._wake.notify()
+        if full and not self._background:
+            self.flush()
+
+    # Method to write the buffered ratings. Returns the number written. If the database is busy the ratings are put
+    # back, unless a newer rating by the same user for the same recipe arrived meanwhile, and the error is raised.
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            with self._app_context():
+                try:
+                    _write_ratings(batch)
+                    return len(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    if is_busy(e):
+                        self._put_back(batch)
+                        raise
+                return self._write_one_by_one(batch)
+
+    # Writes the ratings of a failed batch separately, dropping those that fail for any reason but a busy database
+    def _write_one_by_one(self, batch) -> int:
+        written = 0
+        keys = list(batch)
+        for i, key in enumerate(keys):
+            try:
+                _write_ratings({key: batch[key]})
+                written += 1
+            except Exception as e:
+                db.session.rollback()
+                if is_busy(e):
+                    self._put_back({key: batch[key] for key in keys[i:]})
+                    raise
+                user_id, recipe_id = key
+                self._app.logger.error(f'Dropped buffered rating {batch[key]} of recipe {recipe_id} by user '
+                                       f'{user_id}: {e}')
+        return written
+
+    def _put_back(self, batch) -> None:
+        with self._lock:
+            for key, rating in batch.items():
+                self._pending.setdefault(key, rating)
+
+    # Method to flush what is left and stop the flusher thread. Used on shutdown, so failures are logged, not raised.
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped = True
+            self._wake.notify()
+        try:
+            self.flush()
+        except Exception as e:
+            self._app.logger.error(f'Writing buffered ratings on exit failed: {e}')
+
+    # The flusher thread and atexit need the app's context. Threads already in it keep their own, as leaving a context
+    # removes its database session.
+    def _app_context(self):
+        if has_app_context() and current_app._get_current_object() is self._app:
+            return contextlib.nullcontext()
+        return self._app.app_context()
+
+    # The thread is started by the first rating, in the process that receives it. A pre-forking server's workers
+    # don't inherit the parent's threads, so each starts its own.
+    def _start_flusher(self) -> None:
+        if self._stopped or (self._flusher is not None and self._flusher_pid == os.getpid()):
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._run, name='rating-buffer-flusher', daemon=True)
+        self._flusher.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if len(self._pending) < self._max_size and not self._stopped:
+                    self._wake.wait(self._interval)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                self._app.logger.error(f'Writing buffered ratings failed: {e}')
+
+
+# Inserts the ratings, or changes them where the user already rated the recipe, then works out the totals of the
+# rated recipes again. The upsert skips the Rating mapper events that normally keep the totals up to date.
+@retry_on_busy
+def _write_ratings(batch) -> None:
+    rows = [{'user_id': user_id, 'recipe_id': recipe_id, 'rating': rating}
+            for (user_id, recipe_id), rating in batch.items()]
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        upsert = _dialect_insert(dialect)(Rating)
+        db.session.execute(upsert.on_conflict_do_update(index_elements=[Rating.user_id, Rating.recipe_id],
+                                                        set_={'rating': upsert.excluded.rating}), rows)
+    else:
+        for row in rows:
+            db.session.merge(Rating(**row))
+        db.session.flush()
+    db.session.execute(rating_aggregate_update(sorted({recipe_id for _, recipe_id in batch})))
+    db.session.commit()
+
+
+def _dialect_insert(dialect):
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert
+    from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+    return postgresql_insert
+
+
+# Method to set up the app's rating buffer from the RATING_BUFFER_* settings. Does nothing unless
+# RATING_BUFFER_ENABLED is set.
+def install_rating_buffer(app) -> None:
+    if not app.config.get('RATING_BUFFER_ENABLED', False):
+        return
+    buffer = RatingBuffer(app, app.config.get('RATING_BUFFER_INTERVAL', DEFAULT_INTERVAL),
+                          app.config.get('RATING_BUFFER_MAX_SIZE', DEFAULT_MAX_SIZE))
+    app.extensions['rating_buffer'] = buffer
+    if app.config.get('RATING_BUFFER_FLUSH_ON_EXIT', True):
+        atexit.register(buffer.stop)
+
+
+# Returns the current app's rating buffer, or None when ratings are written straight away
+def get_rating_buffer():
+    return current_app.extensions.get('rating_buffer')
+
+
+# Method to write the current app's buffered ratings now. Returns the number written.
+def flush_ratings() -> int:
+    buffer = get_rating_buffer()
+    return buffer.flush() if buffer is not None else 0
@@ -0,0 +1,108 @@
+# Test file for rating_buffer.py
+
+import sqlite3
+import time
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+import models
+import recipes.recipe_util as ru
+from app import db
+from recipes import rating_buffer
+from recipes.rating_buffer import RatingBuffer
+from testing_util import DatabaseTestCase
+
+
+class TestRatingBuffer(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.recipe = models.Recipe(user_id=1, recipe_name='Toast', cooking_method='Toast it', serves=1, calories=100)
+        db.session.add(self.recipe)
+        db.session.commit()
+        self.buffer = RatingBuffer(self.app, max_size=10, background=False)
+
+    def ratings(self) -> dict:
+        db.session.expire_all()
+        return {rating.user_id: rating.rating for rating in models.Rating.query.filter_by(recipe_id=self.recipe.id)}
+
+    def totals(self) -> tuple:
+        db.session.refresh(self.recipe)
+        return self.recipe.rating_sum, self.recipe.rating_count, self.recipe.rating
+
+    def test_last_rating_per_user_written(self) -> None:
+        ru.create_recipe_rating(user_id=1, recipe_id=self.recipe.id, rating=1)
+        self.buffer.add(1, self.recipe.id, 4)
+        self.buffer.add(2, self.recipe.id, 2)
+        self.buffer.add(2, self.recipe.id, 5)
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.ratings(), {1: 1})
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.ratings(), {1: 4, 2: 5})
+        self.assertEqual(self.totals(), (9, 2, 4.5))
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_flushed_when_full(self) -> None:
+        buffer = RatingBuffer(self.app, max_size=2, background=False)
+        buffer.add(1, self.recipe.id, 3)
+        self.assertEqual(self.ratings(), {})
+        buffer.add(2, self.recipe.id, 4)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(self.ratings(), {1: 3, 2: 4})
+
+    def test_busy_flush_keeps_newer_ratings(self) -> None:
+        self.buffer.add(1, self.recipe.id, 3)
+        busy = OperationalError('INSERT', {}, sqlite3.OperationalError('database is locked'))
+        with patch('recipes.rating_buffer._write_ratings', side_effect=busy):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(len(self.buffer), 1)
+        self.buffer.add(1, self.recipe.id, 5)
+        self.buffer.flush()
+        self.assertEqual(self.ratings(), {1: 5})
+
+    def test_failing_ratings_dropped(self) -> None:
+        write_ratings = rating_buffer._write_ratings
+
+        def write_unless_purged(batch) -> None:
+            if (2, self.recipe.id) in batch:
+                raise IntegrityError('INSERT', {}, sqlite3.IntegrityError('FOREIGN KEY constraint failed'))
+            write_ratings(batch)
+
+        self.buffer.add(1, self.recipe.id, 3)
+        self.buffer.add(2, self.recipe.id, 4)
+        self.buffer.add(3, self.recipe.id, 5)
+        with patch('recipes.rating_buffer._write_ratings', side_effect=write_unless_purged), \
+                self.assertLogs(self.app.logger, 'ERROR') as logs:
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.ratings(), {1: 3, 3: 5})
+        self.assertIn('Dropped buffered rating 4', logs.output[0])
+
+    def test_background_flush_and_stop(self) -> None:
+        buffer = RatingBuffer(self.app, interval=0.05, max_size=10)
+        buffer.add(1, self.recipe.id, 2)
+        for _ in range(100):
+            if len(buffer) == 0:
+                break
+            time.sleep(0.02)
+        self.assertEqual(self.ratings(), {1: 2})
+
+        buffer.add(1, self.recipe.id, 3)
+        buffer.stop()
+        self.assertEqual(self.ratings(), {1: 3})
+
+    def test_save_rating_uses_buffer(self) -> None:
+        self.app.extensions['rating_buffer'] = self.buffer
+        self.addCleanup(self.app.extensions.pop, 'rating_buffer')
+        ru.save_rating(1, self.recipe.id, 4)
+        self.assertEqual(self.ratings(), {})
+        self.buffer.flush()
+        self.assertEqual(self.totals(), (4, 1, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,18 @@
+from typing import NamedTuple
+
 from flask_login import current_user
+from sqlalchemy import select
 
-from app import db
+import search_index
+from app import db, cache
 from models import Recipe, Ingredient, Rating, create_and_get_qfid, \
-    create_or_get_food_item, ShoppingList, InUseRecipe, User
+    create_or_get_food_item, ShoppingList, InUseRecipe, User, QuantifiedFoodItem, FoodItem, recompute_rating_aggregates
 from shopping.shopping_util import create_shopping_item, create_shopping_list_util
+from nutrition_util import recipe_calories
+from recipes.rating_buffer import get_rating_buffer
+from sqlite_util import retry_on_busy
+
+LEADERBOARD_SIZE = 100
 
 
 def create_recipe(name, method, serving_size, calories, ingredients):
@@ -18,6 +27,11 @@ def create_recipe(name, method, serving_size, calories, ingredients):
     for ingredient in ingredients:
         add_ingredient(ingredient["food"], ingredient["quantity"], ingredient["unit"], new_recipe.id)
 
+    # Work out the calories from the ingredients if none were given
+    if calories in (None, ''):
+        new_recipe.calories = round(recipe_calories(recipe_id))
+        db.session.commit()
+
 
 def add_ingredient(ingredient, quantity, unit, recipe_id):
     food_id = create_or_get_food_item(ingredient).id
@@ -28,6 +42,103 @@ def add_ingredient(ingredient, quantity, unit, recipe_id):
     db.session.commit()
 
 
+class IngredientRow(NamedTuple):
+    """An ingredient as cached by recipe_ingredients(), with the getters of Ingredient."""
+    name: str
+    quantity: float
+    units: str
+
+    def get_name(self) -> str:
+        return self.name
+
+    def get_quantity(self) -> float:
+        return self.quantity
+
+    def get_units(self) -> str:
+        return self.units
+
+
+# Method to get the name, quantity and units of a recipe's ingredients, with one query. Cached until an ingredient
+# of the recipe is added, removed or changed (see cache.py and Ingredient.set_quantity).
+@cache.memoize(tags=lambda recipe_id: (f'recipes:{recipe_id}',))
+def recipe_ingredients(recipe_id: int) -> list:
+    rows = db.session.execute(
+        db.select(FoodItem.name, QuantifiedFoodItem.quantity, QuantifiedFoodItem.units)
+        .join(QuantifiedFoodItem, QuantifiedFoodItem.food_id == FoodItem.id)
+        .join(Ingredient, Ingredient.qfood_id == QuantifiedFoodItem.id)
+        .where(Ingredient.recipe_id == recipe_id)
+        .order_by(Ingredient.id))
+    return [IngredientRow(*row) for row in rows]
+
+
+def _recipe_list_tags(sort_by='name', min_calories=None, max_calories=None, min_rating=None, ingredient=None,
+                      serves=None, search=None):
+    # Ratings change recipes' ratings without the recipe rows being written by the ORM
+    if ingredient or search:
+        return 'recipes', 'ratings', 'ingredients', 'quantifiedfooditem', 'fooditems'
+    return 'recipes', 'ratings'
+
+
+# Method to find the recipes shown on the recipes page, filtered and sorted by 'name', 'calories', 'rating' or, with a
+# search, 'relevance'. ingredient matches the start of words in ingredient names, search also matches the recipes'
+# names and methods (see search_index.py). Returns a dict of the displayed columns for each recipe. Cached until any
+# recipe or rating changes (or, when searching, any ingredient or food item).
+@cache.memoize(tags=_recipe_list_tags)
+def find_recipes(sort_by='name', min_calories=None, max_calories=None, min_rating=None, ingredient=None,
+                 serves=None, search=None) -> list:
+    query = Recipe.query
+
+    # Filter calories
+    if min_calories is not None:
+        query = query.filter(Recipe.calories >= min_calories)
+    if max_calories is not None:
+        query = query.filter(Recipe.calories <= max_calories)
+
+    # Filter rating
+    if min_rating is not None:
+        query = query.filter(Recipe.rating >= min_rating)
+
+    # Filter ingredients
+    ingredient_matches = search_index.recipe_matches(ingredient, columns=('ingredients',))
+    if ingredient_matches is not None:
+        query = query.filter(Recipe.id.in_(select(ingredient_matches.c.recipe_id)))
+
+    # Search names, methods and ingredients
+    matches = search_index.recipe_matches(search)
+    if matches is not None:
+        query = query.join(matches, matches.c.recipe_id == Recipe.id)
+
+    # Filter servings
+    if serves:
+        query = query.filter(Recipe.serves == serves)
+
+    # Sorting
+    if sort_by == 'relevance' and matches is not None:
+        query = query.order_by(matches.c.rank, Recipe.id)
+    elif sort_by == 'calories':
+        query = query.order_by(Recipe.calories)
+    elif sort_by == 'rating':
+        # Read backwards from ix_recipes_leaderboard (or ix_recipes_serves_leaderboard), ties in reverse id order
+        query = query.order_by(Recipe.weighted_rating.desc(), Recipe.id.desc())
+    else:
+        query = query.order_by(Recipe.name)
+
+    rows = query.with_entities(Recipe.id, Recipe.name, Recipe.serves, Recipe.calories, Recipe.rating).all()
+    return [row._asdict() for row in rows]
+
+
+# Method to get the best rated recipes, ranked by their weighted rating. Recipes nobody has rated are left out.
+# Returns a dict for each recipe, cached until any recipe or rating changes.
+@cache.memoize(tags=('recipes', 'ratings'))
+def top_recipes(limit=LEADERBOARD_SIZE) -> list:
+    rows = db.session.execute(
+        db.select(Recipe.id, Recipe.name, Recipe.rating, Recipe.rating_count, Recipe.weighted_rating)
+        .where(Recipe.rating_count > 0)
+        .order_by(Recipe.weighted_rating.desc(), Recipe.id.desc())
+        .limit(limit))
+    return [row._asdict() for row in rows]
+
+
 def get_pantry_dict(user_pantry):
     """
     Utility function to create a dictionary of pantry items with their quantities from My Pantry.
@@ -47,7 +158,6 @@ def check_recipe_ingredients(ingredients, pantry_dict):
     can_make_recipe = True
     missing_ingredients = []
     for ingredient in ingredients:
-        qfi_ingredient = ingredient.qfooditem
         ingredient_name = ingredient.get_name()
         ingredient_quantity = ingredient.get_quantity()
 
@@ -57,47 +167,55 @@ def check_recipe_ingredients(ingredients, pantry_dict):
             missing_ingredients.append({
                 'name': ingredient_name,
                 'quantity': missing_quantity,
-                'units': qfi_ingredient.units
+                'units': ingredient.get_units()
             })
     return can_make_recipe, missing_ingredients
 
 
+# Method to work out a recipe's rating again from all of its ratings. Ratings keep it up to date as they change, so
+# this is only needed to repair it, e.g. after ratings were changed outside the ORM.
+@retry_on_busy
 def update_recipe_rating(recipe_id):
-    recipe: Recipe = Recipe.query.filter_by(id=recipe_id).first()
-    if recipe:
-        recipe.update_rating()
+    recompute_rating_aggregates([recipe_id])
+    db.session.commit()
 
 
 # Method to rate a recipe. Takes user, recipe and numeric value of rating as parameters.
 # Recipe's rating value is updated as well.
+@retry_on_busy
 def create_recipe_rating(user_id: int, recipe_id: int, rating: int) -> None:
-    rating = Rating(user_id=user_id, recipe_id=recipe_id, rating=rating)
-    db.session.add(rating)
-    db.session.flush()
-    recipe = Recipe.query.filter_by(id=recipe_id).first()
-    recipe.update_rating()
+    db.session.add(Rating(user_id=user_id, recipe_id=recipe_id, rating=rating))
+    db.session.commit()
 
 
-# Method to delete an instance of a recipe. First all Qfooditems related to the recipe's ingredients are removed.
-# All ingredients and ratings which are related to the given recipe are deleted automatically db cascading.
-# Takes recipe object to be deleted as parameter.
+# Method to delete a recipe. The recipe is only hidden (soft deleted), so this is a single cheap update and can be
+# undone with restore_recipe_instance(). The purger (purge_util.py) later removes it with its ingredients.
 def delete_recipe_instance(recipe: Recipe) -> None:
-    qfoods = [ingredient.qfooditem for ingredient in recipe.ingredients]
-    for qfood in qfoods:
-        db.session.delete(qfood)
-    db.session.delete(recipe)
-    db.session.commit()
+    recipe.soft_delete()
 
 
+# Method to undo delete_recipe_instance() for the recipe with the given id, if it has not been purged yet.
+# Only the recipe's owner can restore it. Returns the restored recipe or None.
+def restore_recipe_instance(recipe_id: int, user_id: int):
+    recipe = Recipe.query.execution_options(include_deleted=True).filter_by(id=recipe_id, user_id=user_id).first()
+    if recipe is None or not recipe.is_deleted():
+        return None
+    recipe.restore()
+    return recipe
+
+
+# Method to save a user's rating of a recipe. With the rating buffer (rating_buffer.py) the rating is only queued and
+# is written with the next batch.
 def save_rating(user_id, recipe_id, rating):
-    recipe: Recipe = Recipe.query.filter_by(id=recipe_id).first()
+    buffer = get_rating_buffer()
+    if buffer is not None:
+        buffer.add(user_id, recipe_id, rating)
+        return
     existing_rating = Rating.query.filter_by(user_id=user_id, recipe_id=recipe_id).first()
     if existing_rating:
         existing_rating.set_rating(rating)
-        recipe.update_rating()
     else:
         create_recipe_rating(user_id=user_id, recipe_id=recipe_id, rating=rating)
-    db.session.commit()
 
 
 def get_in_use_recipes(user_id):
@@ -116,6 +234,9 @@ def complete_and_rate_recipe(recipe_id, user_id, rating_value):
     in_use_recipe = InUseRecipe.query.filter_by(user_id=user_id, recipe_id=recipe_id).first()
     if not in_use_recipe:
         return {'error': 'In-use recipe not found'}
+    # The recipe may have been deleted by its owner since it was put in use
+    if not Recipe.query.get(recipe_id):
+        return {'error': 'Recipe not found'}
 
     # Delete the in-use recipe
     db.session.delete(in_use_recipe)
@@ -1,16 +1,24 @@
 import unittest
+
+from flask_login import login_user
+from sqlalchemy import event, select, text, update
+
 import models
-from app import create_app, db
-from populate_db import add_sample_users, add_food_items
+from admin.admin_util import delete_user_related_data
+from app import db
+from testing_util import DatabaseTestCase
 import recipes.recipe_util as ru
 
 
-class TestRecipeUtils(unittest.TestCase):
+class TestRecipeUtils(DatabaseTestCase):
 
+    # create_recipe() gives the recipe to the logged in user, so the tests run in a request made by user 1
     def setUp(self) -> None:
-        models.init_db()
-        add_sample_users()
-        add_food_items()
+        super().setUp()
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        login_user(db.session.get(models.User, 1))
 
     def test_create_recipe(self) -> None:
         # Define ingredients for the recipe
@@ -34,17 +42,25 @@ class TestRecipeUtils(unittest.TestCase):
 
     def test_check_recipe_ingredients(self) -> None:
         # Create a sample pantry with items
+        tomatoes = models.create_or_get_food_item("Tomatoes").id
+        onions = models.create_or_get_food_item("Onions").id
         user_pantry = [
-            models.PantryItem(user_id=1, qfood_id=1, expiry="2024-10-02", calories=50),
-            models.PantryItem(user_id=1, qfood_id=2, expiry="2024-10-02", calories=30)
+            models.PantryItem(user_id=1, qfood_id=models.create_and_get_qfid(tomatoes, 5, "g"), expiry="2024-10-02",
+                              calories=50),
+            models.PantryItem(user_id=1, qfood_id=models.create_and_get_qfid(onions, 2, "g"), expiry="2024-10-02",
+                              calories=30)
         ]
+        db.session.add_all(user_pantry)
+        db.session.flush()
         # Generate a pantry dictionary from the sample pantry
         pantry_dict = ru.get_pantry_dict(user_pantry)
         # Define ingredients for the recipe
         ingredients = [
-            models.Ingredient(recipe_id=1, qfood_id=1),
-            models.Ingredient(recipe_id=1, qfood_id=2)
+            models.Ingredient(recipe_id=1, qfood_id=models.create_and_get_qfid(tomatoes, 2, "g")),
+            models.Ingredient(recipe_id=1, qfood_id=models.create_and_get_qfid(onions, 1, "g"))
         ]
+        db.session.add_all(ingredients)
+        db.session.flush()
         # This checks if the ingredients are available in My Pantry
         can_make_recipe, missing_ingredients = ru.check_recipe_ingredients(ingredients, pantry_dict)
         self.assertTrue(can_make_recipe, msg="Check Recipe Ingredients Failed")
@@ -69,7 +85,109 @@ class TestRecipeUtils(unittest.TestCase):
         self.assertIsNone(deleted_recipe, msg="Delete Recipe Instance Failed")
 
 
+class TestRatingAggregates(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.recipe = models.Recipe(user_id=1, recipe_name='Toast', cooking_method='Toast it', serves=1, calories=100)
+        db.session.add(self.recipe)
+        db.session.commit()
+
+    def totals(self) -> tuple:
+        return self.recipe.rating_sum, self.recipe.rating_count, self.recipe.rating
+
+    def test_ratings_update_totals(self) -> None:
+        ru.save_rating(1, self.recipe.id, 4)
+        ru.save_rating(2, self.recipe.id, 1)
+        self.assertEqual(self.totals(), (5, 2, 2.5))
+
+        ru.save_rating(2, self.recipe.id, 5)
+        self.assertEqual(self.totals(), (9, 2, 4.5))
+
+        db.session.delete(models.Rating.query.filter_by(user_id=1, recipe_id=self.recipe.id).one())
+        db.session.commit()
+        self.assertEqual(self.totals(), (5, 1, 5))
+
+    def test_reading_rating_runs_no_sql(self) -> None:
+        ru.save_rating(1, self.recipe.id, 3)
+        self.assertEqual(self.recipe.get_rating(), 3)
+        statements = []
+
+        def record(connection, cursor, statement, *args) -> None:
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', record)
+        self.recipe.get_rating()
+        self.assertEqual(statements, [])
+
+    def test_recompute(self) -> None:
+        ru.save_rating(1, self.recipe.id, 2)
+        db.session.execute(update(models.Recipe).where(models.Recipe.id == self.recipe.id)
+                           .values(rating_sum=None, rating_count=None, rating=None))
+        ru.update_recipe_rating(self.recipe.id)
+        self.assertEqual(self.totals(), (2, 1, 2))
+
+    def test_deleted_users_ratings_removed_from_totals(self) -> None:
+        user = models.User(email='rater@email.com', password='Rater1!', first_name='Rae', last_name='Ter',
+                           dob='01/01/2000', role='user')
+        db.session.add(user)
+        db.session.commit()
+        ru.save_rating(1, self.recipe.id, 5)
+        ru.save_rating(user.id, self.recipe.id, 2)
+        delete_user_related_data(user.id)
+        self.assertEqual(self.totals(), (5, 1, 5))
+
+
+class TestLeaderboard(DatabaseTestCase):
+
+    def add_recipe(self, name, ratings, serves=1) -> models.Recipe:
+        recipe = models.Recipe(user_id=1, recipe_name=name, cooking_method='Mix', serves=serves, calories=100)
+        db.session.add(recipe)
+        db.session.commit()
+        for user_id, rating in enumerate(ratings, start=1):
+            ru.create_recipe_rating(user_id=user_id, recipe_id=recipe.id, rating=rating)
+        return recipe
+
+    def test_weighted_rating(self) -> None:
+        self.app.config.update(RATING_PRIOR_MEAN=3.0, RATING_PRIOR_WEIGHT=5)
+        recipe = self.add_recipe('Toast', [5, 4, 5])
+        self.assertEqual(recipe.weighted_rating, (14 + 15) / 8)
+        db.session.delete(models.Rating.query.filter_by(user_id=1, recipe_id=recipe.id).one())
+        db.session.commit()
+        self.assertEqual(recipe.weighted_rating, (9 + 15) / 7)
+        self.assertEqual(self.add_recipe('Porridge', []).weighted_rating, 3.0)
+
+    def test_single_vote_ranks_below_well_loved_recipe(self) -> None:
+        self.add_recipe('One Vote', [5])
+        self.add_recipe('Well Loved', [5, 4, 5, 4, 5, 5])
+        self.add_recipe('Disliked', [1, 0])
+        self.add_recipe('Unrated', [])
+        self.assertEqual([recipe['name'] for recipe in ru.top_recipes()], ['Well Loved', 'One Vote', 'Disliked'])
+        self.assertEqual([recipe['name'] for recipe in ru.find_recipes(sort_by='rating', serves=1)][:2],
+                         ['Well Loved', 'One Vote'])
+
+    def test_ranking_uses_index(self) -> None:
+        def plan(statement) -> str:
+            sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            return ' '.join(row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+
+        recipes = models.Recipe.__table__
+        ranked = select(recipes.c.id).where(recipes.c.deleted_at.is_(None)) \
+            .order_by(recipes.c.weighted_rating.desc(), recipes.c.id.desc()).limit(100)
+        self.assertIn('ix_recipes_leaderboard', plan(ranked))
+        self.assertNotIn('TEMP B-TREE', plan(ranked))
+        by_serves = ranked.where(recipes.c.serves == 2, recipes.c.calories <= 500)
+        self.assertIn('ix_recipes_serves_leaderboard', plan(by_serves))
+        self.assertNotIn('TEMP B-TREE', plan(by_serves))
+
+    def test_leaderboard_endpoint(self) -> None:
+        self.add_recipe('Toast', [4])
+        client = self.app.test_client()
+        client.post('/user/login', data={'email': 'admin@email.com', 'password': 'Admin1!'})
+        recipes = client.get('/recipes/leaderboard').get_json()['recipes']
+        self.assertEqual(recipes[0]['name'], 'Toast')
+        self.assertEqual(recipes[0]['rating_count'], 1)
+
+
 if __name__ == '__main__':
-    app = create_app()
-    with app.app_context():
-        unittest.main(exit=False)
+    unittest.main()
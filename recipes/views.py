@@ -6,8 +6,9 @@ from sqlalchemy import func
 
 from recipes.forms import RecipeForm
 from recipes.recipe_util import (create_recipe, create_or_get_food_item, create_and_get_qfid,
-                                 delete_recipe_instance, update_recipe_rating, create_shopping_list_from_recipe,
-                                 save_rating, complete_and_rate_recipe, get_pantry_dict, check_recipe_ingredients)
+                                 delete_recipe_instance, create_shopping_list_from_recipe,
+                                 save_rating, complete_and_rate_recipe, get_pantry_dict, check_recipe_ingredients,
+                                 restore_recipe_instance, find_recipes, recipe_ingredients, top_recipes)
 
 recipes_blueprint = Blueprint('recipes', __name__, template_folder='templates')
 
@@ -24,6 +25,7 @@ def recipes():
     min_rating = request.args.get('min_rating', type=int)
     ingredient_filter = request.args.get('ingredient')
     serves_filter = request.args.get('serves', type=int)
+    search = request.args.get('search')
 
     user_pantry = current_user.get_pantry()
     pantry_dict = {}
@@ -33,68 +35,34 @@ def recipes():
             pantry_dict[qfi.fooditem.name] = 0
         pantry_dict[qfi.fooditem.name] += qfi.quantity
 
-    query = Recipe.query
-
-    # Filter calories
-    if min_calories is not None:
-        query = query.filter(Recipe.calories >= min_calories)
-    if max_calories is not None:
-        query = query.filter(Recipe.calories <= max_calories)
-
-    # Filter rating
-    if min_rating is not None:
-        query = query.filter(Recipe.rating >= min_rating)
-
-    # Filter ingredients
-    if ingredient_filter:
-        query = query.join(Recipe.ingredients).join(Ingredient.qfooditem).join(FoodItem).filter(
-            FoodItem.name.ilike(f"%{ingredient_filter}%"))
-
-    # Filter servings
-    if serves_filter:
-        query = query.filter(Recipe.serves == serves_filter)
-
-    # Sorting
-    if sort_by == 'calories':
-        query = query.order_by(Recipe.calories)
-    elif sort_by == 'rating':
-        query = query.order_by(Recipe.rating.desc())
-    else:
-        query = query.order_by(Recipe.name)
-
-    # Execute the search
-    recipes = query.all()
+    # Execute the search (cached, see recipe_util.find_recipes)
+    recipes = find_recipes(sort_by=sort_by, min_calories=min_calories, max_calories=max_calories,
+                           min_rating=min_rating, ingredient=ingredient_filter, serves=serves_filter, search=search)
 
     # Consider which user can make the recipe
     if can_make_recipe_filter:
-        filtered_recipes = []
-        for recipe in recipes:
-            can_make_recipe = True
-            for ingredient in recipe.ingredients:
-                qfi_ingredient = QuantifiedFoodItem.query.get(ingredient.qfood_id)
-                ingredient_name = qfi_ingredient.fooditem.name
-                if ingredient_name not in pantry_dict:
-                    can_make_recipe = False
-                    print(f"Missing ingredient: {ingredient_name}")
-                    break
-                if pantry_dict[ingredient_name] < qfi_ingredient.quantity:
-                    can_make_recipe = False
-                    print(f"Not enough quantity for ingredient: {ingredient_name}")
-                    break
-            if can_make_recipe:
-                filtered_recipes.append(recipe)
-        recipes = filtered_recipes
+        recipes = [recipe for recipe in recipes
+                   if check_recipe_ingredients(recipe_ingredients(recipe['id']), pantry_dict)[0]]
 
     return render_template('recipes/recipes.html', recipes=recipes)
 
 
+# The 100 best rated recipes as JSON (cached, see recipe_util.top_recipes)
+@recipes_blueprint.route('/leaderboard', methods=['GET'])
+@login_required
+def leaderboard():
+    return jsonify({'recipes': top_recipes()})
+
+
 # View own recipes
 @recipes_blueprint.route('/your_recipes')
 @login_required
 def your_recipes():
     user_id = current_user.id
     recipes = Recipe.query.filter_by(user_id=user_id).all()
-    return render_template('recipes/your_recipes.html', recipes=recipes)
+    # Deleted recipes that can still be restored
+    deleted_recipes = Recipe.query_deleted().filter_by(user_id=user_id).order_by(Recipe.deleted_at.desc()).all()
+    return render_template('recipes/your_recipes.html', recipes=recipes, deleted_recipes=deleted_recipes)
 
 
 @recipes_blueprint.route('/recipes_detail/<int:recipe_id>')
@@ -107,8 +75,8 @@ def recipes_detail(recipe_id):
     # Retrieve the recipe by ID
     recipe = Recipe.query.get(recipe_id)
 
-    # Retrieve all ingredients for the recipe
-    ingredients = Ingredient.query.filter_by(recipe_id=recipe_id).all()
+    # Retrieve all ingredients for the recipe (cached)
+    ingredients = recipe_ingredients(recipe_id)
 
     # Retrieve the user's pantry items
     user_pantry = PantryItem.query.filter_by(user_id=current_user.id).all()
@@ -188,6 +156,17 @@ def delete_recipe(recipe_id):
     return redirect(url_for('recipes.recipes'))
 
 
+# Undo deleting own recipe
+@recipes_blueprint.route('/restore_recipe/<int:recipe_id>', methods=['POST'])
+@login_required
+def restore_recipe(recipe_id):
+    if restore_recipe_instance(recipe_id, current_user.id):
+        flash('Recipe restored successfully!', 'success')
+    else:
+        flash('Recipe could not be restored.', 'error')
+    return redirect(url_for('recipes.your_recipes'))
+
+
 @recipes_blueprint.route('/rate_recipe/<int:recipe_id>', methods=['POST'])
 @login_required
 def rate_recipe(recipe_id):
@@ -200,9 +179,6 @@ def rate_recipe(recipe_id):
     save_rating(current_user.id, recipe_id, int(rating_value))
     flash('Thank you for rating!', 'success')
 
-    # Update recipe rating using the utility function
-    update_recipe_rating(recipe_id)
-
     return redirect(url_for('recipes.recipes', recipe_id=recipe_id))
 
 
@@ -272,7 +248,8 @@ def use_recipe(recipe_id):
 @login_required
 def in_use_recipes():
     in_use_recipes = InUseRecipe.query.filter_by(user_id=current_user.id).all()
-    recipes = [in_use.recipe for in_use in in_use_recipes]
+    # A recipe deleted by its owner stays in other users' in-use lists but is hidden until it is restored
+    recipes = [in_use.recipe for in_use in in_use_recipes if in_use.recipe is not None]
     return render_template('recipes/in_use_recipes.html', recipes=recipes)
 
 
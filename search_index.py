@@ -0,0 +1,207 @@
+# Full-text search over recipes (name, method and the names of their ingredients) and food items, for the recipe
+# filters and the pantry search. On SQLite the text is kept in two FTS5 tables, recipes_fts and fooditems_fts, whose
+# rowids are the recipe and food item ids. Triggers on the recipes, ingredients, quantifiedfooditem and fooditems
+# tables keep them up to date, so rows written by bulk statements (the purger) are indexed too. Bulk loads
+# (benchmarks/generate_data.py) suspend the triggers and index everything in one pass at the end instead. The tables
+# are created with the schema (the metadata after_create listener in models.py) and filled from the existing rows
+# the first time, and dropped with it.
+#
+# Every word of a search is matched as a prefix ('tom sou' finds 'Tomato Soup') and results are ranked with bm25,
+# a match in a recipe's name counting for more than one in its ingredients or method. Where FTS5 isn't available (other
+# databases, SQLite built without it) or SEARCH_FTS_ENABLED is false, searches fall back to LIKE '%word%' and every
+# match ranks the same.
+
+import re
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, column, func, literal, literal_column, or_, select, table, text
+from sqlalchemy.exc import OperationalError
+
+RECIPE_COLUMNS = ('name', 'method', 'ingredients')
+RECIPE_WEIGHTS = (10.0, 1.0, 5.0)         # bm25 weight of a match in each of RECIPE_COLUMNS
+
+recipes_fts = table('recipes_fts', column('rowid'), *(column(name) for name in RECIPE_COLUMNS))
+fooditems_fts = table('fooditems_fts', column('rowid'), column('name'))
+
+# The names of a recipe's ingredients, space separated
+_INGREDIENT_NAMES = """(SELECT group_concat(fooditems.name, ' ') FROM ingredients
+    JOIN quantifiedfooditem ON quantifiedfooditem.id = ingredients.qfood_id
+    JOIN fooditems ON fooditems.id = quantifiedfooditem.food_id
+    WHERE ingredients.recipe_id = {recipe_id})"""
+
+
+def _reindex_ingredients(recipe_id) -> str:
+    return (f"UPDATE recipes_fts SET ingredients = {_INGREDIENT_NAMES.format(recipe_id=recipe_id)} "
+            f"WHERE rowid = {recipe_id};")
+
+
+def _reindex_recipes_using(food_id) -> str:
+    recipe_ids = ("SELECT ingredients.recipe_id FROM ingredients JOIN quantifiedfooditem "
+                  f"ON quantifiedfooditem.id = ingredients.qfood_id WHERE quantifiedfooditem.food_id = {food_id}")
+    return (f"UPDATE recipes_fts SET ingredients = {_INGREDIENT_NAMES.format(recipe_id='recipes_fts.rowid')} "
+            f"WHERE rowid IN ({recipe_ids});")
+
+
+_TABLES = {
+    'recipes_fts': f"""CREATE VIRTUAL TABLE recipes_fts USING fts5({', '.join(RECIPE_COLUMNS)},
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+    'fooditems_fts': """CREATE VIRTUAL TABLE fooditems_fts USING fts5(name,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+}
+
+_FILL = {
+    'recipes_fts': f"""INSERT INTO recipes_fts (rowid, name, method, ingredients)
+        SELECT id, name, method, {_INGREDIENT_NAMES.format(recipe_id='recipes.id')} FROM recipes""",
+    'fooditems_fts': "INSERT INTO fooditems_fts (rowid, name) SELECT id, name FROM fooditems",
+}
+
+_TRIGGERS = {
+    'recipes_fts_insert': f"""AFTER INSERT ON recipes BEGIN
+        INSERT INTO recipes_fts (rowid, name, method, ingredients)
+        VALUES (NEW.id, NEW.name, NEW.method, {_INGREDIENT_NAMES.format(recipe_id='NEW.id')});
+    END""",
+    'recipes_fts_update': """AFTER UPDATE OF name, method ON recipes BEGIN
+        UPDATE recipes_fts SET name = NEW.name, method = NEW.method WHERE rowid = NEW.id;
+    END""",
+    'recipes_fts_delete': """AFTER DELETE ON recipes BEGIN
+        DELETE FROM recipes_fts WHERE rowid = OLD.id;
+    END""",
+    'ingredients_fts_insert': f"""AFTER INSERT ON ingredients BEGIN
+        {_reindex_ingredients('NEW.recipe_id')}
+    END""",
+    'ingredients_fts_update': f"""AFTER UPDATE OF recipe_id, qfood_id ON ingredients BEGIN
+        {_reindex_ingredients('OLD.recipe_id')}
+        {_reindex_ingredients('NEW.recipe_id')}
+    END""",
+    'ingredients_fts_delete': f"""AFTER DELETE ON ingredients BEGIN
+        {_reindex_ingredients('OLD.recipe_id')}
+    END""",
+    'quantifiedfooditem_fts_update': f"""AFTER UPDATE OF food_id ON quantifiedfooditem BEGIN
+        UPDATE recipes_fts SET ingredients = {_INGREDIENT_NAMES.format(recipe_id='recipes_fts.rowid')}
+        WHERE rowid IN (SELECT recipe_id FROM ingredients WHERE qfood_id = NEW.id);
+    END""",
+    'fooditems_fts_insert': """AFTER INSERT ON fooditems BEGIN
+        INSERT INTO fooditems_fts (rowid, name) VALUES (NEW.id, NEW.name);
+    END""",
+    'fooditems_fts_update': f"""AFTER UPDATE OF name ON fooditems BEGIN
+        UPDATE fooditems_fts SET name = NEW.name WHERE rowid = NEW.id;
+        {_reindex_recipes_using('NEW.id')}
+    END""",
+    'fooditems_fts_delete': """AFTER DELETE ON fooditems BEGIN
+        DELETE FROM fooditems_fts WHERE rowid = OLD.id;
+    END""",
+}
+
+
+# Metadata event listener (after_create). Creates the FTS tables and triggers that don't exist yet and records
+# whether full-text search can be used. Tables created here are filled from the rows already in the database.
+def create(target, connection, **kw) -> None:
+    available = connection.dialect.name == 'sqlite' and _config('SEARCH_FTS_ENABLED', True)
+    if available:
+        existing = {row[0] for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+        try:
+            for name, statement in _TABLES.items():
+                if name not in existing:
+                    connection.exec_driver_sql(statement)
+                    connection.exec_driver_sql(_FILL[name])
+            for name, statement in _TRIGGERS.items():
+                if name not in existing:
+                    connection.exec_driver_sql(f'CREATE TRIGGER {name} {statement}')
+        except OperationalError as e:
+            if 'fts5' not in str(e):
+                raise
+            available = False           # SQLite built without FTS5
+    if has_app_context():
+        current_app.extensions['search_fts'] = available
+
+
+# Metadata event listener (before_drop). The triggers go with the tables they are on.
+def drop(target, connection, **kw) -> None:
+    if connection.dialect.name == 'sqlite':
+        for name in _TABLES:
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS {name}')
+
+
+# Method to empty the FTS tables and fill them again from the database, e.g. after rows were changed with the
+# triggers missing. Does nothing without FTS5.
+def rebuild(connection) -> None:
+    if not fts_enabled():
+        return
+    for name, statement in _FILL.items():
+        connection.exec_driver_sql(f'DELETE FROM {name}')
+        connection.exec_driver_sql(statement)
+
+
+# Method to drop the triggers before a bulk load, as they reindex a recipe's ingredients for every ingredient row
+# inserted. resume_triggers() must be called in the same transaction once the rows are written.
+def suspend_triggers(connection) -> None:
+    if not fts_enabled():
+        return
+    for name in _TRIGGERS:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+
+
+# Method to recreate the triggers dropped by suspend_triggers() and index the rows written meanwhile in one pass
+def resume_triggers(connection) -> None:
+    if not fts_enabled():
+        return
+    for name, statement in _TRIGGERS.items():
+        connection.exec_driver_sql(f'CREATE TRIGGER {name} {statement}')
+    rebuild(connection)
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def fts_enabled() -> bool:
+    return has_app_context() and current_app.extensions.get('search_fts', False)
+
+
+# Returns the words of a search, lower case
+def words(term) -> list:
+    return re.findall(r'\w+', (term or '').lower())
+
+
+# Method to build an FTS5 query matching every word as a prefix, in any of the given columns (all when None)
+def match_expression(term, columns=None) -> str:
+    scope = f"{{{' '.join(columns)}}} : " if columns else ''
+    return ' AND '.join(f'{scope}"{word}"*' for word in words(term))
+
+
+# Method to get a subquery of the recipes matching a search, with columns recipe_id and rank (lower is better).
+# columns limits the search to some of RECIPE_COLUMNS. Returns None if the search has no words.
+def recipe_matches(term, columns=None):
+    if not words(term):
+        return None
+    if fts_enabled():
+        rank = func.bm25(literal_column('recipes_fts'), *(literal(weight) for weight in RECIPE_WEIGHTS))
+        return (select(recipes_fts.c.rowid.label('recipe_id'), rank.label('rank'))
+                .where(text('recipes_fts MATCH :match').bindparams(match=match_expression(term, columns)))
+                .subquery('recipe_matches'))
+    from models import Recipe, Ingredient, QuantifiedFoodItem, FoodItem
+    columns = columns or RECIPE_COLUMNS
+    matches = []
+    for word in words(term):
+        pattern = f'%{word}%'
+        in_columns = [getattr(Recipe, name).ilike(pattern) for name in ('name', 'method') if name in columns]
+        if 'ingredients' in columns:
+            in_columns.append(Recipe.id.in_(
+                select(Ingredient.recipe_id).join(QuantifiedFoodItem, QuantifiedFoodItem.id == Ingredient.qfood_id)
+                .join(FoodItem, FoodItem.id == QuantifiedFoodItem.food_id).where(FoodItem.name.ilike(pattern))))
+        matches.append(or_(*in_columns))
+    return (select(Recipe.id.label('recipe_id'), literal(0.0).label('rank'))
+            .where(and_(*matches)).subquery('recipe_matches'))
+
+
+# Method to get a select of the ids of the food items whose names match a search. Returns None if the search has no
+# words.
+def food_ids_matching(term):
+    if not words(term):
+        return None
+    if fts_enabled():
+        return (select(fooditems_fts.c.rowid)
+                .where(text('fooditems_fts MATCH :match').bindparams(match=match_expression(term))))
+    from models import FoodItem
+    return select(FoodItem.id).where(*(FoodItem.name.ilike(f'%{word}%') for word in words(term)))
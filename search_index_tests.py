@@ -0,0 +1,83 @@
+# Test file for search_index.py
+
+import unittest
+
+import models
+import search_index
+from app import db
+from recipes.recipe_util import find_recipes
+from testing_util import DatabaseTestCase
+
+
+class TestSearchIndex(DatabaseTestCase):
+    fts = True
+
+    def setUp(self) -> None:
+        super().setUp()
+        enabled = self.app.extensions['search_fts']
+        self.assertTrue(enabled, msg='The test database should have FTS5')
+        self.app.extensions['search_fts'] = self.fts and enabled
+        self.addCleanup(self.app.extensions.__setitem__, 'search_fts', enabled)
+
+    def add_recipe(self, name, method='Mix', ingredients=()) -> models.Recipe:
+        recipe = models.Recipe(user_id=2, recipe_name=name, cooking_method=method, serves=1, calories=100)
+        db.session.add(recipe)
+        db.session.commit()
+        for food in ingredients:
+            qfood_id = models.create_and_get_qfid(models.create_or_get_food_item(food).id, 1, 'g')
+            db.session.add(models.Ingredient(recipe_id=recipe.id, qfood_id=qfood_id))
+        db.session.commit()
+        return recipe
+
+    def search(self, **filters) -> list:
+        return [recipe['name'] for recipe in find_recipes.uncached(**filters)]
+
+    def test_prefix_search_over_name_method_and_ingredients(self) -> None:
+        self.add_recipe('Tomato Soup', 'Simmer slowly', ['Basil'])
+        self.add_recipe('Cheese Toastie', 'Grill the bread', ['Cheddar'])
+        self.assertEqual(self.search(search='tom sou'), ['Tomato Soup'])
+        self.assertEqual(self.search(search='simmer'), ['Tomato Soup'])
+        self.assertEqual(self.search(search='chedd'), ['Cheese Toastie'])
+        self.assertEqual(self.search(search='basil cheddar'), [])
+        self.assertEqual(self.search(ingredient='bas'), ['Tomato Soup'])
+        self.assertEqual(self.search(ingredient='grill'), [])
+
+    def test_name_matches_rank_first(self) -> None:
+        self.add_recipe('Pancakes', 'Serve with berries')
+        self.add_recipe('Berry Crumble', 'Bake')
+        self.add_recipe('Porridge', 'Cook', ['Berries'])
+        self.assertEqual(self.search(search='berr', sort_by='relevance')[0], 'Berry Crumble')
+
+    def test_index_follows_changes(self) -> None:
+        recipe = self.add_recipe('Omelette', ingredients=['Eggs'])
+        recipe.name = 'Frittata'
+        db.session.add(models.Ingredient(recipe_id=recipe.id, qfood_id=models.create_and_get_qfid(
+            models.create_or_get_food_item('Spinach').id, 1, 'g')))
+        db.session.commit()
+        self.assertEqual(self.search(search='frittata spinach eggs'), ['Frittata'])
+        self.assertEqual(self.search(search='omelette'), [])
+
+        models.Ingredient.query.filter_by(recipe_id=recipe.id).delete()
+        db.session.commit()
+        self.assertEqual(self.search(ingredient='spinach'), [])
+
+        recipe.soft_delete()
+        self.assertEqual(self.search(search='frittata'), [])
+
+    def test_food_search(self) -> None:
+        food_id = models.create_or_get_food_item('Greek Yoghurt').id
+        matches = db.session.scalars(search_index.food_ids_matching('yog')).all()
+        self.assertIn(food_id, matches)
+        self.assertIsNone(search_index.food_ids_matching('  '))
+
+
+class TestSearchWithoutFts(TestSearchIndex):
+    fts = False
+
+    @unittest.skip('Every LIKE match ranks the same')
+    def test_name_matches_rank_first(self) -> None:
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
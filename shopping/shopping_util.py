@@ -7,6 +7,9 @@ from typing import List
 from app import db
 from datetime import datetime
 from crawler import fetch_food_storage_info
+from food_matcher import matcher_for
+from nutrition_util import match_nutrition, calories_by_qfood
+from sqlite_util import retry_on_busy
 from models import (ShoppingList, ShoppingItem, QuantifiedFoodItem, FoodItem, User,
                     Recipe, create_and_get_qfid, create_or_get_food_item, PantryItem)
 
@@ -45,23 +48,36 @@ def delete_shopping_item(shoppingitem_id: int) -> None:
 
 # Method to delete a shopping list instance and all shopping item instances associated with it
 def delete_shopping_list(s_list: ShoppingList) -> None:
-    # First delete qfooditems related with shopping item.
-    for item in s_list.get_items():
-        db.session.delete(item.qfooditem)
+    # Only hide the list (soft delete). The purger (purge_util.py) later deletes it, its shopping items and their
+    # qfooditems, until then the list can be restored with restore_shopping_list().
+    s_list.soft_delete()
 
-    # Shoppingitem instances are deleted by cascading relationship to shopping list.
-    db.session.delete(s_list)
-    db.session.commit()
+
+# Method to undo delete_shopping_list() for the user's list with the given id, if it has not been purged yet.
+# Returns the restored shopping list or None.
+def restore_shopping_list(list_id: int, user_id: int):
+    s_list = ShoppingList.query.execution_options(include_deleted=True).filter_by(id=list_id, user_id=user_id).first()
+    if s_list is None or not s_list.is_deleted():
+        return None
+    s_list.restore()
+    return s_list
 
 
 # Method to take all shopping items in a shopping list and transfer them to a user's pantry.
 # The shopping list with the given id is then deleted along with its corresponding shopping items.
 # NOTE: The quantified food item associated with each shopping item is not deleted but reused
 # to create the new corresponding pantry item. Only the ingredient objects are deleted.
+# The storage times are crawled before the write transaction starts, so a retried transaction doesn't crawl again.
 def mark_shopping_list_as_complete(s_list: ShoppingList) -> None:
+    _move_items_to_pantry(s_list, fetch_food_storage_info())
+
+
+@retry_on_busy
+def _move_items_to_pantry(s_list: ShoppingList, storage_info) -> None:
     user_id = s_list.user_id
     shopping_items = s_list.get_items()
-    storage_info = fetch_food_storage_info()
+    # Calories for every item, from one join against the nutrition table
+    calories = calories_by_qfood([shopping_item.qfood_id for shopping_item in shopping_items])
 
     # Loop through each shopping item, create new pantryitem, delete shopping item.
     for shopping_item in shopping_items:
@@ -69,14 +85,11 @@ def mark_shopping_list_as_complete(s_list: ShoppingList) -> None:
         if not qfood:
             continue
 
-        grams, calories = fetch_calories_from_file(qfood.fooditem.name)
-        total_calories = (qfood.quantity / grams) * calories if grams else 0
-
         new_pantry_item = PantryItem(
             user_id=user_id,
             qfood_id=shopping_item.qfood_id,
             expiry="",
-            calories=total_calories
+            calories=calories.get(qfood.id, 0)
         )
 
         expiry_duration = get_storage_duration(qfood.fooditem.name, storage_info)
@@ -121,7 +134,11 @@ def create_list_from_recipe_and_pantry(user_id: int, recipe_id: int) -> Shopping
 
 def get_storage_duration(food_name, storage_info):
     default_duration = timedelta(days=1)
-    storage_duration_str = storage_info.get(food_name, "not safe")
+    storage_duration_str = storage_info.get(food_name)
+    if storage_duration_str is None:
+        # FoodKeeper names rarely match ours exactly ("Apples" / "Apple"), so use the most similar one
+        match = matcher_for(storage_info).best(food_name)
+        storage_duration_str = storage_info[match.name] if match else "not safe"
 
     if "not safe" in storage_duration_str.lower():
         return default_duration
@@ -143,14 +160,11 @@ def get_storage_duration(food_name, storage_info):
     return duration
 
 
+# Method to look up a food's serving size (grams) and calories per serving in the nutrition table (loaded from
+# calories.txt by nutrition_util.py). Returns (None, 0) if the food is unknown.
 def fetch_calories_from_file(food_name):
-    with open('calories.txt', 'r') as f:
-        for line in f:
-            elements = line.strip().split(',')
-            if len(elements) != 3:
-                continue
-            name, grams, calories = elements
-            if name.lower() == food_name.lower():
-                return float(grams), float(calories)
-    return None, 0
+    nutrition = match_nutrition(food_name)
+    if nutrition is None:
+        return None, 0
+    return nutrition.serving_grams, nutrition.kcal
 
@@ -1,18 +1,17 @@
 # Test file for shopping_util.py
 
+import sqlite3
 import unittest
+from unittest.mock import patch
+
+from sqlalchemy.exc import OperationalError
+
 import models
-from app import create_app, db
-from populate_db import add_sample_users, add_food_items
+from testing_util import DatabaseTestCase
 import shopping.shopping_util as su
 
 
-class TestShoppingUtils(unittest.TestCase):
-
-    def setUp(self) -> None:
-        models.init_db()
-        add_sample_users()
-        add_food_items()
+class TestShoppingUtils(DatabaseTestCase):
 
     def test_create_shopping_list_util(self) -> None:
         new_list = su.create_shopping_list_util(user_id=3, list_name="Test List")
@@ -39,8 +38,16 @@ class TestShoppingUtils(unittest.TestCase):
         result = shopping_item or qfooditem         # Should evaluate to False
         self.assertFalse(result, msg="Delete Shopping Item Failed")
 
+    def test_complete_retry_does_not_crawl_again(self) -> None:
+        new_list = su.create_shopping_list_util(user_id=3, list_name="Test List 4")
+        su.create_shopping_item(list_id=new_list.id, food="Butter", quantity=10, units='g')
+        busy = OperationalError('INSERT', {}, sqlite3.OperationalError('database is locked'))
+        with patch('shopping.shopping_util.calories_by_qfood', side_effect=[busy, {}]), \
+                patch('shopping.shopping_util.fetch_food_storage_info', return_value={'Butter': '1 month'}) as crawl:
+            su.mark_shopping_list_as_complete(new_list)
+        crawl.assert_called_once()
+        self.assertEqual([item.get_name() for item in models.PantryItem.query.filter_by(user_id=3)], ["Butter"])
+
 
 if __name__ == '__main__':
-    app = create_app()
-    with app.app_context():
-        unittest.main(exit=False)
+    unittest.main()
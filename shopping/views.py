@@ -7,7 +7,7 @@ from flask_login import current_user, login_required
 from models import ShoppingList, ShoppingItem
 from shopping.forms import AddItemForm, CreateListForm
 from shopping.shopping_util import create_shopping_list_util, create_shopping_item, \
-    delete_shopping_item, delete_shopping_list, mark_shopping_list_as_complete
+    delete_shopping_item, delete_shopping_list, mark_shopping_list_as_complete, restore_shopping_list
 
 shopping_blueprint = Blueprint('shopping', __name__, template_folder='templates')
 
@@ -17,7 +17,11 @@ shopping_blueprint = Blueprint('shopping', __name__, template_folder='templates'
 @login_required
 def shopping_list():
     user_shopping_lists = ShoppingList.query.filter_by(user_id=current_user.id).all()
-    return render_template('shopping/shopping_list.html', shopping_lists=user_shopping_lists)
+    # Deleted lists that can still be restored
+    deleted_lists = ShoppingList.query_deleted().filter_by(user_id=current_user.id) \
+        .order_by(ShoppingList.deleted_at.desc()).all()
+    return render_template('shopping/shopping_list.html', shopping_lists=user_shopping_lists,
+                           deleted_lists=deleted_lists)
 
 
 # takes user input of a new list name, creates that list then redirects user to a page to add first items to the list
@@ -66,6 +70,17 @@ def delete_list(list_id):
     return redirect(url_for('shopping.shopping_list'))
 
 
+# View function to undo deleting a shopping list
+@shopping_blueprint.route('/restore_list/<int:list_id>', methods=['POST'])
+@login_required
+def restore_list(list_id):
+    if restore_shopping_list(list_id, current_user.id):
+        flash('Shopping list restored', 'success')
+    else:
+        flash('Shopping list could not be restored', 'error')
+    return redirect(url_for('shopping.shopping_list'))
+
+
 # View function for deleting a food item from a shopping list
 @shopping_blueprint.route('/delete_item/<int:item_id>', methods=['POST'])
 @login_required
@@ -0,0 +1,100 @@
+# SQLite tuning for the file databases the app runs on by default.
+# In the default rollback-journal mode every commit takes an exclusive lock on the whole file, blocking readers as
+# well as writers, so a few workers committing at once see "database is locked". install_pragmas() switches each
+# new connection to write-ahead logging (readers no longer block writers or the other way round), relaxes fsync to
+# once per checkpoint (synchronous=NORMAL, still safe against corruption in WAL mode), waits up to
+# SQLITE_BUSY_TIMEOUT ms for a lock and gives SQLite a larger page cache, memory-mapped reads and in-memory temp
+# tables. Every pragma is a SQLITE_* setting in config.py and SQLITE_PRAGMAS=false leaves SQLite's defaults.
+#
+# A writer can still get SQLITE_BUSY straight away, without waiting, when its transaction started by reading a
+# snapshot that another connection has since written past. @retry_on_busy reruns a write transaction from the start
+# when that happens (or the busy timeout runs out), with an exponential backoff.
+
+import functools
+import random
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import db
+
+DEFAULT_RETRIES = 3
+BACKOFF = 0.05      # seconds before the first retry, doubled for each one after it
+_BUSY_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+
+def _config(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+# Method to get the pragmas to run on every new connection, in order, from the app's SQLITE_* settings
+def pragmas(config) -> list:
+    if not config.get('SQLITE_PRAGMAS', True):
+        return []
+    return [(name, config[key]) for name, key in (('journal_mode', 'SQLITE_JOURNAL_MODE'),
+                                                   ('synchronous', 'SQLITE_SYNCHRONOUS'),
+                                                   ('busy_timeout', 'SQLITE_BUSY_TIMEOUT'),
+                                                   ('cache_size', 'SQLITE_CACHE_SIZE'),
+                                                   ('mmap_size', 'SQLITE_MMAP_SIZE'),
+                                                   ('temp_store', 'SQLITE_TEMP_STORE'))
+            if config.get(key) is not None]
+
+
+# Method to run the pragmas on every connection the engine opens. Does nothing for other databases.
+def install_pragmas(engine, config) -> None:
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas(config)]
+    if engine.dialect.name != 'sqlite' or not statements:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def is_busy(error) -> bool:
+    return isinstance(error, OperationalError) and any(message in str(error.orig) for message in _BUSY_MESSAGES)
+
+
+# Session event listeners. A retry starts the transaction again, which is only safe when the decorated function
+# began it: anything written earlier in the same transaction would be rolled back and not redone.
+@event.listens_for(Session, 'after_flush')
+def _mark_written(session, flush_context) -> None:
+    session.info['sqlite_util.written'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _clear_written(session) -> None:
+    session.info.pop('sqlite_util.written', None)
+
+
+def _owns_transaction(session) -> bool:
+    return not (session.new or session.dirty or session.deleted or session.info.get('sqlite_util.written'))
+
+
+# Decorator for functions that make one write transaction and commit it. When the database is busy, the session
+# is rolled back and the function called again, up to SQLITE_BUSY_RETRIES times. Functions called with other
+# changes already pending in the session aren't retried, they just raise.
+def retry_on_busy(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = _config('SQLITE_BUSY_RETRIES', DEFAULT_RETRIES) if _owns_transaction(db.session) else 0
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_busy(e) or attempt == retries:
+                    raise
+                db.session.rollback()
+                time.sleep(BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
@@ -0,0 +1,101 @@
+# Test file for sqlite_util.py
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flask import current_app
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import config
+import models
+from app import db
+from sqlite_util import install_pragmas, is_busy, pragmas, retry_on_busy
+from testing_util import DatabaseTestCase
+
+
+def busy_error() -> OperationalError:
+    return OperationalError('COMMIT', {}, Exception('database is locked'))
+
+
+class TestPragmas(unittest.TestCase):
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.engine = create_engine(f"sqlite:///{os.path.join(directory.name, 'test.db')}")
+        self.addCleanup(self.engine.dispose)
+
+    def pragma(self, name):
+        with self.engine.connect() as connection:
+            return connection.execute(text(f'PRAGMA {name}')).scalar()
+
+    def test_pragmas_set_on_connect(self):
+        install_pragmas(self.engine, config.load(config.ProductionConfig))
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)          # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -64000)
+        self.assertEqual(self.pragma('temp_store'), 2)           # MEMORY
+
+    def test_pragmas_disabled(self):
+        settings = config.load(config.ProductionConfig)
+        settings['SQLITE_PRAGMAS'] = False
+        self.assertEqual(pragmas(settings), [])
+        install_pragmas(self.engine, settings)
+        self.assertEqual(self.pragma('journal_mode'), 'delete')
+
+
+class TestRetryOnBusy(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.enterContext(patch('sqlite_util.time.sleep'))
+
+    def flaky(self, failures, error=busy_error):
+        calls = []
+
+        @retry_on_busy
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise error()
+            return 'done'
+        return write, calls
+
+    def test_is_busy(self):
+        self.assertTrue(is_busy(busy_error()))
+        self.assertFalse(is_busy(OperationalError('SELECT', {}, Exception('no such table: user'))))
+        self.assertFalse(is_busy(ValueError('database is locked')))
+
+    def test_retries_until_it_succeeds(self):
+        write, calls = self.flaky(2)
+        self.assertEqual(write(), 'done')
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up_after_the_retries(self):
+        current_app.config['SQLITE_BUSY_RETRIES'] = 1
+        write, calls = self.flaky(5)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 2)
+
+    def test_other_errors_not_retried(self):
+        write, calls = self.flaky(1, lambda: OperationalError('SELECT', {}, Exception('disk I/O error')))
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+    def test_not_retried_inside_a_larger_transaction(self):
+        db.session.add(models.ShoppingList(user_id=2, list_name='Weekly'))
+        db.session.flush()
+        write, calls = self.flaky(1)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
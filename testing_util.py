@@ -0,0 +1,125 @@
+# Shared fixtures for the test suite.
+# Every test process builds one app (config.TestingConfig) on a private in-memory SQLite database: the schema, the
+# nutrition table, the admin, the sample users and the sample food items are created once and committed.
+# DatabaseTestCase then runs each test inside a transaction on that database which is rolled back afterwards. Commits
+# made by the code under test only release a SAVEPOINT, so every test starts from the same data without rebuilding
+# anything.
+# Passwords are hashed with the lowest bcrypt cost, the Wikipedia and FoodKeeper crawlers are stubbed, the purger
+# and rate limits are switched off and no log file is written (LOG_PATH is unset), so the suite leaves app.log alone.
+# Test processes share nothing, so test modules can run in parallel.
+#
+# Usage:
+#   class TestPantryUtils(DatabaseTestCase):
+#       def test_something(self): ...
+#
+#   python -m pantry.pantry_util_tests     or     python -m pytest (pytest.ini collects the *_tests.py modules)
+
+import threading
+import unittest
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app import create_app, db
+from config import TestingConfig
+
+FOOD_DESCRIPTION = 'Test food item'
+STORAGE_INFO = {'Milk': '1 week', 'Bread': '5 days', 'Apples': '3 weeks', 'Rice': '6 months', 'Butter': '1 month'}
+
+_lock = threading.Lock()
+_app = None
+
+
+# Method to get the app shared by the tests of this process, building it and its base data on first use.
+def get_test_app():
+    global _app
+    with _lock:
+        if _app is None:
+            with stub_crawlers():
+                app = create_app(TestingConfig)
+                with app.app_context():
+                    event.listen(db.engine, 'begin', _begin)
+                    _add_base_data()
+            _app = app
+    return _app
+
+
+def _begin(connection) -> None:
+    connection.exec_driver_sql('BEGIN')
+
+
+def _add_base_data() -> None:
+    from models import User
+    from populate_db import add_sample_users, add_food_items
+
+    db.session.add(User(email='admin@email.com', password='Admin1!', first_name='Alice', last_name='Jones',
+                        dob='12/09/2001', role='admin'))
+    db.session.commit()
+    add_sample_users()
+    add_food_items()
+    db.session.remove()
+
+
+# Patches out every call the app makes to an external website.
+def stub_crawlers():
+    stack = ExitStack()
+    stack.enter_context(patch('models.fetch_wikipedia_description', return_value=FOOD_DESCRIPTION))
+    stack.enter_context(patch('populate_db.fetch_wikipedia_descriptions',
+                              side_effect=lambda names, **kwargs: dict.fromkeys(names, FOOD_DESCRIPTION)))
+    stack.enter_context(patch('shopping.shopping_util.fetch_food_storage_info', return_value=STORAGE_INFO))
+    return stack
+
+
+# Method to empty the per-process caches, which could otherwise hold rows from a rolled back test.
+def clear_caches() -> None:
+    import food_matcher
+    from app import cache
+    from users import user_cache
+
+    user_cache.clear()
+    food_matcher.invalidate()
+    cache.clear()
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs each test in an app context on the shared test database, inside a transaction that is rolled back
+    when the test ends. Subclasses that add their own setUp must call super().setUp() first."""
+
+    def setUp(self) -> None:
+        self.app = get_test_app()
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+
+        config = dict(self.app.config)
+        self.addCleanup(self._restore_config, config)
+
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        # Sessions join the outer transaction and turn their commits and rollbacks into SAVEPOINTs
+        session = db.session
+        db.session = scoped_session(sessionmaker(bind=self.connection, join_transaction_mode='create_savepoint'))
+        self.addCleanup(self._rollback, session)
+
+        self.enterContext(stub_crawlers())
+        clear_caches()
+        self.addCleanup(clear_caches)
+
+    def _rollback(self, session) -> None:
+        db.session.remove()
+        db.session = session
+        self.transaction.rollback()
+        self.connection.close()
+
+    def _restore_config(self, config) -> None:
+        self.app.config.clear()
+        self.app.config.update(config)
+
+    # Method to throw away everything the test has written so far, as if it had just started
+    def reset(self) -> None:
+        db.session.remove()
+        self.transaction.rollback()
+        self.transaction = self.connection.begin()
+        clear_caches()
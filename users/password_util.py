@@ -0,0 +1,98 @@
+# Password hashing service used by the User model.
+# bcrypt releases the GIL while hashing, so running it on a small pool of worker threads caps how many cores
+# hashing can occupy at once (BCRYPT_MAX_WORKERS) while request threads simply wait for their result. Once
+# BCRYPT_MAX_PENDING jobs are queued or running, new ones are refused with PasswordServiceBusy instead of piling
+# up, so a login storm is answered with quick 503s rather than starving every other endpoint of CPU.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import bcrypt
+from flask import current_app, has_app_context
+
+DEFAULT_LOG_ROUNDS = 12
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_PENDING = 32
+DEFAULT_TIMEOUT = 10  # seconds a request thread waits for its hashing job
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when the hashing pool is saturated or a job does not finish in time."""
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+def _config(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def _get_pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_config('BCRYPT_MAX_WORKERS', DEFAULT_MAX_WORKERS),
+                                           thread_name_prefix='bcrypt')
+            _slots = threading.BoundedSemaphore(_config('BCRYPT_MAX_PENDING', DEFAULT_MAX_PENDING))
+        return _executor, _slots
+
+
+# Worker threads do not survive fork(), so a pre-forking server's children each build their own pool.
+def _reset_pool() -> None:
+    global _executor, _slots, _lock
+    _lock = threading.Lock()
+    _executor = None
+    _slots = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+# Runs func on the hashing pool and waits for the result. With BCRYPT_MAX_WORKERS set to 0 it runs inline.
+def _run(func, *args):
+    if _config('BCRYPT_MAX_WORKERS', DEFAULT_MAX_WORKERS) <= 0:
+        return func(*args)
+
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise PasswordServiceBusy('Too many password hashing jobs queued')
+    try:
+        future = executor.submit(func, *args)
+    except RuntimeError:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=_config('BCRYPT_TIMEOUT', DEFAULT_TIMEOUT))
+    except TimeoutError:
+        raise PasswordServiceBusy('Password hashing timed out')
+
+
+def _as_bytes(value) -> bytes:
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+# Method to hash a password with the configured cost factor (BCRYPT_LOG_ROUNDS). Returns the bcrypt hash.
+def hash_password(password: str) -> bytes:
+    rounds = _config('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS)
+    return _run(lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)))
+
+
+# Method to check a password against a stored bcrypt hash.
+def check_password(password: str, hashed) -> bool:
+    return _run(bcrypt.checkpw, password.encode('utf-8'), _as_bytes(hashed))
+
+
+# Method to check whether a stored hash was made with a different cost factor than the one configured.
+def needs_rehash(hashed) -> bool:
+    try:
+        cost = int(_as_bytes(hashed).split(b'$')[2])
+    except (IndexError, ValueError):
+        return True
+    return cost != _config('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS)
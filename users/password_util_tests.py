@@ -0,0 +1,85 @@
+# Test file for password_util.py
+
+import threading
+import unittest
+from unittest.mock import patch
+
+import bcrypt
+from flask import current_app
+
+import models
+from app import db
+from testing_util import DatabaseTestCase
+from users import password_util as pw
+
+
+class TestPasswordUtil(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        pw._reset_pool()
+        self.addCleanup(pw._reset_pool)
+
+    def test_hash_and_check(self) -> None:
+        hashed = pw.hash_password("Secret1!")
+        self.assertTrue(pw.check_password("Secret1!", hashed))
+        self.assertFalse(pw.check_password("Wrong1!", hashed))
+
+    def test_hash_uses_configured_cost(self) -> None:
+        self.assertEqual(pw.hash_password("Secret1!").split(b'$')[2], b'04')
+
+    def test_needs_rehash(self) -> None:
+        hashed = pw.hash_password("Secret1!")
+        self.assertFalse(pw.needs_rehash(hashed))
+        current_app.config['BCRYPT_LOG_ROUNDS'] = 5
+        self.assertTrue(pw.needs_rehash(hashed))
+        self.assertTrue(pw.needs_rehash(hashed.decode('utf-8')))
+
+    def test_inline_when_no_workers(self) -> None:
+        current_app.config['BCRYPT_MAX_WORKERS'] = 0
+        hashed = pw.hash_password("Secret1!")
+        self.assertIsNone(pw._executor)
+        self.assertTrue(pw.check_password("Secret1!", hashed))
+
+    def test_busy_when_pool_saturated(self) -> None:
+        current_app.config['BCRYPT_MAX_WORKERS'] = 1
+        current_app.config['BCRYPT_MAX_PENDING'] = 1
+        release = threading.Event()
+        started = threading.Event()
+        real_hashpw = bcrypt.hashpw
+        app = current_app._get_current_object()
+
+        def slow_hashpw(password, salt):
+            started.set()
+            release.wait(5)
+            return real_hashpw(password, salt)
+
+        def hash_in_other_request():
+            with app.app_context():
+                pw.hash_password("Secret1!")
+
+        with patch('bcrypt.hashpw', side_effect=slow_hashpw):
+            worker = threading.Thread(target=hash_in_other_request)
+            worker.start()
+            started.wait(5)
+            with self.assertRaises(pw.PasswordServiceBusy):
+                pw.hash_password("Other1!")
+            release.set()
+            worker.join(5)
+
+    def test_login_rehashes_with_new_cost(self) -> None:
+        user = models.User(email='cost@email.com', password='Secret1!', first_name='Cost', last_name='Test',
+                           dob='01/01/2000')
+        db.session.add(user)
+        db.session.commit()
+
+        current_app.config['BCRYPT_LOG_ROUNDS'] = 5
+        user.update_security_fields_on_login(ip_addr='127.0.0.1', password='Secret1!')
+        self.assertEqual(pw._as_bytes(user.password).split(b'$')[2], b'05')
+        self.assertTrue(user.verify_password('Secret1!'))
+        self.assertEqual(user.total_logins, 1)
+        self.assertEqual(user.current_login_ip, '127.0.0.1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,267 @@
+# Server-side sessions, installed as app.session_interface by create_app().
+# Flask's default session is a signed cookie holding all of the session's data: every response that touches it
+# re-signs and re-sends it, and a stolen cookie stays valid until it expires. Here the cookie only holds a random
+# session id (43 characters) and the data is kept on the server, in the user_sessions table (SESSION_STORE=database)
+# or in Redis (SESSION_STORE=redis, at SESSION_REDIS_URL or CACHE_URL, memory:// for the stand-in in local_redis.py).
+# SESSION_STORE=cookie keeps Flask's signed cookie.
+#
+# A session is only written when its data changes, or to push its expiry back once less than half of
+# PERMANENT_SESSION_LIFETIME is left, so most requests cost one lookup by primary key and send no cookie.
+# logout_everywhere() deletes all of a user's sessions, which signs them out on their next request without the user
+# being checked on every request. Expired rows are removed by the purger thread (purge_util.py), Redis expires
+# its own keys.
+
+import secrets
+from datetime import datetime
+
+from flask import current_app, session as flask_session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+from app import db
+from local_redis import get_redis
+from sqlite_util import retry_on_busy
+
+SESSION_ID_BYTES = 32           # 43 characters once encoded
+STORES = ('database', 'redis', 'cookie')
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data loaded from a store. New sessions have no id until they are first saved."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(session) -> None:
+            session.modified = True
+            session.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.previous_sid = None
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    # Method to move the data to a new session id when it is saved, e.g. on login, so an id seen before the user
+    # signed in can't be used to act as them
+    def regenerate(self) -> None:
+        if self.sid is not None:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.new = True
+        self.modified = True
+
+
+class DatabaseStore:
+    """Sessions in the user_sessions table, read and written with the request's own database session."""
+
+    # Returns (serialized data, expiry time), or None if there is no such session or it has expired.
+    def load(self, sid):
+        from models import UserSession
+        row = db.session.execute(select(UserSession.data, UserSession.expires_at)
+                                 .where(UserSession.id == sid)).first()
+        if row is None or row.expires_at <= datetime.now():
+            return None
+        return row.data, row.expires_at
+
+    def create(self, sid, data, user_id, expires_at) -> None:
+        from models import UserSession
+        self._write(insert(UserSession).values(id=sid, data=data, user_id=user_id, expires_at=expires_at))
+
+    # Method to update a session. Without data only the expiry time changes. Returns False if the session no longer
+    # exists, it is never created again.
+    def update(self, sid, expires_at, data=None, user_id=None) -> bool:
+        from models import UserSession
+        values = {'expires_at': expires_at}
+        if data is not None:
+            values.update(data=data, user_id=user_id)
+        return self._write(update(UserSession).where(UserSession.id == sid).values(**values)) > 0
+
+    def delete(self, sid) -> None:
+        from models import UserSession
+        self._write(delete(UserSession).where(UserSession.id == sid))
+
+    # Returns the number of sessions deleted
+    def delete_user(self, user_id) -> int:
+        from models import UserSession
+        return self._write(delete(UserSession).where(UserSession.user_id == user_id))
+
+    def sweep(self) -> int:
+        from models import UserSession
+        return self._write(delete(UserSession).where(UserSession.expires_at <= datetime.now()))
+
+    # Writes happen once the view has finished (or after it committed, for logout_everywhere()). Anything left
+    # uncommitted would be rolled back at the end of the request, so it is rolled back now instead of being committed
+    # along with the session.
+    @retry_on_busy
+    def _write(self, statement) -> int:
+        db.session.rollback()
+        rowcount = db.session.execute(statement).rowcount
+        db.session.commit()
+        return rowcount
+
+
+class RedisStore:
+    """Sessions in Redis, each key expiring with its session. A set per user holds the ids of their sessions."""
+
+    def __init__(self, client, prefix='session:'):
+        self._client = client
+        self._prefix = prefix
+
+    def _user_key(self, user_id) -> str:
+        return f'{self._prefix}user:{user_id}'
+
+    # The value is the expiry time as a timestamp, the user id (empty if none) and the serialized data, separated by
+    # '|'. Returns (data, expiry time, user id) or None.
+    def _load(self, sid):
+        value = self._client.get(self._prefix + sid)
+        if value is None:
+            return None
+        expires_at, user_id, data = value.decode('utf-8').split('|', 2)
+        return data, datetime.fromtimestamp(float(expires_at)), int(user_id) if user_id else None
+
+    def load(self, sid):
+        loaded = self._load(sid)
+        return loaded[:2] if loaded is not None else None
+
+    def _set(self, sid, data, user_id, expires_at, only_existing=False) -> bool:
+        ttl = max(int((expires_at - datetime.now()).total_seconds()), 1)
+        value = f"{expires_at.timestamp()}|{'' if user_id is None else user_id}|{data}".encode('utf-8')
+        if not self._client.set(self._prefix + sid, value, ex=ttl, xx=only_existing):
+            return False
+        if user_id is not None:
+            self._client.sadd(self._user_key(user_id), sid)
+            self._client.expire(self._user_key(user_id), ttl)
+        return True
+
+    def create(self, sid, data, user_id, expires_at) -> None:
+        self._set(sid, data, user_id, expires_at)
+
+    def update(self, sid, expires_at, data=None, user_id=None) -> bool:
+        if data is None:
+            loaded = self._load(sid)
+            if loaded is None:
+                return False
+            data, _, user_id = loaded
+        return self._set(sid, data, user_id, expires_at, only_existing=True)
+
+    def delete(self, sid) -> None:
+        self._client.delete(self._prefix + sid)
+
+    def delete_user(self, user_id) -> int:
+        sids = [sid.decode('utf-8') for sid in self._client.smembers(self._user_key(user_id))]
+        deleted = self._client.delete(*(self._prefix + sid for sid in sids)) if sids else 0
+        self._client.delete(self._user_key(user_id))
+        return deleted
+
+    def sweep(self) -> int:
+        return 0
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and len(sid) <= 64:
+            loaded = self.store.load(sid)
+            if loaded is not None:
+                data, expires_at = loaded
+                return ServerSession(serializer.loads(data), sid, expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.previous_sid is not None:
+            self.store.delete(session.previous_sid)
+
+        # An emptied session is deleted along with its cookie
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime
+        expires_at = datetime.now() + lifetime
+        user_id = int(session['_user_id']) if '_user_id' in session else None     # Set by flask-login
+        if session.new:
+            session.sid = secrets.token_urlsafe(SESSION_ID_BYTES)
+            self.store.create(session.sid, serializer.dumps(dict(session)), user_id, expires_at)
+        elif session.modified:
+            if not self.store.update(session.sid, expires_at, serializer.dumps(dict(session)), user_id):
+                response.delete_cookie(name, domain=domain, path=path)      # Logged out everywhere meanwhile
+                return
+            if not session.permanent:
+                return              # The browser already has the cookie
+        elif session.expires_at - datetime.now() < lifetime / 2:
+            self.store.update(session.sid, expires_at)
+            if not session.permanent:
+                return
+        else:
+            return
+
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+
+# Method to set app.session_interface from the SESSION_STORE setting
+def install_session_interface(app) -> None:
+    store = app.config.get('SESSION_STORE', 'database')
+    if store not in STORES:
+        raise ValueError(f"Unknown SESSION_STORE: {store} (expected one of {', '.join(STORES)})")
+    if store == 'database':
+        app.session_interface = ServerSideSessionInterface(DatabaseStore())
+    elif store == 'redis':
+        url = app.config.get('SESSION_REDIS_URL') or app.config.get('CACHE_URL')
+        if not url:
+            raise ValueError('SESSION_STORE=redis needs SESSION_REDIS_URL or CACHE_URL')
+        app.session_interface = ServerSideSessionInterface(RedisStore(get_redis(url)))
+
+
+def _store():
+    return getattr(current_app.session_interface, 'store', None)
+
+
+# Method to sign a user out of every browser and device. Returns the number of sessions deleted. Changes not yet
+# committed are discarded. Signed cookie sessions (SESSION_STORE=cookie) can't be revoked, so nothing happens then.
+def logout_everywhere(user_id: int) -> int:
+    store = _store()
+    if store is None:
+        current_app.logger.warning('Logging out everywhere needs server-side sessions (SESSION_STORE)')
+        return 0
+    return store.delete_user(user_id)
+
+
+# Method to give the current session a new id, keeping its data. Does nothing for signed cookie sessions.
+def regenerate_session() -> None:
+    if isinstance(flask_session, ServerSession):
+        flask_session.regenerate()
+
+
+# Method to delete expired sessions from the database. Returns the number deleted.
+def sweep_expired_sessions() -> int:
+    store = _store()
+    return store.sweep() if store is not None else 0
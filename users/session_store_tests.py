@@ -0,0 +1,104 @@
+# Test file for session_store.py
+
+import unittest
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+import models
+from app import db
+from local_redis import get_redis
+from testing_util import DatabaseTestCase
+from users.session_store import DatabaseStore, RedisStore, ServerSideSessionInterface, sweep_expired_sessions
+
+ADMIN = {'email': 'admin@email.com', 'password': 'Admin1!'}
+
+
+class TestDatabaseSessions(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        interface = current_app.session_interface
+        current_app.session_interface = self.make_interface()
+        self.addCleanup(setattr, current_app, 'session_interface', interface)
+        self.store = current_app.session_interface.store
+
+    def make_interface(self):
+        return ServerSideSessionInterface(DatabaseStore())
+
+    def login(self):
+        client = current_app.test_client()
+        response = client.post('/user/login', data=ADMIN)
+        self.assertEqual(response.status_code, 302)
+        return client, client.get_cookie('session').value
+
+    def test_cookie_holds_only_the_id(self) -> None:
+        client, sid = self.login()
+        self.assertEqual(len(sid), 43)
+        data, expires_at = self.store.load(sid)
+        self.assertIn('"_user_id":"1"', data)
+        self.assertGreater(expires_at, datetime.now() + timedelta(days=30))
+
+    def test_unchanged_session_not_saved(self) -> None:
+        client, sid = self.login()
+        client.get('/user/my_account')          # Shows the login message, which changes the session
+        response = client.get('/user/my_account')
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Cookie')
+        self.assertIsNotNone(self.store.load(sid))
+
+    def test_expiry_pushed_back_after_half_the_lifetime(self) -> None:
+        client, sid = self.login()
+        client.get('/user/my_account')
+        soon = datetime.now() + timedelta(days=2)
+        self.store.update(sid, soon)
+        client.get('/user/my_account')
+        self.assertGreater(self.store.load(sid)[1], soon + timedelta(days=20))
+
+    def test_new_id_on_login(self) -> None:
+        client = current_app.test_client()
+        client.get('/main-menu')                # Redirected to the login page with a message
+        anonymous_sid = client.get_cookie('session').value
+        client.post('/user/login', data=ADMIN)
+        self.assertNotEqual(client.get_cookie('session').value, anonymous_sid)
+        self.assertIsNone(self.store.load(anonymous_sid))
+
+    def test_logout_everywhere(self) -> None:
+        first, first_sid = self.login()
+        second, second_sid = self.login()
+        self.assertEqual(second.get('/main-menu').status_code, 200)
+
+        response = first.post('/user/logout_everywhere')
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(self.store.load(first_sid))
+        self.assertIsNone(self.store.load(second_sid))
+        self.assertEqual(second.get('/main-menu').status_code, 302)
+
+    def test_logout(self) -> None:
+        client, sid = self.login()
+        client.get('/user/logout')
+        self.assertNotIn('_user_id', self.store.load(sid)[0])
+        self.assertEqual(client.get('/main-menu').status_code, 302)
+
+
+class TestRedisSessions(TestDatabaseSessions):
+
+    def make_interface(self):
+        client = get_redis('memory://sessions-tests')
+        client.flushdb()
+        return ServerSideSessionInterface(RedisStore(client))
+
+
+class TestSweepExpiredSessions(DatabaseTestCase):
+
+    def test_sweep(self) -> None:
+        now = datetime.now()
+        db.session.add_all([models.UserSession(id='old', user_id=2, data='{}', expires_at=now - timedelta(hours=1)),
+                            models.UserSession(id='new', user_id=2, data='{}', expires_at=now + timedelta(hours=1))])
+        db.session.commit()
+        self.assertEqual(sweep_expired_sessions(), 1)
+        self.assertEqual([row.id for row in models.UserSession.query.all()], ['new'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# Short-lived per-process cache of authenticated users for login_manager.user_loader (app.py).
+# A snapshot of the user's columns is kept for USER_CACHE_TTL seconds. On a cache hit the User is rebuilt and
+# attached to the request's session without a SELECT, so relationships such as current_user.pantry still lazy
+# load as normal. Entries are dropped whenever a change to the user is committed in this process; other worker
+# processes see the change once their entry expires.
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached, object_session
+
+from app import db
+
+DEFAULT_TTL = 30  # seconds
+
+_lock = threading.Lock()
+_snapshots = {}     # user_id -> (expires_at, {column: value})
+_generations = {}   # user_id -> number of invalidations, guards against caching a row read before a commit
+
+
+# Method to get a user by id, using the cached snapshot when it is still fresh.
+# Returns a User attached to the current session, or None if no such user exists.
+def get_user(user_id: int):
+    from models import User
+
+    ttl = current_app.config.get('USER_CACHE_TTL', DEFAULT_TTL)
+    with _lock:
+        entry = _snapshots.get(user_id)
+        generation = _generations.get(user_id, 0)
+    if entry and entry[0] > time.monotonic():
+        return _restore(User, entry[1])
+
+    user = db.session.get(User, user_id)
+    if user is not None and ttl > 0:
+        values = {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs}
+        with _lock:
+            if _generations.get(user_id, 0) == generation:
+                _snapshots[user_id] = (time.monotonic() + ttl, values)
+    return user
+
+
+# Method to drop the cached snapshot of a user.
+def invalidate_user(user_id: int) -> None:
+    with _lock:
+        _snapshots.pop(user_id, None)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+
+
+def clear() -> None:
+    with _lock:
+        _snapshots.clear()
+        _generations.clear()
+
+
+# Rebuilds a persistent User from a snapshot without emitting SQL.
+def _restore(model, values):
+    user = model.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        setattr(user, key, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+# Mapper event listener (after_update / after_delete on User). Records the user so the cache entry is dropped
+# once the surrounding transaction commits.
+def mark_changed(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+    else:
+        invalidate_user(target.id)
+
+
+# Session event listener (after_commit).
+def invalidate_committed(session) -> None:
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_user(user_id)
+
+
+# Session event listener (after_rollback).
+def discard_uncommitted(session) -> None:
+    session.info.pop('changed_user_ids', None)
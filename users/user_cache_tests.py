@@ -0,0 +1,68 @@
+# Test file for user_cache.py
+
+import unittest
+import models
+from app import db
+from testing_util import DatabaseTestCase
+from users import user_cache
+
+
+class TestUserCache(DatabaseTestCase):
+
+    def _count_statements(self, func):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        db.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = func()
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, statements
+
+    def test_cached_user_loaded_without_query(self) -> None:
+        user_cache.get_user(2)
+        db.session.remove()         # Simulate the next request
+        user, statements = self._count_statements(lambda: user_cache.get_user(2))
+        self.assertEqual(user.email, "gathelstan0@npr.org")
+        self.assertEqual(statements, [], msg="Cached user should not query the database")
+
+    def test_cached_user_relationships_load(self) -> None:
+        user_cache.get_user(2)
+        db.session.remove()
+        user = user_cache.get_user(2)
+        self.assertEqual(user.get_pantry(), [])
+        self.assertIs(user, db.session.get(models.User, 2))
+
+    def test_role_change_invalidates_cache(self) -> None:
+        user = user_cache.get_user(2)
+        user.role = 'admin'
+        db.session.commit()
+        db.session.remove()
+        user, statements = self._count_statements(lambda: user_cache.get_user(2))
+        self.assertEqual(user.role, 'admin')
+        self.assertNotEqual(statements, [], msg="Committed change should drop the cached user")
+
+    def test_set_password_invalidates_cache(self) -> None:
+        user = user_cache.get_user(2)
+        user.set_password("Newpass1!")
+        db.session.remove()
+        user = user_cache.get_user(2)
+        self.assertTrue(user.verify_password("Newpass1!"))
+
+    def test_rollback_keeps_cache(self) -> None:
+        user = user_cache.get_user(2)
+        user.role = 'admin'
+        db.session.flush()
+        db.session.rollback()
+        db.session.remove()
+        self.assertEqual(user_cache.get_user(2).role, 'user')
+
+    def test_missing_user(self) -> None:
+        self.assertIsNone(user_cache.get_user(999))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,26 +1,33 @@
-from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from users.forms import RegisterForm, LoginForm, ChangePasswordForm
+from users.password_util import PasswordServiceBusy
+from users.session_store import logout_everywhere, regenerate_session
 from flask_login import login_user, logout_user, login_required, current_user
-from app import db
+from app import db, limiter
 from models import User
 
 users_blueprint = Blueprint('users', __name__, template_folder='templates')
 
+# Limit password hashing per client (see rate_limit.py). Only form submissions count towards the limit.
+limiter.limit_blueprint(users_blueprint, 'RATELIMIT_LOGIN', endpoints={'users.login'}, methods={'POST'})
+limiter.limit_blueprint(users_blueprint, 'RATELIMIT_REGISTER', endpoints={'users.register'}, methods={'POST'})
+
+
+# Password hashing pool is saturated (see users/password_util.py). Ask the client to retry shortly.
+@users_blueprint.errorhandler(PasswordServiceBusy)
+def password_service_busy(error):
+    return 'Service Unavailable - the server is busy, please try again shortly.', 503, {'Retry-After': '5'}
 
 
 @users_blueprint.route('/register', methods=['GET', 'POST'])
 def register():
-    from app import create_app
-
-    app = create_app()
     # Create signup form object
     form1 = RegisterForm()
 
     # If request method is POST or form is valid
     if form1.validate_on_submit():
-        with app.app_context():
-            u1 = User.query.filter_by(email=form1.email.data).first()
+        # Deleted users still hold their email address until they are purged
+        u1 = User.query.execution_options(include_deleted=True).filter_by(email=form1.email.data).first()
         # If this returns a user, then the email already exists in database
 
         # If email already exists redirect user back to signup page with error message so user can try again
@@ -41,7 +48,7 @@ def register():
         db.session.add(new_user)
         db.session.commit()
 
-        app.logger.info(f"User registered: {form1.email.data}, IP: {request.remote_addr}")
+        current_app.logger.info(f"User registered: {form1.email.data}, IP: {request.remote_addr}")
         # Sends user to login page
         return redirect(url_for('users.login'))
     # If request method is GET or form not valid re-render signup page
@@ -50,9 +57,6 @@ def register():
 
 @users_blueprint.route('/login', methods=['GET', 'POST'])
 def login():
-    from app import create_app
-    app = create_app()
-
     # Create login form object
     form = LoginForm(request.form)
 
@@ -63,21 +67,13 @@ def login():
         # Verify the user's password
         if user and user.verify_password(form.password.data):
             login_user(user)
+            # A session id seen before signing in can't be reused to act as the user
+            regenerate_session()
 
-            # Update user login details
-            user.last_login = user.current_login
-            user.current_login = datetime.utcnow()
-            user.last_login_ip = user.current_login_ip or request.remote_addr
-            user.current_login_ip = request.remote_addr
-            user.total_logins += 1
-            user.update_security_fields_on_login(ip_addr=request.remote_addr)  # Update security login fields.
-            db.session.commit()
-
-            # Set session variables
-            session['logged_in'] = True
-            session['user_id'] = user.id
+            # Update security login fields (and upgrade the password hash if the cost factor changed)
+            user.update_security_fields_on_login(ip_addr=request.remote_addr, password=form.password.data)
 
-            app.logger.info(
+            current_app.logger.info(
                 f"User logged in: {form.email.data}, IP: {request.remote_addr}")
             flash('You have been logged in.', 'success')
 
@@ -111,9 +107,11 @@ def update_password():
         if user.verify_password(form.current_password.data):
             if form.new_password.data != form.current_password.data:
 
-                # Set the new password
+                # Set the new password and sign out every other session
                 user.set_password(form.new_password.data)
                 db.session.commit()
+                logout_everywhere(user.id)
+                regenerate_session()
                 flash('Your password has been updated.', 'success')
                 return redirect(url_for('users.login'))
             else:
@@ -126,14 +124,25 @@ def update_password():
 @users_blueprint.route('/logout')
 @login_required
 def logout():
-    from app import create_app
-    app = create_app()
-
     # Log out the user and update the session
     user_info = f"User logged out: {current_user.email}, IP: {request.remote_addr}"
+    user_id = current_user.id
     logout_user()
-    session['logged_in'] = False
-    app.logger.info(user_info)
+    current_app.logger.info(user_info, extra={'user_id': user_id})
 
     # Redirect to the home page
     return redirect(url_for('home'))
+
+
+@users_blueprint.route('/logout_everywhere', methods=['POST'])
+@login_required
+def logout_all_sessions():
+    # Sign the user out of every browser and device, including this one
+    user_id = current_user.id
+    count = logout_everywhere(user_id)
+    logout_user()
+    regenerate_session()        # The old session is gone, the message below needs a new one
+    current_app.logger.info(f"User logged out everywhere: {count} sessions, IP: {request.remote_addr}",
+                            extra={'user_id': user_id})
+    flash('You have been logged out on every device.', 'success')
+    return redirect(url_for('users.login'))
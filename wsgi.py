@@ -0,0 +1,26 @@
+# WSGI entry point for production servers. `python app.py` and `flask run` start Werkzeug's development server,
+# which handles every request in the one process and so never uses more than one CPU core. Run gunicorn instead:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# gunicorn.conf.py imports this module once in the master process (preload_app), then forks the workers, which
+# call reset_after_fork() before serving their first request.
+
+import os
+
+from dotenv import load_dotenv
+
+from app import create_app, db
+from logging_util import install_logging
+
+# Runs with the production profile (config.py) unless APP_CONFIG says otherwise
+load_dotenv()
+app = create_app(os.getenv('APP_CONFIG', 'production'))
+
+
+# Method to make a forked worker safe to serve requests. The pooled database connections were opened by the
+# parent, and two processes using the same socket or SQLite file handle corrupt each other's transactions, so the
+# child drops them without closing them (the parent still owns them). Threads don't survive fork(), so the log
+# listener is started again. The bcrypt pool (users/password_util.py) resets itself.
+def reset_after_fork(flask_app=app) -> None:
+    with flask_app.app_context():
+        db.engine.dispose(close=False)
+    install_logging(flask_app)